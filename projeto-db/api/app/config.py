@@ -0,0 +1,84 @@
+"""Process-level settings read from the environment.
+
+Pool sizes are per worker process. When only a total connection budget is given
+(e.g. POSTGRES_CONNECTIONS_BUDGET), it is split evenly across WEB_CONCURRENCY workers.
+Timeouts bound how long one call may hold a request; batch (low priority) work gets its
+own, usually unlimited (0), statement/query deadline.
+"""
+import os
+
+
+def _int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _per_worker(name, budget_name, default):
+    if os.getenv(name):
+        return int(os.getenv(name))
+    if os.getenv(budget_name):
+        return max(1, int(os.getenv(budget_name)) // WORKERS)
+    return default
+
+
+def _replicas(name):
+    # "host[:port[:weight]],..." -> [{"name", "host", "port", "weight"}]
+    replicas = []
+    for item in filter(None, (part.strip() for part in os.getenv(name, "").split(","))):
+        host, port, weight = (item.split(":") + [None, None])[:3]
+        port = int(port or 5432)
+        replicas.append({"name": f"{host}:{port}", "host": host, "port": port, "weight": float(weight or 1)})
+    return replicas
+
+
+WORKERS = _int("WEB_CONCURRENCY", os.cpu_count() or 1)
+
+# Postgres
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+POSTGRES_USER = os.getenv("POSTGRES_USER")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres")
+POSTGRES_PORT = _int("POSTGRES_PORT", 5432)
+POSTGRES_POOL_MIN = _int("POSTGRES_POOL_MIN", 1)
+POSTGRES_POOL_MAX = _per_worker("POSTGRES_POOL_MAX", "POSTGRES_CONNECTIONS_BUDGET", 10)
+POSTGRES_CONNECT_TIMEOUT = _int("POSTGRES_CONNECT_TIMEOUT", 3)  # seconds
+POSTGRES_STATEMENT_TIMEOUT_MS = _int("POSTGRES_STATEMENT_TIMEOUT_MS", 2000)
+POSTGRES_BATCH_STATEMENT_TIMEOUT_MS = _int("POSTGRES_BATCH_STATEMENT_TIMEOUT_MS", 0)
+# read replicas (streaming standbys); reads are spread over them by weight
+POSTGRES_REPLICAS = _replicas("POSTGRES_REPLICAS")
+POSTGRES_REPLICA_POOL_MAX = _per_worker("POSTGRES_REPLICA_POOL_MAX", "POSTGRES_REPLICA_CONNECTIONS_BUDGET", 10)
+POSTGRES_REPLICA_MAX_LAG = _float("POSTGRES_REPLICA_MAX_LAG_SECONDS", 5)  # lagging replicas get no reads
+POSTGRES_REPLICA_CHECK_INTERVAL = _float("POSTGRES_REPLICA_CHECK_INTERVAL", 5)  # seconds
+
+# Mongo
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017")
+MONGO_DB = os.getenv("MONGO_DB", "shop")
+MONGO_MAX_POOL = _per_worker("MONGO_MAX_POOL", "MONGO_CONNECTIONS_BUDGET", 20)
+MONGO_CONNECT_TIMEOUT_MS = _int("MONGO_CONNECT_TIMEOUT_MS", 2000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 2000)
+MONGO_SOCKET_TIMEOUT_MS = _int("MONGO_SOCKET_TIMEOUT_MS", 2000)  # per round trip, so cursors still stream
+
+# Neo4j
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "123456")  # troque
+NEO4J_MAX_POOL = _per_worker("NEO4J_MAX_POOL", "NEO4J_CONNECTIONS_BUDGET", 20)
+NEO4J_CONNECT_TIMEOUT = _float("NEO4J_CONNECT_TIMEOUT", 3)  # seconds
+NEO4J_QUERY_TIMEOUT = _float("NEO4J_QUERY_TIMEOUT", 2)
+NEO4J_BATCH_QUERY_TIMEOUT = _float("NEO4J_BATCH_QUERY_TIMEOUT", 0)
+
+# Redis
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = _int("REDIS_PORT", 6379)
+# "host:port,host:port,...": more than one node shards the cache client-side (consistent hashing)
+REDIS_NODES = [
+    (host, int(port or 6379))
+    for host, _, port in (n.strip().partition(":") for n in os.getenv("REDIS_NODES", "").split(",") if n.strip())
+] or [(REDIS_HOST, REDIS_PORT)]
+REDIS_VNODES = _int("REDIS_VNODES", 160)  # ring points per node
+REDIS_MAX_CONNECTIONS = _per_worker("REDIS_MAX_CONNECTIONS", "REDIS_CONNECTIONS_BUDGET", 64)  # per node
+REDIS_CONNECT_TIMEOUT = _float("REDIS_CONNECT_TIMEOUT", 1)  # seconds
+REDIS_SOCKET_TIMEOUT = _float("REDIS_SOCKET_TIMEOUT", 1)
@@ -1,15 +1,159 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring, ReturnDocument
+from pymongo.cursor import Cursor
+from pymongo.command_cursor import CommandCursor
 import os
+import threading
 
-# Conexão e coleções exportadas para compatibilidade com serviços
-client = MongoClient(os.getenv("MONGO_URI", "mongodb://mongo:27017"))
-_db = client[os.getenv("MONGO_DB", "shop")]
+from .. import config
+from ..services.metrics import observe_call
+from ..services.bulkhead import guard
+
+
+class _CommandMetrics(monitoring.CommandListener):
+    # listeners run on the calling thread, so the operation label of the caller applies
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        cmd = event.command
+        target = cmd.get(event.command_name)
+        statement = f"{event.command_name} {target}" if isinstance(target, str) else event.command_name
+        params = cmd.get("filter", cmd.get("q", cmd.get("updates", cmd.get("pipeline"))))
+        self._pending[event.request_id] = (statement, params)
+
+    def succeeded(self, event):
+        statement, params = self._pending.pop(event.request_id, (event.command_name, None))
+        reply = event.reply or {}
+        batch = reply.get("cursor", {}).get("firstBatch", reply.get("cursor", {}).get("nextBatch"))
+        rows = len(batch) if batch is not None else reply.get("n")
+        observe_call("mongo", event.duration_micros / 1e6, statement=statement, params=params, rows=rows)
+
+    def failed(self, event):
+        statement, params = self._pending.pop(event.request_id, (event.command_name, None))
+        observe_call("mongo", event.duration_micros / 1e6, failed=True, statement=statement, params=params)
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Per-process MongoClient, created lazily (MongoClient is not fork-safe)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(
+                    config.MONGO_URI,
+                    maxPoolSize=config.MONGO_MAX_POOL,
+                    connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+                    event_listeners=[_CommandMetrics()],
+                )
+                _client_pid = os.getpid()
+    return _client
 
-profiles = _db["profiles"]
-clientes = _db["clientes"]
 
 def get_mongo_conn():
-    return _db
+    return get_client()[config.MONGO_DB]
+
+
+def close():
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+
+def reset_after_fork():
+    global _client
+    _client = None
+
+
+class GuardedCollection:
+    """Runs every collection call under the mongo bulkhead.
+
+    Cursors are drained inside the guard (queries only hit the server while iterating),
+    so `find`/`aggregate` return lists here; use `.raw` for a lazily streamed cursor.
+    The collection is resolved on each access, so it always uses this process's client.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def raw(self):
+        return get_mongo_conn()[self.name]
+
+    def __getattr__(self, name):
+        attr = getattr(self.raw, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with guard("mongo"):
+                result = attr(*args, **kwargs)
+                if isinstance(result, (Cursor, CommandCursor)):
+                    result = list(result)
+                return result
+        return call
+
+
+# Coleções exportadas para compatibilidade com serviços
+profiles = GuardedCollection("profiles")
+clientes = GuardedCollection("clientes")
 
 def fetch_mongo_data():
     return list(clientes.find({}))
+
+# only the fields the API serves; keeps _id (ObjectId) and any extra document fields off the wire
+PROFILE_PROJECTION = {"_id": 0, "idCliente": 1, "idade": 1, "interesses": 1}
+
+
+def ensure_indexes():
+    existing = profiles.index_information()
+    if "idCliente_1" in existing and not existing["idCliente_1"].get("unique"):
+        # older deployments created a non-unique index with the same name
+        profiles.drop_index("idCliente_1")
+    profiles.create_index("idCliente", name="idCliente_1", unique=True)
+    # multikey: one index entry per interest; idCliente lets searches page in index order
+    profiles.create_index([("interesses", 1), ("idCliente", 1)], name="interesses_1_idCliente_1")
+    clientes.create_index("idCliente", name="idCliente_1")
+
+
+def find_profile(cid, projection=PROFILE_PROJECTION):
+    return profiles.find_one({"idCliente": str(cid)}, projection)
+
+
+def update_profile(cid, fields):
+    return profiles.find_one_and_update(
+        {"idCliente": str(cid)}, {"$set": fields}, projection=PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def iter_profiles(projection=PROFILE_PROJECTION):
+    return profiles.find({}, projection)
+
+
+def search_profiles(interesse=None, idade_min=None, after=None, limit=50):
+    """Keyset-paginated search by interest and minimum age, sorted by idCliente.
+
+    Returns (items, next_cursor); pass next_cursor back as `after` for the next page.
+    """
+    flt = {}
+    if interesse:
+        flt["interesses"] = interesse
+    if idade_min is not None:
+        flt["idade"] = {"$gte": idade_min}
+    if after:
+        flt["idCliente"] = {"$gt": after}
+    docs = list(profiles.find(flt, PROFILE_PROJECTION, sort=[("idCliente", 1)], limit=limit + 1))
+    next_cursor = docs[limit - 1]["idCliente"] if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+def warm_up():
+    get_client().admin.command("ping")
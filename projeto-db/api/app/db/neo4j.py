@@ -1,21 +1,79 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, Query
 import os
+import threading
 
-driver = GraphDatabase.driver(
-    os.getenv("NEO4J_URI", "bolt://neo4j:7687"),
-    auth=(
-        os.getenv("NEO4J_USER", "neo4j"),
-        os.getenv("NEO4J_PASSWORD", "123456")  # troque
-    )
-)
+from .. import config
+from ..services.metrics import track
+from ..services.bulkhead import guard, current_priority, LOW
+
+_driver = None
+_driver_pid = None
+_driver_lock = threading.Lock()
+
+
+def get_driver():
+    """Per-process driver, created lazily after fork."""
+    global _driver, _driver_pid
+    if _driver is None or _driver_pid != os.getpid():
+        with _driver_lock:
+            if _driver is None or _driver_pid != os.getpid():
+                _driver = GraphDatabase.driver(
+                    config.NEO4J_URI,
+                    auth=(config.NEO4J_USER, config.NEO4J_PASSWORD),
+                    max_connection_pool_size=config.NEO4J_MAX_POOL,
+                    connection_timeout=config.NEO4J_CONNECT_TIMEOUT,
+                    connection_acquisition_timeout=config.NEO4J_CONNECT_TIMEOUT,
+                )
+                _driver_pid = os.getpid()
+    return _driver
+
+
+def close():
+    global _driver
+    with _driver_lock:
+        if _driver is not None and _driver_pid == os.getpid():
+            _driver.close()
+        _driver = None
+
+
+def reset_after_fork():
+    global _driver
+    _driver = None
 
 def fetch_neo4j_data():
-    with driver.session() as session:
+    with get_driver().session() as session:
         result = session.run("MATCH (p:Produto) RETURN p")  # SEUS NODES EXISTENTES
         return [record["p"] for record in result]
 
 
+def _query(cypher):
+    # server-side transaction timeout; 0 means none
+    timeout = config.NEO4J_BATCH_QUERY_TIMEOUT if current_priority() == LOW else config.NEO4J_QUERY_TIMEOUT
+    return Query(cypher, timeout=timeout or None)
+
+
 def run_query(cypher, params=None):
-    with driver.session() as session:
-        result = session.run(cypher, params or {})
-        return [record.data() for record in result]
+    with guard("neo4j"), track("neo4j", cypher, params) as call, get_driver().session() as session:
+        result = session.run(_query(cypher), params or {})
+        rows = [record.data() for record in result]
+        call["rows"] = len(rows)
+        return rows
+
+
+def stream_query(cypher, params=None):
+    # records are pulled lazily from the server as the caller iterates
+    with guard("neo4j"), track("neo4j", cypher, params) as call, get_driver().session() as session:
+        call["rows"] = 0
+        for record in session.run(_query(cypher), params or {}):
+            call["rows"] += 1
+            yield record.data()
+
+
+def ensure_constraints():
+    run_query("CREATE CONSTRAINT person_id IF NOT EXISTS FOR (p:Person) REQUIRE p.id IS UNIQUE")
+    run_query("CREATE CONSTRAINT produto_id IF NOT EXISTS FOR (p:Produto) REQUIRE p.id IS UNIQUE")
+    run_query("CREATE CONSTRAINT id_counter_name IF NOT EXISTS FOR (c:IdCounter) REQUIRE c.name IS UNIQUE")
+
+
+def warm_up():
+    get_driver().verify_connectivity()
@@ -1,49 +1,362 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import psycopg2.errors
+import logging
+import random
+import re
+import threading
+import time
 import os
+from collections import namedtuple
+from contextlib import contextmanager
 
-def get_postgres_conn():
-    return psycopg2.connect(
-        dbname=os.getenv("POSTGRES_DB"),
-        user=os.getenv("POSTGRES_USER"),
-        password=os.getenv("POSTGRES_PASSWORD"),
-        host=os.getenv("POSTGRES_HOST", "postgres"),
-        port=5432,
+from prometheus_client import Gauge
+
+from .. import config
+from ..services.metrics import track
+from ..services.bulkhead import guard, current_priority, LOW
+from ..services import read_your_writes
+
+log = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+
+_pools = {}
+_pools_pid = None
+_pool_lock = threading.Lock()
+
+REPLICA_LAG = Gauge("postgres_replica_lag_seconds", "Replay lag of each Postgres replica", ["replica"],
+                    multiprocess_mode="max")
+REPLICA_UP = Gauge("postgres_replica_up", "1 while a replica passes its health check", ["replica"],
+                   multiprocess_mode="min")
+
+# replica -> {"healthy": bool, "lag": seconds or None}; refreshed by the health checker
+_replica_state = {r["name"]: {"healthy": True, "lag": None} for r in config.POSTGRES_REPLICAS}
+_replicas = {r["name"]: r for r in config.POSTGRES_REPLICAS}
+_checker_pid = None
+
+LAG_SQL = """
+SELECT pg_is_in_recovery() AS standby,
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END AS lag
+"""
+
+
+class _Connection(psycopg2.extensions.connection):
+    """Pooled connection that remembers which registered statements it has PREPAREd."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _conn_kwargs(target=PRIMARY):
+    replica = _replicas.get(target)
+    return dict(
+        dbname=config.POSTGRES_DB,
+        user=config.POSTGRES_USER,
+        password=config.POSTGRES_PASSWORD,
+        host=replica["host"] if replica else config.POSTGRES_HOST,
+        port=replica["port"] if replica else config.POSTGRES_PORT,
+        connect_timeout=config.POSTGRES_CONNECT_TIMEOUT,
+        # interactive deadline; batch work relaxes it per transaction (see connection())
+        options=f"-c statement_timeout={config.POSTGRES_STATEMENT_TIMEOUT_MS}",
+        connection_factory=_Connection,
     )
 
 
-def query(sql, params=None):
-    conn = get_postgres_conn()
+def get_postgres_conn():
+    return psycopg2.connect(**_conn_kwargs())
+
+
+def get_pool(target=PRIMARY):
+    """Return this process's connection pool for the primary or a replica, creating it on first use.
+
+    Pools inherited through fork() belong to the parent; the child builds its own.
+    """
+    global _pools, _pools_pid
+    if _pools_pid != os.getpid() or target not in _pools:
+        with _pool_lock:
+            if _pools_pid != os.getpid():
+                _pools, _pools_pid = {}, os.getpid()
+            if target not in _pools:
+                size = config.POSTGRES_POOL_MAX if target == PRIMARY else config.POSTGRES_REPLICA_POOL_MAX
+                _pools[target] = psycopg2.pool.ThreadedConnectionPool(
+                    config.POSTGRES_POOL_MIN, size, **_conn_kwargs(target)
+                )
+    return _pools[target]
+
+
+def close():
+    global _pools
+    with _pool_lock:
+        if _pools_pid == os.getpid():
+            for pool in _pools.values():
+                pool.closeall()
+        _pools = {}
+
+
+def reset_after_fork():
+    # drop the parent's pools without closing their sockets (they are still the parent's)
+    global _pools, _pools_pid
+    _pools, _pools_pid = {}, None
+
+
+def _release(conn, broken=False, target=PRIMARY):
     try:
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(sql, params or ())
-        rows = cur.fetchall()
-        return [dict(r) for r in rows]
-    finally:
+        if not broken and not conn.closed:
+            conn.rollback()
+        get_pool(target).putconn(conn, close=broken or bool(conn.closed))
+    except Exception:
+        pass
+
+
+def warm_up():
+    # open the minimum number of pooled connections up front
+    pool = get_pool()
+    conns = [pool.getconn() for _ in range(pool.minconn)]
+    for conn in conns:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        _release(conn)
+
+
+# --- replica routing ---
+def _mark_replica(name, healthy, lag=None):
+    _replica_state[name] = {"healthy": healthy, "lag": lag}
+    REPLICA_UP.labels(name).set(1 if healthy else 0)
+    if lag is not None:
+        REPLICA_LAG.labels(name).set(lag)
+
+
+def _check_replicas():
+    for name in _replicas:
+        try:
+            pool = get_pool(name)
+            conn = pool.getconn()
+            broken = False
+            try:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(LAG_SQL)
+                    row = cur.fetchone()
+            except psycopg2.Error:
+                broken = True
+                raise
+            finally:
+                _release(conn, broken, name)
+            # a promoted replica is no longer a standby: stop sending reads its way
+            _mark_replica(name, bool(row["standby"]), float(row["lag"]))
+        except Exception as e:
+            log.warning("postgres replica %s failed its health check: %s", name, e)
+            _mark_replica(name, False)
+
+
+def _health_loop(pid):
+    while _checker_pid == pid:
+        _check_replicas()
+        time.sleep(config.POSTGRES_REPLICA_CHECK_INTERVAL)
+
+
+def _ensure_health_checks():
+    global _checker_pid
+    if _checker_pid != os.getpid():
+        with _pool_lock:
+            if _checker_pid != os.getpid():
+                _checker_pid = os.getpid()
+                threading.Thread(target=_health_loop, args=(_checker_pid,), name="pg-replica-health", daemon=True).start()
+
+
+def replica_status():
+    return {name: dict(state) for name, state in _replica_state.items()}
+
+
+def _read_target(primary=False):
+    """Pick where a read goes: a healthy replica within the lag budget (weighted), else the primary."""
+    if primary or not _replicas or read_your_writes.primary_required():
+        return PRIMARY
+    _ensure_health_checks()
+    candidates = [
+        r for name, r in _replicas.items()
+        if _replica_state[name]["healthy"]
+        and (_replica_state[name]["lag"] or 0) <= config.POSTGRES_REPLICA_MAX_LAG
+    ]
+    if not candidates:
+        return PRIMARY
+    return random.choices(candidates, weights=[r["weight"] for r in candidates])[0]["name"]
+
+
+@contextmanager
+def connection(target=PRIMARY):
+    """Borrow a pooled connection under the postgres bulkhead; broken connections are discarded.
+
+    A replica that cannot hand out a connection is marked unhealthy and the primary is used.
+    Low priority callers get POSTGRES_BATCH_STATEMENT_TIMEOUT_MS for this transaction only.
+    """
+    with guard("postgres"):
+        try:
+            conn = get_pool(target).getconn()
+        except psycopg2.OperationalError as e:
+            if target == PRIMARY:
+                raise
+            log.warning("postgres replica %s unavailable, reading from the primary: %s", target, e)
+            _mark_replica(target, False)
+            target = PRIMARY
+            conn = get_pool(target).getconn()
+        broken = False
         try:
-            cur.close()
-        except Exception:
-            pass
-        conn.close()
+            batch_timeout = config.POSTGRES_BATCH_STATEMENT_TIMEOUT_MS
+            if current_priority() == LOW and batch_timeout != config.POSTGRES_STATEMENT_TIMEOUT_MS:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = %s", (batch_timeout,))
+            yield conn
+        except psycopg2.OperationalError as e:
+            # a statement timeout leaves the connection usable; anything else may not
+            broken = not isinstance(e, psycopg2.extensions.QueryCanceledError)
+            raise
+        finally:
+            _release(conn, broken, target)
+
+
+def query(sql, params=None, primary=False):
+    """Run a read; it may be served by a replica unless `primary` or read-your-writes requires the primary."""
+    with connection(_read_target(primary)) as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        with track("postgres", sql, params) as call:
+            cur.execute(sql, params or ())
+            rows = cur.fetchall()
+            call["rows"] = len(rows)
+        return [dict(r) for r in rows]
 
 
 def execute(sql, params=None, returning=False):
-    conn = get_postgres_conn()
-    try:
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(sql, params or ())
-        if returning:
-            row = cur.fetchone()
+    with connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        with track("postgres", sql, params) as call:
+            cur.execute(sql, params or ())
+            row = cur.fetchone() if returning else None
+            call["rows"] = cur.rowcount
             conn.commit()
+        read_your_writes.note_write()
+        if returning:
             return dict(row) if row else None
-        conn.commit()
         return None
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
-        conn.close()
+
+
+@contextmanager
+def transaction():
+    """Run several statements on one connection with a single COMMIT.
+
+    Yields `run(sql, params)`, which returns the result rows (empty for statements without them).
+    Nothing is committed if the block raises.
+    """
+    with connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        def run(sql, params=None):
+            with track("postgres", sql, params) as call:
+                cur.execute(sql, params or ())
+                rows = [dict(r) for r in cur.fetchall()] if cur.description else []
+                call["rows"] = len(rows) if cur.description else cur.rowcount
+            return rows
+
+        yield run
+        conn.commit()
+        read_your_writes.note_write()
+
+
+def stream(sql, params=None, itersize=1000, primary=False):
+    """Yield rows one by one through a server-side cursor, fetching `itersize` rows per round trip."""
+    with connection(_read_target(primary)) as conn, conn.cursor(name="stream_cursor", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        with track("postgres", sql, params) as call:
+            cur.itersize = itersize
+            cur.execute(sql, params or ())
+            call["rows"] = 0
+            for row in cur:
+                call["rows"] += 1
+                yield dict(row)
+
+
+# --- prepared statements for the hot reads ---
+def record(typename, fields):
+    """Row type for a registered statement: a namedtuple (no per-row dict or column names).
+
+    `r["col"]` and `r.get("col")` still work for code written against dict rows; convert with
+    `_asdict()` only where the row leaves as a response or cached JSON.
+    """
+    index = {f: i for i, f in enumerate(fields)}
+
+    class Record(namedtuple(typename, fields)):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            return tuple.__getitem__(self, index[key] if isinstance(key, str) else key)
+
+        def get(self, key, default=None):
+            i = index.get(key)
+            return default if i is None else tuple.__getitem__(self, i)
+
+    Record.__name__ = Record.__qualname__ = typename
+    return Record
+
+
+Cliente = record("Cliente", ["id", "external_id", "cpf", "nome", "endereco", "cidade", "uf", "email"])
+Produto = record("Produto", ["id", "produto", "valor", "quantidade", "tipo"])
+Compra = record("Compra", ["id", "id_produto", "data", "id_cliente"])
+
+
+class Statement:
+    __slots__ = ("name", "sql", "record", "execute_sql")
+
+    def __init__(self, name, sql, record):
+        self.name = name
+        self.sql = sql
+        self.record = record
+        nparams = max((int(n) for n in re.findall(r"\$(\d+)", sql)), default=0)
+        args = ", ".join(["%s"] * nparams)
+        self.execute_sql = f"EXECUTE {name} ({args})" if nparams else f"EXECUTE {name}"
+
+
+STATEMENTS = {}
+
+
+def register(name, sql, record):
+    """Register a hot statement ($1, $2... placeholders); it is PREPAREd once per connection."""
+    STATEMENTS[name] = Statement(name, sql, record)
+
+
+def _columns(rec):
+    return ", ".join(rec._fields)
+
+
+register("cliente_por_external_id", f"SELECT {_columns(Cliente)} FROM clientes WHERE external_id = $1", Cliente)
+register("cliente_por_id", f"SELECT {_columns(Cliente)} FROM clientes WHERE id = $1", Cliente)
+register("compras_do_cliente", f"SELECT {_columns(Compra)} FROM compras WHERE id_cliente = $1", Compra)
+# partitions older than $2 are pruned at execution time
+register("compras_recentes_do_cliente",
+         f"SELECT {_columns(Compra)} FROM compras WHERE id_cliente = $1 AND data >= $2", Compra)
+register("produtos", f"SELECT {_columns(Produto)} FROM produtos ORDER BY id", Produto)
+register("produto_por_id", f"SELECT {_columns(Produto)} FROM produtos WHERE id = $1", Produto)
+
+
+def run_prepared(name, *params, primary=False):
+    """Run a registered statement (read routing as in query()) and return its rows as records."""
+    stmt = STATEMENTS[name]
+    with connection(_read_target(primary)) as conn, conn.cursor() as cur:
+        with track("postgres", stmt.sql, params) as call:
+            for attempt in (1, 2):
+                try:
+                    if name not in conn.prepared:
+                        cur.execute(f"PREPARE {name} AS {stmt.sql}")
+                        conn.prepared.add(name)
+                    cur.execute(stmt.execute_sql, params)
+                    break
+                except psycopg2.errors.InvalidSqlStatementName:
+                    # the session lost its prepared statements (e.g. DISCARD ALL); prepare again
+                    conn.rollback()
+                    conn.prepared.clear()
+                    if attempt == 2:
+                        raise
+            rows = cur.fetchall()
+            call["rows"] = len(rows)
+        return [stmt.record._make(r) for r in rows]
 
 
 def fetch_postgres_data():
@@ -1,11 +1,348 @@
 import redis
+import redis.client
+import redis.commands
+import redis.exceptions
+import bisect
+import contextvars
+import hashlib
+import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "redis"),
-    port=6379,
-    decode_responses=True
-)
+from .. import config
+from ..services.metrics import observe_call
+from ..services.bulkhead import guard
+
+
+def _statement(args):
+    # command name and first key only; values may be large payloads
+    return " ".join(str(a) for a in args[:2])
+
+
+def _token(arg):
+    """Command name or keyword as upper-case text; redis-py sends some of them as bytes."""
+    return (arg.decode(errors="replace") if isinstance(arg, bytes) else str(arg)).upper()
+
+
+def _blocking(args):
+    # XREAD ... BLOCK waits for new entries by design; timing it would only flood the slow-query log
+    return _token(args[0]) in ("XREAD", "XREADGROUP") and any(_token(a) == "BLOCK" for a in args[1:])
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        statement = f"PIPELINE x{len(self.command_stack)}"
+        start = time.perf_counter()
+        failed = False
+        try:
+            with guard("redis"):
+                return super().execute(raise_on_error)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            observe_call("redis", time.perf_counter() - start, failed, statement=statement)
+
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that reports every command (and every pipeline flush) to the metrics module."""
+
+    def execute_command(self, *args, **options):
+        if _blocking(args):
+            with guard("redis"):
+                return super().execute_command(*args, **options)
+        start = time.perf_counter()
+        failed = False
+        rows = None
+        try:
+            with guard("redis"):
+                result = super().execute_command(*args, **options)
+            rows = len(result) if isinstance(result, (list, dict, set)) else None
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            observe_call("redis", time.perf_counter() - start, failed, statement=_statement(args), rows=rows)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# --- client-side sharding: consistent hashing over REDIS_NODES ---
+def hash_tag(key):
+    """The part of `key` that picks its shard: the text inside the first {...}, as in Redis Cluster.
+
+    Keys sharing a tag (e.g. "{analytics:x}:tmp" and "analytics:x") always live on the same node.
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    elif not isinstance(key, bytes):
+        key = str(key).encode()
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def _point(value):
+    return int.from_bytes(hashlib.md5(value).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node.
+
+    Points depend only on the node name, so adding a node moves about 1/N of the keys (all of
+    them to the new node) and the order of REDIS_NODES does not matter.
+    """
+
+    def __init__(self, nodes, vnodes=160):
+        points = sorted((_point(f"{node}#{i}".encode()), node) for node in nodes for i in range(vnodes))
+        self.nodes = list(nodes)
+        self._points = [p for p, _ in points]
+        self._owners = [n for _, n in points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._points, _point(hash_tag(key)))
+        return self._owners[i % len(self._owners)]
+
+
+def _sum(replies):
+    return sum(replies)
+
+
+def _first(replies):
+    return replies[0]
+
+
+# commands sent to every node, and how their replies are merged
+_ALL_NODES = {
+    "FLUSHDB": all, "FLUSHALL": all, "PING": all, "DBSIZE": _sum, "SCRIPT LOAD": _first,
+    "KEYS": lambda replies: [k for r in replies for k in r],
+}
+# multi-key commands split per node; their replies are counts
+_COUNTING = {"DEL", "UNLINK", "EXISTS", "TOUCH"}
+# multi-key commands that only work when every key is on one node
+_SAME_NODE = {"RENAME", "RENAMENX", "COPY", "RPOPLPUSH", "LMOVE", "SMOVE"}
+
+
+class ShardedRedis(redis.commands.CoreCommands):
+    """Drop-in for redis.Redis over several independent nodes.
+
+    Each key goes to one node of a HashRing. Multi-key reads and writes (MGET, DEL, UNLINK,
+    EXISTS) and pipelines are split per node and sent to all of them in parallel; SCAN walks the
+    nodes one after the other. A pipeline with transaction=True is one MULTI/EXEC per node, so it
+    is atomic only among keys of the same node: keys that must change together share a hash tag.
+    """
+
+    def __init__(self, clients, vnodes=160):
+        self.clients = dict(clients)
+        self.ring = HashRing(self.clients, vnodes)
+        self._names = list(self.clients)
+        self._fanout = ThreadPoolExecutor(max_workers=len(self.clients), thread_name_prefix="redis-shard")
+
+    def node(self, key):
+        return self.clients[self.ring.node_for(key)]
+
+    def _key_of(self, name, args):
+        if name in ("EVAL", "EVALSHA", "EVAL_RO", "EVALSHA_RO", "FCALL", "FCALL_RO"):
+            return args[3] if int(args[2]) > 0 else None
+        if name in ("XREAD", "XREADGROUP"):
+            upper = [_token(a) for a in args]
+            return args[upper.index("STREAMS") + 1]
+        return args[1] if len(args) > 1 else None
+
+    def route(self, args):
+        """Split one command into [(node name, args)] plus a function merging the node replies."""
+        name = _token(args[0])
+        if name in _ALL_NODES:
+            return [(n, args) for n in self._names], _ALL_NODES[name]
+        if name == "MGET" or name in _COUNTING:
+            groups = {}
+            for pos, key in enumerate(args[1:]):
+                groups.setdefault(self.ring.node_for(key), []).append(pos)
+            parts = [(n, (args[0], *[args[1 + p] for p in positions])) for n, positions in groups.items()]
+            if name in _COUNTING:
+                return parts, _sum
+
+            def merge(replies):
+                values = [None] * (len(args) - 1)
+                for (_, positions), reply in zip(groups.items(), replies):
+                    for p, value in zip(positions, reply):
+                        values[p] = value
+                return values
+            return parts, merge
+        if name in _SAME_NODE:
+            nodes = {self.ring.node_for(k) for k in args[1:3]}
+            if len(nodes) > 1:
+                raise redis.exceptions.ResponseError(f"{name} keys live on different nodes; give them a common hash tag")
+        key = self._key_of(name, args)
+        return [(self.ring.node_for(key) if key is not None else self._names[0], args)], _first
+
+    def _parallel(self, calls):
+        # bulkhead priority and profiling context follow each call into the fan-out threads
+        futures = [self._fanout.submit(contextvars.copy_context().run, fn, *a) for fn, *a in calls]
+        return [f.result() for f in futures]
+
+    def execute_command(self, *args, **options):
+        parts, merge = self.route(args)
+        if len(parts) == 1:
+            node, node_args = parts[0]
+            return merge([self.clients[node].execute_command(*node_args, **options)])
+        return merge(self._parallel([
+            (partial(self.clients[node].execute_command, **options), *node_args) for node, node_args in parts
+        ]))
+
+    def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        # cursor = node cursor * len(nodes) + node index
+        cursor = int(cursor)
+        shard, inner = cursor % len(self._names), cursor // len(self._names)
+        while True:
+            inner, keys = self.clients[self._names[shard]].scan(inner, match=match, count=count, _type=_type, **kwargs)
+            if inner != 0:
+                return inner * len(self._names) + shard, keys
+            shard += 1
+            if shard == len(self._names):
+                return 0, keys
+            if keys:
+                return shard, keys
+
+    def scan_iter(self, match=None, count=None, _type=None, **kwargs):
+        for name in self._names:
+            yield from self.clients[name].scan_iter(match=match, count=count, _type=_type, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ShardedPipeline(self, transaction)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+            client.connection_pool.disconnect()
+        self._fanout.shutdown(wait=False)
+
+
+class ShardedPipeline(redis.commands.CoreCommands):
+    """Buffers commands, then sends one pipeline per node, all nodes in parallel."""
+
+    def __init__(self, sharded, transaction=True):
+        self.sharded = sharded
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute(self, raise_on_error=True):
+        stack, self.command_stack = self.command_stack, []
+        if not stack:
+            return []
+        per_node, plans = {}, []
+        for args, options in stack:
+            parts, merge = self.sharded.route(args)
+            slots = []
+            for node, node_args in parts:
+                queued = per_node.setdefault(node, [])
+                slots.append((node, len(queued)))
+                queued.append((node_args, options))
+            plans.append((slots, merge))
+
+        def run(node, commands):
+            pipe = self.sharded.clients[node].pipeline(transaction=self.transaction)
+            for node_args, options in commands:
+                pipe.execute_command(*node_args, **options)
+            return pipe.execute(raise_on_error=False)
+
+        nodes = list(per_node)
+        if len(nodes) == 1:
+            replies = {nodes[0]: run(nodes[0], per_node[nodes[0]])}
+        else:
+            replies = dict(zip(nodes, self.sharded._parallel([(run, n, per_node[n]) for n in nodes])))
+
+        results = []
+        for slots, merge in plans:
+            parts = [replies[node][i] for node, i in slots]
+            error = next((r for r in parts if isinstance(r, Exception)), None)
+            results.append(error if error is not None else merge(parts))
+        if raise_on_error:
+            error = next((r for r in results if isinstance(r, Exception)), None)
+            if error is not None:
+                raise error
+        return results
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Per-process client and connection pool, created lazily after fork."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                clients = {
+                    f"{host}:{port}": InstrumentedRedis(
+                        host=host,
+                        port=port,
+                        max_connections=config.REDIS_MAX_CONNECTIONS,
+                        socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+                        socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                        decode_responses=True
+                    )
+                    for host, port in config.REDIS_NODES
+                }
+                if len(clients) == 1:
+                    _client = next(iter(clients.values()))
+                else:
+                    _client = ShardedRedis(clients, vnodes=config.REDIS_VNODES)
+                _client_pid = os.getpid()
+    return _client
+
+
+class _LazyRedis:
+    # module-level handle the rest of the app imports; resolves to this process's client on use
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+
+redis_client = _LazyRedis()
 
 # Alias para compatibilidade
 redis_db = redis_client
+
+
+def close():
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            if not isinstance(_client, ShardedRedis):
+                _client.connection_pool.disconnect()
+        _client = None
+
+
+def reset_after_fork():
+    global _client
+    _client = None
+
+
+def warm_up():
+    redis_client.ping()
@@ -1,8 +1,8 @@
-from fastapi import FastAPI
-from .db.redis_db import redis_client
-from .db.pg import fetch_postgres_data
-from .db.mongo import fetch_mongo_data
-from .db.neo4j import fetch_neo4j_data
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
+from .db import pg, mongo, neo4j, redis_db
+from .services import bootstrap, replication, metrics, profiling, bulkhead, compras, catalog_sync, read_your_writes, compras_partitions
 
 # Tags metadata for OpenAPI grouping
 tags_metadata = [
@@ -12,35 +12,93 @@ tags_metadata = [
     {"name": "Profiles", "description": "MongoDB profiles and interests (document store)."},
     {"name": "Neo4j", "description": "Graph nodes and relationships (persons and product nodes)."},
     {"name": "Cache", "description": "Cache management and queries (Redis)."},
+    {"name": "Analytics", "description": "Sales aggregates kept in Redis and updated on every purchase."},
     {"name": "Admin", "description": "Administrative endpoints: seeding and migration."},
 ]
 
-app = FastAPI(openapi_tags=tags_metadata)
+@asynccontextmanager
+async def lifespan(app):
+    # constraints, connection warm-up and cache priming run once per process
+    bootstrap.start_bootstrap()
+    catalog_sync.start_scheduler()
+    compras_partitions.start_scheduler()
+    yield
+    # commit purchases still waiting for a group commit before the connections go away
+    compras.stop()
+    # each worker owns its clients; close them on graceful shutdown
+    for store in (pg, mongo, neo4j, redis_db):
+        try:
+            store.close()
+        except Exception:
+            pass
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
+app.router.route_class = profiling.ProfiledRoute
+app.add_middleware(read_your_writes.ReadYourWritesMiddleware)
+app.add_middleware(bulkhead.PriorityMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.exception_handler(bulkhead.BackendOverloaded)
+def backend_overloaded(request, exc):
+    # fail fast instead of queueing behind a saturated backend
+    return JSONResponse(
+        {"detail": f"{exc.backend} is overloaded, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 from .routes.api_routes import router as api_router
 app.include_router(api_router)
 
-@app.get("/replicar")
-def replicar_dados():
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
-    # 🔵 POSTGRES
-    rows = fetch_postgres_data()
-    for i, row in enumerate(rows):
-        redis_client.set(f"postgres:produto:{i}", str(row))
+@app.get("/debug/profiles", tags=["Admin"], summary="List recently stored request profiles")
+def list_request_profiles(limit: int = 20):
+    return profiling.recent_profiles(limit)
 
-    # 🟢 MONGO
-    docs = fetch_mongo_data()
-    for doc in docs:
-        redis_client.set(f"mongo:cliente:{doc['_id']}", str(doc))
+@app.get("/debug/profiles/{profile_id}", tags=["Admin"], summary="Download a stored request profile (timeline, summary, CPU samples)")
+def get_request_profile(profile_id: str):
+    data = profiling.get_profile(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="profile not found or expired")
+    return data
 
-    # 🟣 NEO4J
-    nodes = fetch_neo4j_data()
-    for i, node in enumerate(nodes):
-        redis_client.set(f"neo4j:produto:{i}", str(node))
+@app.get("/debug/replicas", tags=["Admin"], summary="Health and replay lag of the Postgres read replicas")
+def postgres_replicas():
+    return pg.replica_status()
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    # only report ready once the bootstrap has finished, so rolling deploys wait for warm pools
+    body = {"ready": bootstrap.state["ready"], "steps": bootstrap.state["steps"], "error": bootstrap.state["error"]}
+    return JSONResponse(body, status_code=200 if bootstrap.state["ready"] else 503)
+
+@app.get("/replicar")
+def replicar_dados():
+    # streams PG, Mongo and Neo4j concurrently into Redis keyed by primary key;
+    # unchanged rows (same content hash) are skipped on repeated runs
+    manifest = replication.run_snapshot()
+    sources = manifest["sources"]
 
     return {
         "status": "OK",
-        "postgres_registros": len(rows),
-        "mongo_registros": len(docs),
-        "neo4j_registros": len(nodes)
+        "postgres_registros": sources["postgres"]["count"],
+        "mongo_registros": sources["mongo"]["count"],
+        "neo4j_registros": sources["neo4j"]["count"],
+        "manifest": manifest,
     }
+
+@app.get("/replicar/manifest")
+def replicar_manifest():
+    manifest = replication.get_manifest()
+    if manifest is None:
+        return JSONResponse({"detail": "no snapshot published yet"}, status_code=404)
+    return manifest
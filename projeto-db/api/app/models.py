@@ -0,0 +1,62 @@
+"""Response models shared by the routes and the cache writer.
+
+Consolidated clients are validated against ConsolidatedCliente when they are cached, so
+reads can return the stored JSON bytes as they are.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Optional, List, Dict
+
+from pydantic import BaseModel
+
+
+# --- Response models to improve OpenAPI visuals ---
+class ClienteOut(BaseModel):
+    id: Optional[int] = None
+    external_id: Optional[str] = None
+    cpf: Optional[str] = None
+    nome: Optional[str] = None
+    endereco: Optional[str] = None
+    cidade: Optional[str] = None
+    uf: Optional[str] = None
+    email: Optional[str] = None
+
+class PerfilOut(BaseModel):
+    idCliente: str
+    idade: Optional[int] = None
+    interesses: Optional[List[str]] = None
+
+class ProdutoSimple(BaseModel):
+    id: int
+    produto: str
+    valor: Decimal
+    quantidade: int
+    tipo: Optional[str] = None
+
+class CompraOut(BaseModel):
+    id: int
+    id_produto: int
+    # Postgres hands out dates; they serialize as "YYYY-MM-DD" like the cached JSON
+    data: Optional[date] = None
+    id_cliente: int
+    produto: Optional[ProdutoSimple] = None
+
+class ConsolidatedCliente(BaseModel):
+    cliente: ClienteOut
+    perfil: Optional[PerfilOut] = None
+    amigos: List[dict] = []
+    compras: List[CompraOut] = []
+    # set when the cached record only holds the most recent purchases
+    compras_total: Optional[int] = None
+    compras_next: Optional[str] = None
+    # compras only cover purchases from this date on; older ones: /clientes/{id}/compras?ate=...
+    compras_desde: Optional[str] = None
+    recomendacoes: Optional[List[dict]] = None
+    # facets a degraded build could not load in time: "cache" (last cached value) or "indisponivel"
+    facetas_degradadas: Optional[Dict[str, str]] = None
+
+class CompraCriada(BaseModel):
+    id: int
+    # the client's consolidated view after the purchase; None with COMPRAS_GROUP_COMMIT=1, where
+    # it is rebuilt asynchronously (read it from /clientes/{id}, the response sets the read-your-writes cookie)
+    cliente: Optional[ConsolidatedCliente] = None
@@ -1,77 +1,92 @@
-from fastapi import APIRouter, HTTPException, Response, status
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Literal
 from decimal import Decimal
+from datetime import date, timedelta
 from uuid import uuid4, UUID
 from fastapi import BackgroundTasks
-from ..services.cache_refresher import (refresh_cache, clear_cache, build_consolidated_for_client,
-                                           replicate_client_to_redis, compute_recommendations)
+from fastapi.responses import StreamingResponse
+from ..services.cache_refresher import (refresh_cache, build_consolidated_for_client,
+                                           replicate_client_to_redis, compute_recommendations,
+                                           rebuild_client, list_client_compras, delete_client_from_redis)
+from ..services import cache_policy, cache_generations
 from ..db.redis_db import redis_client as redis_db
 from ..db import pg as db_pg
 from ..db.mongo import clientes, profiles
+from ..db import mongo as db_mongo
+from pymongo.errors import DuplicateKeyError
+from redis.client import NEVER_DECODE
+from redis.exceptions import RedisError
 from ..db.neo4j import run_query as neo_run
+from neo4j.exceptions import ConstraintError
+from ..services.metrics import cache_result, cache_rebuild
+from ..services.bulkhead import BackendOverloaded
+from ..services.profiling import ProfiledRoute
+from ..services import cache_stats, analytics, etags, compras, catalog_sync, change_feed, compras_partitions, read_your_writes
+from ..services.interest_index import index as interest_index
+from ..services.id_allocator import produto_ids, max_neo_produto_id
+from ..models import ConsolidatedCliente, CompraCriada
 import json
 
-router = APIRouter()
-
-# --- Response models to improve OpenAPI visuals ---
-class ClienteOut(BaseModel):
-    id: Optional[int] = None
-    external_id: Optional[str] = None
-    cpf: Optional[str] = None
-    nome: Optional[str] = None
-    endereco: Optional[str] = None
-    cidade: Optional[str] = None
-    uf: Optional[str] = None
-    email: Optional[str] = None
-
-class PerfilOut(BaseModel):
-    idCliente: str
-    idade: Optional[int] = None
-    interesses: Optional[List[str]] = None
-
-class ProdutoSimple(BaseModel):
-    id: int
-    produto: str
-    valor: Decimal
-    quantidade: int
-    tipo: Optional[str] = None
-
-class CompraOut(BaseModel):
-    id: int
-    id_produto: int
-    data: Optional[str] = None
-    id_cliente: int
-    produto: Optional[ProdutoSimple] = None
-
-class ConsolidatedCliente(BaseModel):
-    cliente: ClienteOut
-    perfil: Optional[PerfilOut] = None
-    amigos: List[dict] = []
-    compras: List[CompraOut] = []
-    recomendacoes: Optional[List[dict]] = None
+router = APIRouter(route_class=ProfiledRoute)
 
+# allocated produto ids tried before POST /neo4j/produtos gives up
+ID_CREATE_ATTEMPTS = 5
 
 # --- cache endpoints ---
 @router.post("/cache/refresh", tags=["Cache"], summary="Refresh cache")
 def refresh():
-    clear_cache()
-    refresh_cache()
-    return {"status": "cache atualizado"}
+    # builds generation N+1 while readers stay on N, then flips the pointer (no flush, no empty window)
+    if not refresh_cache():
+        raise HTTPException(status_code=409, detail="a cache refresh is already running")
+    return {"status": "cache atualizado", "generation": cache_generations.active_generation()}
+
+@router.get("/cache/stats", tags=["Cache"], summary="Key counts, memory per namespace and payload sizes (SCAN-based)")
+def get_cache_stats(cursor: int = 0, max_keys: int = 100000, sample_every: int = 10, top: int = 10):
+    """Incremental: if `complete` is false, call again with the returned `cursor` to continue the walk."""
+    return cache_stats.collect(cursor=cursor, max_keys=max_keys, sample_every=max(1, sample_every), top=top)
+
+def _clientes_validators():
+    # one MGET: the list version is bumped by every client write/delete and by each full refresh
+    ver, mtime = etags.version("clientes")
+    return etags.headers(f'W/"clientes-g{cache_generations.active_generation()}-v{ver}"', mtime)
 
 @router.get("/redis/clientes", tags=["Cache"], summary="List clients from Redis")
-def get_clientes():
-    keys = redis_db.keys("cliente:*")
-    data = []
+def list_redis_clientes(request: Request, response: Response):
+    validators = _clientes_validators()
+    if etags.not_modified(request, validators["ETag"], validators.get("Last-Modified")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    return _json_bytes(_json_array(data for data, _ in _cached_payloads()), validators)
+
+def _json_bytes(payload, headers=None):
+    # cached payloads are serialized JSON already: send the bytes without parsing or re-encoding them
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+def _json_array(payloads):
+    return b"[" + b",".join(payloads) + b"]"
+
+def _cached_payloads():
+    """(raw JSON bytes, validated at write time) for every cached client in the active generation."""
+    keys = list(redis_db.scan_iter(match=cache_generations.cliente_pattern(), count=1000))
+    if not keys:
+        return []
+    pipe = redis_db.pipeline(transaction=False)
     for k in keys:
-        raw = redis_db.hget(k, "data")
-        data.append(json.loads(raw))
-    return data
+        pipe.execute_command("HMGET", k, "data", "validated", NEVER_DECODE=True)
+    # keys may expire between SCAN and HMGET
+    return [(data, validated == b"1") for data, validated in pipe.execute() if data]
+
+def get_clientes():
+    return [json.loads(data) for data, _ in _cached_payloads()]
 
 # Unified consolidated clients endpoint (visual, uses 'Clientes' tag)
 @router.get("/clientes", tags=["Clientes"], response_model=List[ConsolidatedCliente], summary="List consolidated clients (from Redis)")
 def list_consolidated_clients():
-    return get_clientes()
+    # validated payloads are concatenated as they are; older ones go through the model once
+    return _json_bytes(_json_array(
+        data if validated else ConsolidatedCliente.model_validate_json(data).model_dump_json().encode()
+        for data, validated in _cached_payloads()
+    ))
 
 @router.get("/redis/clientes/friends", tags=["Cache"], summary="List clients and their friends")
 def get_clientes_friends():
@@ -85,9 +100,9 @@ def get_clientes_compras():
     return [{"cliente": c.get("cliente"), "compras": c.get("compras", [])} for c in all_clients]
 
 @router.get("/redis/clientes/{id}/recomendacoes", tags=["Cache"], summary="Compute and store recommendations for a client")
-def get_recommendations_for_client(id: str):
-    recs = compute_recommendations(id)
-    return {"id": id, "recomendacoes": recs}
+def get_recommendations_for_client(id: str, mode: Literal["blend", "friends", "content"] = "blend", top_n: int = 5):
+    recs = compute_recommendations(id, top_n=top_n, mode=mode)
+    return {"id": id, "mode": mode, "recomendacoes": recs}
 
 @router.post("/seed/run", tags=["Admin"], summary="Run seed files to populate DBs (optional purge)")
 def run_seed(purge: bool = False):
@@ -114,7 +129,8 @@ def run_seed(purge: bool = False):
             pass
         # Neo4j
         try:
-            neo_run("MATCH (n) DETACH DELETE n")
+            # id counters survive: workers may still hold blocks reserved from them
+            neo_run("MATCH (n) WHERE NOT n:IdCounter DETACH DELETE n")
         except Exception:
             pass
 
@@ -135,6 +151,8 @@ def run_seed(purge: bool = False):
         # split by ; and execute statements
         for stmt in [s.strip() for s in cql.split(';') if s.strip()]:
             neo_run(stmt)
+        # seeded products carry explicit ids; keep the allocator ahead of them
+        produto_ids.observe(max_neo_produto_id())
     except Exception as e:
         return {"error": f"neo4j seed failed: {e}"}
 
@@ -206,6 +224,10 @@ def run_seed(purge: bool = False):
     except Exception as e:
         return {"error": f"postgres seed failed: {e}"}
 
+    # seeded products invalidate the /produtos validators
+    etags.bump("produtos")
+    catalog_sync.schedule()
+
     # rebuild cache
     try:
         refresh_cache()
@@ -214,12 +236,47 @@ def run_seed(purge: bool = False):
 
     return {"status": "seed applied"}
 
+NOT_MODIFIED = object()
+
+def _text(value):
+    return value.decode() if value is not None else None
+
+def _read_cached_cliente(id: str, request: Optional[Request] = None):
+    """Return (payload bytes, validator headers, validated) for a cached client, or (NOT_MODIFIED, headers, None).
+
+    Payload, validators and remaining TTL come back in one round trip; for conditional requests
+    only the validators are fetched first, so a 304 never reads the payload.
+    The payload is read undecoded, so it can be sent back as is.
+    Keys close to expiry are rebuilt in the background.
+    """
+    key = cache_generations.cliente_key(id)
+    conditional = request is not None and etags.is_conditional(request)
+    fields = ["etag", "mtime", "validated"] if conditional else ["etag", "mtime", "validated", "data"]
+    pipe = redis_db.pipeline(transaction=False)
+    pipe.execute_command("HMGET", key, *fields, NEVER_DECODE=True)
+    pipe.ttl(key)
+    values, ttl = pipe.execute()
+    etag, mtime, validated = _text(values[0]), _text(values[1]), values[2] == b"1"
+    data = None if conditional else values[3]
+    hit = bool(etag or data)
+    cache_result("cliente", hit)
+    if hit and cache_policy.needs_refresh("cliente", ttl):
+        cache_policy.schedule_refresh("cliente", id, rebuild_client)
+    validators = etags.headers(etag, mtime) if etag else {}
+    if conditional and etag and etags.not_modified(request, etag, mtime):
+        return NOT_MODIFIED, validators, None
+    if conditional and hit:
+        data = redis_db.execute_command("HGET", key, "data", NEVER_DECODE=True)
+    return data, validators, validated
+
 @router.get("/redis/cliente/{id}", tags=["Cache"], summary="Get single client from Redis")
-def get_cliente(id: str):
-    data = redis_db.hget(f"cliente:{id}", "data")
+def get_cliente(id: str, request: Request):
+    data, validators, _ = _read_cached_cliente(id, request)
+    if data is NOT_MODIFIED:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
     if not data:
         raise HTTPException(status_code=404, detail="cliente not found in cache")
-    return json.loads(data)
+    return _json_bytes(data, validators)
 
 
 # --- Postgres Produtos CRUD ---
@@ -230,7 +287,7 @@ class CompraIn(BaseModel):
     id_cliente: str  # accepts numeric id or external_id (UUID)
     data: Optional[str] = None
 
-@router.post("/compras", status_code=status.HTTP_201_CREATED, tags=["Postgres - Compras"], summary="Create a compra (purchase)")
+@router.post("/compras", status_code=status.HTTP_201_CREATED, tags=["Postgres - Compras"], response_model=CompraCriada, summary="Create a compra (purchase); 409 when the product is out of stock")
 def create_compra(c: CompraIn):
 
     # map id_cliente to numeric id in Postgres; create client if it exists only in Neo4j
@@ -265,27 +322,79 @@ def create_compra(c: CompraIn):
     if pid is None:
         raise HTTPException(status_code=400, detail="could not resolve id_cliente to a Postgres id")
 
-    # insert compra
     date_val = c.data or None
-    res = db_pg.execute(
-        "INSERT INTO compras (id_produto, data, id_cliente) VALUES (%s, %s, %s) RETURNING id;",
-        (c.id_produto, date_val, pid),
-        returning=True,
-    )
-    if not res:
-        raise HTTPException(status_code=500, detail="failed to create compra")
-
-    # rebuild consolidated for the client and replicate
-    # resolve cid for consolidated function (prefer external_id if exists)
-    rows = db_pg.query("SELECT external_id FROM clientes WHERE id = %s", (pid,))
-    cid = rows[0]["external_id"] if rows and rows[0].get("external_id") else str(pid)
-    consolidado = build_consolidated_for_client(str(cid))
+    try:
+        if compras.GROUP_COMMIT:
+            # high-rate mode: committed together with the purchases of the next few ms;
+            # the cached client is rebuilt asynchronously (coalesced per client)
+            res = compras.submit(c.id_produto, date_val, pid)
+            # committed by the writer thread, outside this request: mark the write here so the
+            # response carries the read-your-writes cookie
+            read_your_writes.note_write()
+            return {"id": res["id"], "cliente": None}
+        res = compras.reserve_and_insert(c.id_produto, date_val, pid)
+    except compras.ProdutoNotFound:
+        raise HTTPException(status_code=404, detail="produto not found")
+    except compras.SemEstoque:
+        raise HTTPException(status_code=409, detail="produto sem estoque")
+    # stock changed: /produtos validators must not match anymore
+    etags.bump("produtos")
+    analytics.record_purchase(c.id_produto, res.get("valor"), res.get("tipo"), res.get("data"), res.get("cidade"))
+
+    # rebuild consolidated for the client and replicate (keyed by external_id when it exists)
+    consolidado = build_consolidated_for_client(res["cid"])
     if consolidado:
-        replicate_client_to_redis(str(cid), consolidado)
+        replicate_client_to_redis(res["cid"], consolidado)
 
     return {"id": res.get("id"), "cliente": consolidado}
 
 
+# --- Catalog sync (Postgres produtos -> Neo4j :Produto) ---
+@router.post("/catalog/sync", tags=["Admin"], summary="Sync Neo4j Produto nodes with Postgres produtos (diff only)")
+def run_catalog_sync():
+    stats = catalog_sync.run_exclusive()
+    if stats is None:
+        raise HTTPException(status_code=409, detail="a catalog sync is already running")
+    return stats
+
+@router.get("/catalog/sync", tags=["Admin"], summary="Result of the last full catalog sync")
+def get_catalog_sync():
+    return catalog_sync.last_run() or {}
+
+@router.get("/compras/partitions", tags=["Admin"], summary="Monthly partitions of compras with estimated row counts")
+def get_compras_partitions():
+    partitioned = compras_partitions.is_partitioned()
+    return {"particionada": partitioned, "particoes": compras_partitions.partitions() if partitioned else []}
+
+@router.post("/compras/partitions/maintain", tags=["Admin"], summary="Create upcoming compras partitions and detach expired ones")
+def maintain_compras_partitions():
+    if not compras_partitions.is_partitioned():
+        raise HTTPException(status_code=409, detail="compras is not partitioned")
+    return compras_partitions.maintain()
+
+
+# --- Sales analytics (Redis aggregates maintained by create_compra, rebuilt by /cache/refresh) ---
+@router.get("/analytics/produtos/top", tags=["Analytics"], summary="Top products by revenue or number of purchases")
+def analytics_top_produtos(by: Literal["receita", "quantidade"] = "receita", limit: int = 10):
+    return analytics.top_produtos(by=by, limit=min(max(1, limit), 100))
+
+@router.get("/analytics/receita-por-tipo", tags=["Analytics"], summary="Revenue per product tipo")
+def analytics_receita_por_tipo():
+    return analytics.receita_por_tipo()
+
+@router.get("/analytics/compras-por-dia", tags=["Analytics"], summary="Number of purchases per day (YYYY-MM-DD range)")
+def analytics_compras_por_dia(de: Optional[str] = None, ate: Optional[str] = None):
+    return analytics.compras_por_dia(de, ate)
+
+@router.get("/analytics/vendas-por-cidade", tags=["Analytics"], summary="Revenue and purchases per client city")
+def analytics_vendas_por_cidade():
+    return analytics.vendas_por_cidade()
+
+@router.post("/analytics/recompute", tags=["Analytics"], summary="Recompute all sales aggregates from Postgres")
+def analytics_recompute():
+    return analytics.recompute()
+
+
 # --- Postgres Clientes (direct) ---
 @router.post("/postgres/clientes", status_code=status.HTTP_201_CREATED, tags=["Clientes"], response_model=ConsolidatedCliente, summary="Create a client in Postgres and replicate to other DBs")
 def create_postgres_cliente(c: "ClienteIn", background_tasks: BackgroundTasks):
@@ -315,8 +424,7 @@ def create_postgres_cliente(c: "ClienteIn", background_tasks: BackgroundTasks):
     doc = {"_id": external_id, **c_data}
     clientes.insert_one(doc)
 
-    # create Person in Neo4j
-    neo_run("CREATE CONSTRAINT IF NOT EXISTS FOR (p:Person) REQUIRE p.id IS UNIQUE;")
+    # create Person in Neo4j (uniqueness constraint is ensured at startup)
     neo_run("MERGE (p:Person {id:$id}) SET p.cpf=$cpf, p.nome=$nome RETURN p", {"id": external_id, "cpf": c.cpf, "nome": c.nome})
 
     # replicate consolidated to Redis (background)
@@ -380,7 +488,7 @@ def delete_postgres_cliente(id: str):
     # delete neo4j person
     neo_run("MATCH (p:Person {id:$id}) DETACH DELETE p", {"id": id})
     # delete redis
-    redis_db.delete(f"cliente:{id}")
+    delete_client_from_redis(id)
 
     return consolidado
 
@@ -394,15 +502,26 @@ class Produto(ProdutoIn):
     id: int
 
 @router.get("/produtos", response_model=List[Produto], tags=["Postgres - Produtos"], summary="List products from Postgres")
-def list_produtos():
-    return db_pg.query("SELECT * FROM public.produtos ORDER BY id;")
+def list_produtos(request: Request, response: Response):
+    ver, mtime = etags.version("produtos")
+    validators = etags.headers(f'W/"produtos-v{ver}"', mtime)
+    if etags.not_modified(request, validators["ETag"], mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    response.headers.update(validators)
+    return [p._asdict() for p in db_pg.run_prepared("produtos")]
 
 @router.get("/produtos/{id}", response_model=Produto, tags=["Postgres - Produtos"], summary="Get a product by id")
-def get_produto(id: int):
-    rows = db_pg.query("SELECT * FROM public.produtos WHERE id = %s", (id,))
+def get_produto(id: int, request: Request, response: Response):
+    # coarse but cheap: any product write bumps the version, so validators never go stale
+    ver, mtime = etags.version("produtos")
+    validators = etags.headers(f'W/"produto-{id}-v{ver}"', mtime)
+    if etags.not_modified(request, validators["ETag"], mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    rows = db_pg.run_prepared("produto_por_id", id)
     if not rows:
         raise HTTPException(status_code=404, detail="produto not found")
-    return rows[0]
+    response.headers.update(validators)
+    return rows[0]._asdict()
 
 @router.post("/produtos", status_code=status.HTTP_201_CREATED, response_model=Produto, tags=["Postgres - Produtos"], summary="Create a new product")
 def create_produto(p: ProdutoIn):
@@ -415,6 +534,9 @@ def create_produto(p: ProdutoIn):
         raise HTTPException(status_code=500, detail="failed to create produto")
     new_id = res.get("id")
     new_row = db_pg.query("SELECT * FROM public.produtos WHERE id = %s", (new_id,))
+    interest_index.upsert_product(new_id, p.tipo)
+    etags.bump("produtos")
+    catalog_sync.schedule([new_id])
     return new_row[0]
 
 @router.put("/produtos/{id}", response_model=Produto, tags=["Postgres - Produtos"], summary="Update an existing product")
@@ -426,11 +548,17 @@ def update_produto(id: int, p: ProdutoIn):
     updated = db_pg.query("SELECT * FROM public.produtos WHERE id = %s", (id,))
     if not updated:
         raise HTTPException(status_code=404, detail="produto not found")
+    interest_index.upsert_product(id, p.tipo)
+    etags.bump("produtos")
+    catalog_sync.schedule([id])
     return updated[0]
 
 @router.delete("/produtos/{id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Postgres - Produtos"], summary="Delete a product")
 def delete_produto(id: int):
     db_pg.execute("DELETE FROM public.produtos WHERE id=%s;", (id,))
+    interest_index.remove_product(id)
+    etags.bump("produtos")
+    catalog_sync.schedule([id])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -452,31 +580,42 @@ class ProfileIn(BaseModel):
 
 @router.get("/profiles", tags=["Mongo - Profiles"], summary="List profiles")
 def list_profiles():
-    return [p for p in profiles.find({})]
+    return list(db_mongo.iter_profiles())
+
+@router.get("/profiles/search", tags=["Mongo - Profiles"], summary="Search profiles by interest and minimum age (cursor pagination)")
+def search_profiles(interesse: Optional[str] = None, idade_min: Optional[int] = None,
+                    cursor: Optional[str] = None, limit: int = 50):
+    items, next_cursor = db_mongo.search_profiles(interesse, idade_min, after=cursor, limit=min(max(1, limit), 500))
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/profiles/{id}", tags=["Mongo - Profiles"], summary="Get profile by id")
 def get_profile(id: str):
-    doc = profiles.find_one({"idCliente": str(id)})
+    doc = db_mongo.find_profile(id)
     if not doc:
         raise HTTPException(status_code=404, detail="profile not found")
     return doc
 
 @router.post("/profiles", status_code=status.HTTP_201_CREATED, tags=["Mongo - Profiles"], summary="Create a profile")
 def create_profile(p: ProfileIn):
-    profiles.insert_one(p.dict())
+    try:
+        profiles.insert_one(p.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="profile already exists for this idCliente")
+    interest_index.upsert_profile(p.idCliente, p.interesses)
     return p.dict()
 
 @router.put("/profiles/{id}", tags=["Mongo - Profiles"], summary="Update a profile")
 def update_profile(id: str, p: ProfileIn):
-    profiles.update_one({"idCliente": str(id)}, {"$set": p.dict()})
-    doc = profiles.find_one({"idCliente": str(id)})
+    doc = db_mongo.update_profile(id, p.dict())
     if not doc:
         raise HTTPException(status_code=404, detail="profile not found")
+    interest_index.upsert_profile(doc["idCliente"], doc.get("interesses"))
     return doc
 
 @router.delete("/profiles/{id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Mongo - Profiles"], summary="Delete a profile")
 def delete_profile(id: str):
     profiles.delete_one({"idCliente": str(id)})
+    interest_index.remove_profile(id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -493,18 +632,80 @@ def _serialize(doc: dict):
 def list_clientes():
     return [_serialize(d) for d in clientes.find({})]
 
+CLIENT_SEARCH_SQL = """
+SELECT id, external_id, cpf, nome, endereco, cidade, uf, email,
+       greatest(similarity(nome, %(q)s), similarity(email, %(q)s), similarity(cpf, %(q)s)) AS score
+FROM clientes
+WHERE nome ILIKE %(prefix)s OR email ILIKE %(prefix)s OR cpf LIKE %(prefix)s
+   OR nome %% %(q)s OR email %% %(q)s OR cpf %% %(q)s
+ORDER BY (nome ILIKE %(prefix)s OR email ILIKE %(prefix)s OR cpf LIKE %(prefix)s) DESC, score DESC, id
+LIMIT %(limit)s
+"""
+
+@router.get("/clientes/search", tags=["Clientes"], summary="Prefix and typo-tolerant search on nome, email and cpf")
+def search_clientes(q: str, limit: int = 20):
+    """Prefix matches come first, then fuzzy (trigram similarity) matches; served by pg_trgm GIN indexes."""
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = db_pg.query(CLIENT_SEARCH_SQL, {"q": q, "prefix": escaped + "%", "limit": min(max(1, limit), 100)})
+    for r in rows:
+        r["score"] = round(float(r["score"] or 0), 3)
+    return rows
+
+@router.get("/clientes/changes", tags=["Clientes"], summary="Server-Sent Events feed of consolidated client changes (resumable with Last-Event-ID)")
+async def clientes_changes(request: Request, last_event_id: Optional[str] = None):
+    """`cliente` events carry id, op (upsert/delete), version (ETag) and the changed facets; on a
+    `reset` event reload the listing once. Browsers resume with the Last-Event-ID header; other
+    clients can pass `last_event_id`."""
+    since = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        change_feed.events(request, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/clientes/{id}/compras", tags=["Clientes"], summary="Page through a client's purchases (most recent first, optional de/ate dates)")
+def get_cliente_compras(id: str, offset: int = 0, limit: int = 50, de: Optional[date] = None, ate: Optional[date] = None):
+    rows = list_client_compras(id, offset=max(0, offset), limit=min(max(1, limit), 500), de=de, ate=ate)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="cliente not found")
+    return rows
+
+@router.get("/clientes/{id}/compras/recentes", tags=["Clientes"], summary="A client's purchases from the last `dias` days")
+def get_cliente_compras_recentes(id: str, dias: int = 30, limit: int = 50):
+    de = date.today() - timedelta(days=max(0, dias))
+    rows = list_client_compras(id, limit=min(max(1, limit), 500), de=de)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="cliente not found")
+    return rows
+
 @router.get("/clientes/{id}", tags=["Clientes"], response_model=ConsolidatedCliente, summary="Get client by id (prefer Redis consolidated view)")
-def get_cliente_mongo(id: str):
+def get_cliente_mongo(id: str, request: Request, response: Response):
     # prefer the Redis consolidated object; if missing, build and replicate
-    data = redis_db.hget(f"cliente:{id}", "data")
+    try:
+        data, validators, validated = _read_cached_cliente(id, request)
+    except (BackendOverloaded, RedisError):
+        # cache unavailable: answer from the source stores instead of failing the read
+        data, validators, validated = None, {}, False
+    if data is NOT_MODIFIED:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    if data and validated:
+        return _json_bytes(data, validators)
     if data:
+        response.headers.update(validators)
         return json.loads(data)
 
     consolidado = build_consolidated_for_client(id)
     if not consolidado:
         raise HTTPException(status_code=404, detail="cliente not found")
 
-    replicate_client_to_redis(id, consolidado)
+    try:
+        replicate_client_to_redis(id, consolidado)
+        cache_rebuild("cliente")
+    except (BackendOverloaded, RedisError):
+        pass
     return consolidado
 
 @router.post("/clientes", status_code=status.HTTP_201_CREATED, tags=["Clientes"], response_model=ConsolidatedCliente, summary="Create a client across Postgres/Mongo/Neo4j and replicate to Redis")
@@ -524,8 +725,7 @@ def create_cliente(c: ClienteIn, background_tasks: BackgroundTasks):
     doc = {"_id": new_id, **c_data}
     clientes.insert_one(doc)
 
-    # Neo4j: ensure uniqueness constraint and create node
-    neo_run("CREATE CONSTRAINT IF NOT EXISTS FOR (p:Person) REQUIRE p.id IS UNIQUE;")
+    # Neo4j: create node (uniqueness constraint is ensured at startup)
     neo_run("MERGE (p:Person {id:$id}) SET p.nome=$nome RETURN p", {"id": new_id, "nome": c_data.get("nome")})
 
     # Build consolidated object and replicate to Redis in background
@@ -589,7 +789,7 @@ def delete_cliente(id: str):
     neo_run("MATCH (p:Person {id:$id}) DETACH DELETE p", {"id": id})
 
     # delete Redis key
-    redis_db.delete(f"cliente:{id}")
+    delete_client_from_redis(id)
 
     return consolidado
 
@@ -635,24 +835,23 @@ def neo_create_produto(p: NeoProdutoIn):
             "MERGE (p:Produto {id:$id}) SET p.produto=$produto, p.valor=$valor RETURN p",
             {"id": p.id, "produto": p.produto, "valor": p.valor}
         )
+        produto_ids.observe(p.id)
         return _serialize_neo(rows[0]["p"]) if rows else {}
 
-    # get max id
-    mx = neo_run("MATCH (p:Produto) RETURN max(p.id) AS max_id")
-    max_id = mx[0].get("max_id") if mx and mx[0].get("max_id") is not None else 0
-    new_id = int(max_id) + 1
-    rows = neo_run(
-        "CREATE (p:Produto {id:$id, produto:$produto, valor:$valor}) RETURN p",
-        {"id": new_id, "produto": p.produto, "valor": p.valor}
-    )
-    return _serialize_neo(rows[0]["p"]) if rows else {}
-
-    new_id = int(max_id) + 1
-    rows = neo_run(
-        "CREATE (p:Produto {id:$id, produto:$produto, valor:$valor}) RETURN p",
-        {"id": new_id, "produto": p.produto, "valor": p.valor}
-    )
-    return _serialize_neo(rows[0]["p"]) if rows else {}
+    # id comes from a hi/lo block reserved on the Neo4j id counter: no label scan, no race
+    # between workers; origem 'neo4j' keeps the catalog sync from overwriting it
+    for _ in range(ID_CREATE_ATTEMPTS):
+        new_id = produto_ids.next_id()
+        try:
+            rows = neo_run(
+                "CREATE (p:Produto {id:$id, produto:$produto, valor:$valor, origem:'neo4j'}) RETURN p",
+                {"id": new_id, "produto": p.produto, "valor": p.valor}
+            )
+        except ConstraintError:
+            # taken by an explicit id inside a block this worker had already reserved
+            continue
+        return _serialize_neo(rows[0]["p"]) if rows else {}
+    raise HTTPException(status_code=409, detail="could not allocate a free produto id")
 
 @router.put("/neo4j/produtos/{id}", tags=["Neo4j - Produtos"], summary="Update a product in Neo4j")
 def neo_update_produto(id: int, p: NeoProdutoIn):
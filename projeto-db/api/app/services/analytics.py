@@ -0,0 +1,155 @@
+from ..db.pg import query
+from ..db.redis_db import redis_db
+from .metrics import operation
+
+# sorted sets (member -> score) maintained on every purchase
+PRODUTO_QTD = "analytics:produto:quantidade"
+PRODUTO_RECEITA = "analytics:produto:receita"
+TIPO_RECEITA = "analytics:tipo:receita"
+DIA_COMPRAS = "analytics:dia:compras"
+# every day of DIA_COMPRAS with score 0, so a date range is one ZRANGEBYLEX (ISO dates sort as text)
+DIA_INDEX = "analytics:dia:index"
+CIDADE_RECEITA = "analytics:cidade:receita"
+CIDADE_COMPRAS = "analytics:cidade:compras"
+ALL_KEYS = [PRODUTO_QTD, PRODUTO_RECEITA, TIPO_RECEITA, DIA_COMPRAS, DIA_INDEX, CIDADE_RECEITA, CIDADE_COMPRAS]
+
+UNKNOWN = "desconhecido"
+
+# one scan of compras feeds every aggregate
+RECOMPUTE_SQL = """
+SELECT GROUPING(c.id_produto) AS g_produto, GROUPING(p.tipo) AS g_tipo,
+       GROUPING(c.data) AS g_data, GROUPING(cl.cidade) AS g_cidade,
+       c.id_produto, p.tipo, c.data, cl.cidade,
+       count(*) AS compras, coalesce(sum(p.valor), 0) AS receita
+FROM compras c
+LEFT JOIN produtos p ON p.id = c.id_produto
+LEFT JOIN clientes cl ON cl.id = c.id_cliente
+GROUP BY GROUPING SETS ((c.id_produto), (p.tipo), (c.data), (cl.cidade))
+"""
+
+
+def _label(value):
+    return str(value) if value is not None else UNKNOWN
+
+
+def _fold(pipe, id_produto, valor, tipo, data, cidade):
+    valor = float(valor or 0)
+    pipe.zincrby(PRODUTO_QTD, 1, id_produto)
+    pipe.zincrby(PRODUTO_RECEITA, valor, id_produto)
+    pipe.zincrby(TIPO_RECEITA, valor, _label(tipo))
+    pipe.zincrby(DIA_COMPRAS, 1, _label(data))
+    pipe.zadd(DIA_INDEX, {_label(data): 0})
+    pipe.zincrby(CIDADE_RECEITA, valor, _label(cidade))
+    pipe.zincrby(CIDADE_COMPRAS, 1, _label(cidade))
+
+
+def record_purchase(id_produto, valor, tipo, data, cidade):
+    """Fold one purchase into the aggregates (one pipelined round trip)."""
+    record_purchases([(id_produto, valor, tipo, data, cidade)])
+
+
+def record_purchases(purchases):
+    """Fold many (id_produto, valor, tipo, data, cidade) purchases in one pipelined round trip."""
+    if not purchases:
+        return
+    with operation("analytics.record"):
+        pipe = redis_db.pipeline(transaction=False)
+        for purchase in purchases:
+            _fold(pipe, *purchase)
+        pipe.execute()
+
+
+def recompute():
+    """Rebuild every aggregate from Postgres in one set-based pass and swap them in atomically."""
+    with operation("analytics.recompute"):
+        rows = query(RECOMPUTE_SQL)
+    fresh = {k: {} for k in ALL_KEYS}
+    for r in rows:
+        compras, receita = int(r["compras"]), float(r["receita"])
+        if r["g_produto"] == 0 and r["id_produto"] is not None:
+            fresh[PRODUTO_QTD][str(r["id_produto"])] = compras
+            fresh[PRODUTO_RECEITA][str(r["id_produto"])] = receita
+        elif r["g_tipo"] == 0:
+            fresh[TIPO_RECEITA][_label(r["tipo"])] = receita
+        elif r["g_data"] == 0:
+            fresh[DIA_COMPRAS][_label(r["data"])] = compras
+            fresh[DIA_INDEX][_label(r["data"])] = 0
+        elif r["g_cidade"] == 0:
+            fresh[CIDADE_RECEITA][_label(r["cidade"])] = receita
+            fresh[CIDADE_COMPRAS][_label(r["cidade"])] = compras
+
+    with operation("analytics.recompute"):
+        # the hash tag keeps each tmp key on the same Redis node as the key it is renamed to;
+        # a tmp key left behind by a failed run is dropped first, not merged into the new one
+        pipe = redis_db.pipeline(transaction=True)
+        for key, members in fresh.items():
+            if members:
+                pipe.delete(f"{{{key}}}:tmp")
+                pipe.zadd(f"{{{key}}}:tmp", members)
+        pipe.execute()
+        # readers see either the old or the new aggregates, never a partial set
+        swap = redis_db.pipeline(transaction=True)
+        for key, members in fresh.items():
+            if members:
+                swap.rename(f"{{{key}}}:tmp", key)
+            else:
+                swap.delete(key)
+        swap.execute()
+    return {k.split(":", 1)[1]: len(v) for k, v in fresh.items()}
+
+
+def top_produtos(by="receita", limit=10):
+    key = PRODUTO_RECEITA if by == "receita" else PRODUTO_QTD
+    ranked = redis_db.zrevrange(key, 0, limit - 1, withscores=True)
+    if not ranked:
+        return []
+    ids = [int(pid) for pid, _ in ranked]
+    with operation("analytics.produtos"):
+        names = {r["id"]: r for r in query("SELECT id, produto, tipo FROM produtos WHERE id = ANY(%s)", (ids,))}
+    other = PRODUTO_QTD if key == PRODUTO_RECEITA else PRODUTO_RECEITA
+    other_scores = redis_db.zmscore(other, [pid for pid, _ in ranked])
+    result = []
+    for (pid, score), other_score in zip(ranked, other_scores):
+        receita, qtd = (score, other_score) if key == PRODUTO_RECEITA else (other_score, score)
+        prod = names.get(int(pid), {})
+        result.append({
+            "id_produto": int(pid),
+            "produto": prod.get("produto"),
+            "tipo": prod.get("tipo"),
+            "compras": int(qtd or 0),
+            "receita": round(receita or 0, 2),
+        })
+    return result
+
+
+def receita_por_tipo():
+    return [{"tipo": t, "receita": round(v, 2)} for t, v in redis_db.zrevrange(TIPO_RECEITA, 0, -1, withscores=True)]
+
+
+def _day_index():
+    # aggregates written before DIA_INDEX existed: index their days once
+    if not redis_db.exists(DIA_INDEX):
+        days = redis_db.zrange(DIA_COMPRAS, 0, -1)
+        if days:
+            redis_db.zadd(DIA_INDEX, {d: 0 for d in days})
+
+
+def compras_por_dia(de=None, ate=None):
+    """Purchases per day in [de, ate]; only the days in the range are read."""
+    _day_index()
+    days = redis_db.zrangebylex(DIA_INDEX, f"[{de}" if de else "-", f"[{ate}" if ate else "+")
+    if de is not None or ate is not None:
+        days = [d for d in days if d != UNKNOWN]
+    if not days:
+        return []
+    counts = redis_db.zmscore(DIA_COMPRAS, days)
+    return [{"data": d, "compras": int(n or 0)} for d, n in zip(days, counts)]
+
+
+def vendas_por_cidade():
+    pipe = redis_db.pipeline(transaction=False)
+    pipe.zrevrange(CIDADE_RECEITA, 0, -1, withscores=True)
+    pipe.zrange(CIDADE_COMPRAS, 0, -1, withscores=True)
+    receita, compras = pipe.execute()
+    compras = dict(compras)
+    return [{"cidade": c, "receita": round(v, 2), "compras": int(compras.get(c, 0))} for c, v in receita]
@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import errorcodes
+
+from ..db import pg, mongo, neo4j, redis_db
+from . import cache_generations, compras_partitions
+from .bulkhead import priority, LOW
+from .cache_refresher import build_consolidated_for_client, replicate_client_to_redis
+
+log = logging.getLogger(__name__)
+
+PG_INDEXES = [
+    # databases created before external_id was part of 01_schema.sql
+    "ALTER TABLE clientes ADD COLUMN IF NOT EXISTS external_id VARCHAR(64);",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_external_id ON clientes (external_id);",
+    "CREATE INDEX IF NOT EXISTS idx_compras_id_cliente ON compras (id_cliente);",
+    "CREATE INDEX IF NOT EXISTS idx_compras_id_produto ON compras (id_produto);",
+    # a unique index on partitioned compras must include the partition key (data); NULLS NOT
+    # DISTINCT also covers the undated rows of the default partition
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_compras_id_data ON compras (id, data) NULLS NOT DISTINCT;",
+    # date-range reads: per client (btree) and over time (BRIN, tiny since data follows insertion order)
+    "CREATE INDEX IF NOT EXISTS idx_compras_cliente_data ON compras (id_cliente, data);",
+    "CREATE INDEX IF NOT EXISTS idx_compras_data_brin ON compras USING brin (data);",
+    # trigram indexes back /clientes/search (prefix ILIKE and fuzzy % matching)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_nome_trgm ON clientes USING gin (nome gin_trgm_ops);",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_email_trgm ON clientes USING gin (email gin_trgm_ops);",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_cpf_trgm ON clientes USING gin (cpf gin_trgm_ops);",
+]
+
+# every worker bootstraps at once; the DDL runs one worker at a time, the later ones find it done
+SCHEMA_LOCK = "SELECT pg_advisory_xact_lock(hashtext('bootstrap_schema'))"
+# the only errors that mean the object is already there; anything else is a real failure
+ALREADY_EXISTS = {errorcodes.DUPLICATE_OBJECT, errorcodes.DUPLICATE_TABLE, errorcodes.DUPLICATE_COLUMN}
+
+# /clientes/search silently degrades to sequential scans without these
+SEARCH_INDEXES = ("idx_clientes_nome_trgm", "idx_clientes_email_trgm", "idx_clientes_cpf_trgm")
+
+# readiness state shared with /readyz
+state = {"ready": False, "steps": {}, "error": None}
+
+
+def ensure_schema():
+    """Create constraints and indexes once per process (all statements are idempotent)."""
+    errors = {}
+    try:
+        neo4j.ensure_constraints()
+    except Exception as e:
+        errors["neo4j"] = str(e)
+    try:
+        mongo.ensure_indexes()
+    except Exception as e:
+        errors["mongo"] = str(e)
+    try:
+        # before the indexes, so a compras converted by COMPRAS_PARTITION_MIGRATE=1 gets them too
+        compras_partitions.ensure()
+    except Exception as e:
+        errors.setdefault("postgres", []).append(str(e))
+    try:
+        failed = _postgres_ddl()
+        failed += _missing_search_indexes()
+    except Exception as e:
+        failed = [str(e)]
+    if failed:
+        errors.setdefault("postgres", []).extend(failed)
+    for store, err in errors.items():
+        log.error("schema bootstrap failed for %s: %s", store, err)
+    return errors
+
+
+def _missing_search_indexes():
+    rows = pg.query("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(SEARCH_INDEXES),), primary=True)
+    missing = sorted(set(SEARCH_INDEXES) - {r["indexname"] for r in rows})
+    if missing:
+        return [f"trigram indexes missing ({', '.join(missing)}): /clientes/search falls back to sequential scans"]
+    return []
+
+
+def _postgres_ddl():
+    """Run PG_INDEXES under SCHEMA_LOCK, one savepoint per statement; returns the failures."""
+    failed = []
+    with pg.transaction() as run:
+        # waiting for another worker's index builds must not count against the batch timeout
+        run("SET LOCAL statement_timeout = 0")
+        run(SCHEMA_LOCK)
+        for stmt in PG_INDEXES:
+            run("SAVEPOINT ddl")
+            try:
+                run(stmt)
+            except psycopg2.Error as e:
+                run("ROLLBACK TO SAVEPOINT ddl")
+                if e.pgcode not in ALREADY_EXISTS:
+                    failed.append(f"{stmt} {e.pgcode}: {e}".strip())
+    return failed
+
+
+def warm_up_connections():
+    # raises if any store is unreachable so the caller can retry
+    pg.warm_up()
+    mongo.warm_up()
+    neo4j.warm_up()
+    redis_db.warm_up()
+
+
+def prime_cache(limit):
+    """Build and replicate the consolidated view of the `limit` most recently active clients."""
+    if limit <= 0:
+        return 0
+    rows = pg.query(
+        """
+        SELECT c.id, c.external_id
+        FROM clientes c JOIN compras co ON co.id_cliente = c.id
+        GROUP BY c.id, c.external_id
+        ORDER BY max(co.data) DESC NULLS LAST, max(co.id) DESC
+        LIMIT %s
+        """,
+        (limit,),
+    )
+    primed = 0
+    for r in rows:
+        cid = str(r["external_id"]) if r.get("external_id") else str(r["id"])
+        if redis_db.redis_client.exists(cache_generations.cliente_key(cid)):
+            continue
+        consolidado = build_consolidated_for_client(cid)
+        if consolidado:
+            replicate_client_to_redis(cid, consolidado)
+            primed += 1
+    return primed
+
+
+def run_bootstrap():
+    """Wait for the stores, then set up the schema and prime the cache; /readyz answers once done.
+
+    Warm-up is retried until it succeeds: the delay doubles from BOOTSTRAP_RETRY_DELAY up to
+    BOOTSTRAP_RETRY_MAX_DELAY, so a store that comes up late still brings the worker into rotation.
+    """
+    delay = float(os.getenv("BOOTSTRAP_RETRY_DELAY", "2"))
+    max_delay = float(os.getenv("BOOTSTRAP_RETRY_MAX_DELAY", "30"))
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            warm_up_connections()
+            break
+        except Exception as e:
+            state["error"] = f"warm-up attempt {attempt} failed: {e}"
+            log.warning(state["error"])
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    state["steps"]["warm_up"] = "ok"
+
+    errors = ensure_schema()
+    state["steps"]["schema"] = errors or "ok"
+
+    try:
+        primed = prime_cache(int(os.getenv("CACHE_PRIME_LIMIT", "0")))
+        state["steps"]["prime_cache"] = primed
+    except Exception as e:
+        # a cold cache is not a reason to stay out of rotation
+        state["steps"]["prime_cache"] = f"failed: {e}"
+
+    state["error"] = None
+    state["ready"] = True
+    return True
+
+
+def start_bootstrap():
+    """Run the bootstrap in a background thread so liveness answers while stores come up."""
+    def _run():
+        with priority(LOW):
+            run_bootstrap()
+
+    t = threading.Thread(target=_run, name="bootstrap", daemon=True)
+    t.start()
+    return t
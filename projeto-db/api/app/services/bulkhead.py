@@ -0,0 +1,156 @@
+import contextvars
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge
+
+HIGH = "high"
+LOW = "low"
+
+# expensive endpoints run in the low priority class: they may not use the reserved permits
+LOW_PRIORITY_PATHS = [
+    re.compile(p) for p in os.getenv(
+        "LOW_PRIORITY_PATHS",
+        r"^/cache/refresh$,^/seed/run$,^/replicar$,^/analytics/recompute$,/recomendacoes$,^/catalog/sync$,^/compras/partitions/maintain$",
+    ).split(",") if p
+]
+
+IN_USE = Gauge("bulkhead_in_use", "Permits in use per backend", ["backend"], multiprocess_mode="livesum")
+WAITING = Gauge("bulkhead_waiting", "Callers queued per backend", ["backend"], multiprocess_mode="livesum")
+REJECTED = Counter("bulkhead_rejected_total", "Calls shed because the backend queue was full or the wait timed out",
+                   ["backend", "priority"])
+
+_priority = contextvars.ContextVar("priority", default=HIGH)
+
+
+class BackendOverloaded(Exception):
+    def __init__(self, backend, retry_after):
+        super().__init__(f"{backend} is overloaded")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """Caps concurrent calls to one backend, with a bounded wait queue.
+
+    `reserved` permits are only handed to high priority callers, so batch traffic can never
+    take the last slots away from the cheap interactive endpoints.
+    """
+
+    def __init__(self, name, limit, queue, timeout, reserved=0, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.reserved = min(reserved, limit - 1)
+        self.retry_after = retry_after
+        self.in_use = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def _reject(self, priority):
+        REJECTED.labels(self.name, priority).inc()
+        raise BackendOverloaded(self.name, self.retry_after)
+
+    @contextmanager
+    def acquire(self, priority=HIGH):
+        cap = self.limit if priority == HIGH else self.limit - self.reserved
+        with self._cond:
+            if self.in_use >= cap:
+                if self.waiting >= self.queue:
+                    self._reject(priority)
+                self.waiting += 1
+                WAITING.labels(self.name).set(self.waiting)
+                try:
+                    ok = self._cond.wait_for(lambda: self.in_use < cap, self.timeout)
+                finally:
+                    self.waiting -= 1
+                    WAITING.labels(self.name).set(self.waiting)
+                if not ok:
+                    self._reject(priority)
+            self.in_use += 1
+            IN_USE.labels(self.name).set(self.in_use)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= 1
+                IN_USE.labels(self.name).set(self.in_use)
+                self._cond.notify_all()
+
+
+def _from_env(name, limit, queue, timeout_ms, reserved):
+    prefix = f"BULKHEAD_{name.upper()}"
+    return Bulkhead(
+        name,
+        limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+        queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT_MS", timeout_ms)) / 1000,
+        reserved=int(os.getenv(f"{prefix}_RESERVED", reserved)),
+    )
+
+
+BULKHEADS = {
+    "postgres": _from_env("postgres", 10, 50, 500, 3),
+    "mongo": _from_env("mongo", 20, 100, 500, 5),
+    "neo4j": _from_env("neo4j", 8, 30, 500, 3),
+    "redis": _from_env("redis", 64, 256, 200, 16),
+}
+
+
+@contextmanager
+def guard(backend):
+    """Admit one backend call: fail fast if its circuit is open, then take a bulkhead permit.
+
+    Transient failures (timeouts, lost connections) inside the block are reported to the breaker.
+    """
+    breaker = circuit_breaker.BREAKERS[backend]
+    breaker.before_call()
+    with BULKHEADS[backend].acquire(_priority.get()):
+        failed = False
+        try:
+            yield
+        except Exception as e:
+            if circuit_breaker.is_transient(backend, e):
+                failed = True
+                breaker.record_failure()
+            raise
+        finally:
+            if not failed:
+                breaker.record_success()
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def priority_for_path(path):
+    return LOW if any(p.search(path) for p in LOW_PRIORITY_PATHS) else HIGH
+
+
+class PriorityMiddleware:
+    """Assigns the priority class of each request from its path (see LOW_PRIORITY_PATHS)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with priority(priority_for_path(scope["path"])):
+            await self.app(scope, receive, send)
+
+
+from . import circuit_breaker  # noqa: E402  (imports BackendOverloaded from this module)
@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+import time
+
+from ..db.redis_db import redis_db
+from .metrics import operation
+
+log = logging.getLogger(__name__)
+
+ACTIVE_KEY = "cache:generation"
+# hash-tagged to ACTIVE_KEY's node, so the flip in commit_build stays one MULTI/EXEC when sharded
+BUILDING_KEY = "{cache:generation}:building"
+SEQ_KEY = "{cache:generation}:seq"
+# readers cache the active generation for this long, so a read costs no extra round trip
+POINTER_CACHE_SECONDS = float(os.getenv("CACHE_GENERATION_POINTER_CACHE", "1.0"))
+# old generations are dropped only after every worker has seen the flip
+DROP_GRACE_SECONDS = float(os.getenv("CACHE_GENERATION_DROP_GRACE", "10"))
+# a refresh that dies without committing releases the building slot after this long
+BUILD_TIMEOUT_SECONDS = int(os.getenv("CACHE_GENERATION_BUILD_TIMEOUT", "3600"))
+
+_cached = {"at": 0.0, "active": None, "building": None}
+_lock = threading.Lock()
+
+
+def _load_pointers(force=False):
+    now = time.monotonic()
+    with _lock:
+        if not force and _cached["active"] is not None and now - _cached["at"] < POINTER_CACHE_SECONDS:
+            return _cached["active"], _cached["building"]
+    active, building = redis_db.mget(ACTIVE_KEY, BUILDING_KEY)
+    if active is None:
+        # first use (or after a flush): generation 1 becomes active
+        redis_db.set(ACTIVE_KEY, 1, nx=True)
+        active = redis_db.get(ACTIVE_KEY)
+    active, building = int(active), int(building) if building else None
+    with _lock:
+        _cached.update(at=now, active=active, building=building)
+    return active, building
+
+
+def active_generation():
+    return _load_pointers()[0]
+
+
+def write_generations():
+    """Generations a single-client write must go to: the active one plus one being built, if any."""
+    active, building = _load_pointers()
+    return [active] if building in (None, active) else [active, building]
+
+
+def cliente_key(cid, generation=None):
+    if generation is None:
+        generation = active_generation()
+    return f"cliente:g{generation}:{cid}"
+
+
+def cliente_pattern(generation=None):
+    if generation is None:
+        generation = active_generation()
+    return f"cliente:g{generation}:*"
+
+
+def begin_build():
+    """Reserve generation N+1 for a full rebuild; returns None when another rebuild is running."""
+    active, _ = _load_pointers(force=True)
+    # keep the sequence ahead of the active generation (e.g. after a flush)
+    seq = redis_db.incr(SEQ_KEY)
+    if seq <= active:
+        redis_db.set(SEQ_KEY, active + 1)
+        seq = active + 1
+    if not redis_db.set(BUILDING_KEY, seq, nx=True, ex=BUILD_TIMEOUT_SECONDS):
+        return None
+    _load_pointers(force=True)
+    return seq
+
+
+def commit_build(generation):
+    """Atomically flip the active pointer to `generation` and drop the previous one in the background."""
+    previous = _load_pointers(force=True)[0]
+    pipe = redis_db.pipeline(transaction=True)
+    pipe.set(ACTIVE_KEY, generation)
+    pipe.delete(BUILDING_KEY)
+    pipe.execute()
+    _load_pointers(force=True)
+    if previous != generation:
+        threading.Thread(target=_drop_generation, args=(previous,), name=f"drop-gen-{previous}", daemon=True).start()
+
+
+def abort_build(generation):
+    redis_db.delete(BUILDING_KEY)
+    _load_pointers(force=True)
+    threading.Thread(target=_drop_generation, args=(generation, 0), daemon=True).start()
+
+
+def _drop_generation(generation, grace=None):
+    time.sleep(DROP_GRACE_SECONDS if grace is None else grace)
+    try:
+        with operation("cache_generation.drop"):
+            batch = []
+            for key in redis_db.scan_iter(match=cliente_pattern(generation), count=1000):
+                batch.append(key)
+                if len(batch) >= 500:
+                    redis_db.unlink(*batch)
+                    batch = []
+            if batch:
+                redis_db.unlink(*batch)
+    except Exception as e:
+        log.warning("could not drop cache generation %s: %s", generation, e)
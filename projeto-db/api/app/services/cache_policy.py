@@ -0,0 +1,81 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ..db.redis_db import redis_db
+from .bulkhead import priority, LOW
+
+log = logging.getLogger(__name__)
+
+# seconds; 0 disables expiry for the namespace
+TTLS = {
+    "cliente": int(os.getenv("CACHE_TTL_CLIENTE", "3600")),
+    "recomendacoes": int(os.getenv("CACHE_TTL_RECOMENDACOES", "900")),
+    # consolidated clients built while a facet was unavailable
+    "parcial": int(os.getenv("CACHE_TTL_PARCIAL", "30")),
+}
+# most recent purchases kept inline in a cached client; the rest is paged from /clientes/{id}/compras
+MAX_COMPRAS = int(os.getenv("CACHE_MAX_COMPRAS", "50"))
+# consolidated clients only load purchases from the last N days (0 = whole history)
+COMPRAS_DIAS = int(os.getenv("CACHE_COMPRAS_DIAS", "90"))
+# rebuild in the background when a read sees less than this fraction of the TTL left
+REFRESH_AHEAD = float(os.getenv("CACHE_REFRESH_AHEAD", "0.2"))
+REFRESH_LOCK_SECONDS = 30
+
+_refresher = ThreadPoolExecutor(max_workers=int(os.getenv("CACHE_REFRESH_WORKERS", "2")), thread_name_prefix="refresh-ahead")
+
+
+def ttl_for(namespace):
+    return TTLS.get(namespace) or None
+
+
+def compras_desde(today=None):
+    """First day of the purchase window held by consolidated clients, or None for the whole history."""
+    if COMPRAS_DIAS <= 0:
+        return None
+    return (today or datetime.date.today()) - datetime.timedelta(days=COMPRAS_DIAS)
+
+
+def _compra_sort_key(compra):
+    return (str(compra.get("data") or ""), compra.get("id") or 0)
+
+
+def shape(cid, consolidado):
+    """Return the cached form of a consolidated client: compras capped at the most recent MAX_COMPRAS."""
+    compras = consolidado.get("compras") or []
+    if MAX_COMPRAS <= 0 or len(compras) <= MAX_COMPRAS:
+        return consolidado
+    recent = sorted(compras, key=_compra_sort_key, reverse=True)[:MAX_COMPRAS]
+    return {
+        **consolidado,
+        "compras": recent,
+        "compras_total": len(compras),
+        "compras_next": f"/clientes/{cid}/compras?offset={MAX_COMPRAS}&limit={MAX_COMPRAS}",
+    }
+
+
+def needs_refresh(namespace, ttl_remaining):
+    ttl = TTLS.get(namespace)
+    if not ttl or ttl_remaining is None or ttl_remaining < 0:
+        return False
+    return ttl_remaining < ttl * REFRESH_AHEAD
+
+
+def schedule_refresh(namespace, cid, rebuild):
+    """Run `rebuild(cid)` in the background, at most once per key across workers (SET NX lock)."""
+    lock = f"refresh:{namespace}:{cid}"
+    if not redis_db.set(lock, "1", nx=True, ex=REFRESH_LOCK_SECONDS):
+        return False
+
+    def _run():
+        try:
+            with priority(LOW):
+                rebuild(cid)
+        except Exception as e:
+            log.warning("refresh-ahead of %s:%s failed: %s", namespace, cid, e)
+        finally:
+            redis_db.delete(lock)
+
+    _refresher.submit(_run)
+    return True
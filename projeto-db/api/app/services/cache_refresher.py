@@ -1,36 +1,85 @@
-from ..db.pg import query
-from ..db.mongo import profiles
+from ..db.pg import query, run_prepared
+from ..db.mongo import iter_profiles, find_profile
 from ..db.neo4j import run_query
 from ..db.redis_db import redis_db
+from .metrics import operation
+from ..models import ConsolidatedCliente
+from . import cache_policy, cache_generations, interest_index, analytics, etags, change_feed
+from concurrent.futures import ThreadPoolExecutor, wait
+from prometheus_client import Counter
+from pydantic import ValidationError
+import contextvars
 import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+CONTENT_WEIGHT = float(os.getenv("RECOMMENDATION_CONTENT_WEIGHT", "0.5"))
+# how long a consolidated read waits for its optional facets before answering without them
+FACET_DEADLINE = float(os.getenv("CONSOLIDATE_DEADLINE_MS", "800")) / 1000
+_facet_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CONSOLIDATE_WORKERS", "16")), thread_name_prefix="facet")
+
+FACET_DEGRADED = Counter("consolidated_facet_degraded_total", "Facets served from cache or left out", ["facet"])
 
 def clear_cache():
     redis_db.flushdb()
+    change_feed.publish_reset("flush")
 
 
 def refresh_cache():
+    """Rebuild every client into a fresh cache generation and swap it in atomically.
+
+    Readers keep using the active generation during the rebuild; returns False if
+    another full refresh is already running.
+    """
+    generation = cache_generations.begin_build()
+    if generation is None:
+        return False
+    try:
+        _build_generation(generation)
+    except Exception:
+        cache_generations.abort_build(generation)
+        raise
+    cache_generations.commit_build(generation)
+    etags.bump("clientes")
+    change_feed.publish_reset("refresh", generation=generation)
+    analytics.recompute()
+    return True
+
+
+def _build_generation(generation):
 
     # Postgres
-    clientes = query("SELECT * FROM clientes;")
-    compras = query("SELECT * FROM compras;")
-    produtos = query("SELECT * FROM produtos;")
+    with operation("refresh_cache.postgres"):
+        clientes = query("SELECT * FROM clientes;")
+        # only the recent window: older partitions are never read by a full rebuild
+        desde = cache_policy.compras_desde()
+        if desde:
+            compras = query("SELECT * FROM compras WHERE data >= %s;", (desde,))
+        else:
+            compras = query("SELECT * FROM compras;")
+        produtos = query("SELECT * FROM produtos;")
 
     # Mongo
-    perfil_map = {p["idCliente"]: p for p in profiles.find({})}
+    with operation("refresh_cache.perfil"):
+        perfil_map = {p["idCliente"]: p for p in iter_profiles()}
 
     # Neo4j
-    neo = run_query("""
-        MATCH (p:Person)-[:FRIEND]->(f:Person)
-        RETURN p, collect(f) AS amigos
-    """)
+    with operation("refresh_cache.amigos"):
+        neo = run_query("""
+            MATCH (p:Person)-[:FRIEND]->(f:Person)
+            RETURN p, collect(f) AS amigos
+        """)
 
     amizade_map = {}
     for r in neo:
         pid = r["p"]["id"]
         amizade_map[pid] = [dict(f) for f in r["amigos"]]
 
-    # Consolidação → salvar no Redis
-    for c in clientes:
+    # Consolidação → salvar no Redis (pipelined, flushed every 500 clients)
+    pipe = redis_db.pipeline(transaction=False)
+    for n, c in enumerate(clientes, start=1):
         # prefer external_id (UUID) when present; fall back to integer id for legacy rows
         pid_int = c.get("id")
         external = c.get("external_id")
@@ -47,61 +96,224 @@ def refresh_cache():
             "amigos": amizade_map.get(cid, []),
             "compras": compras_cliente
         }
+        if desde:
+            consolidado["compras_desde"] = desde.isoformat()
 
-        redis_db.hset(f"cliente:{cid}", "data", json.dumps(consolidado, default=str))
-
-    return True
+        _cache_client(pipe, cid, consolidado, [generation])
+        if n % 500 == 0:
+            with operation("refresh_cache.write"):
+                pipe.execute()
+    with operation("refresh_cache.write"):
+        pipe.execute()
 
 
 # --- helper: build/replicate single client ---
-def build_consolidated_for_client(cid: str):
+def find_client_row(cid: str):
     # try external_id (UUID-like) first, else try integer id
     client_row = None
-    if isinstance(cid, str) and "-" in cid:
-        rows = query("SELECT * FROM clientes WHERE external_id = %s", (cid,))
-        client_row = rows[0] if rows else None
-    if not client_row:
-        try:
-            pid = int(cid)
-            rows = query("SELECT * FROM clientes WHERE id = %s", (pid,))
+    with operation("build_consolidated.cliente"):
+        if isinstance(cid, str) and "-" in cid:
+            rows = run_prepared("cliente_por_external_id", cid)
             client_row = rows[0] if rows else None
-        except Exception:
-            client_row = None
+        if not client_row:
+            try:
+                pid = int(cid)
+                rows = run_prepared("cliente_por_id", pid)
+                client_row = rows[0] if rows else None
+            except Exception:
+                client_row = None
+    return client_row
+
+
+def _load_compras(pid_int):
+    desde = cache_policy.compras_desde()
+    with operation("build_consolidated.compras"):
+        if desde:
+            compras = run_prepared("compras_recentes_do_cliente", pid_int, desde)
+        else:
+            compras = run_prepared("compras_do_cliente", pid_int)
+    with operation("build_consolidated.produtos"):
+        produtos = {p.id: p for p in run_prepared("produtos")}
+    # records become dicts here, where they enter the consolidated (response/cache) shape
+    return [
+        {**comp._asdict(), "produto": produtos[comp.id_produto]._asdict() if comp.id_produto in produtos else None}
+        for comp in compras
+    ]
 
-    if not client_row:
-        return None
 
-    pid_int = client_row.get("id")
-    compras = query("SELECT * FROM compras WHERE id_cliente = %s", (pid_int,))
-    produtos = query("SELECT * FROM produtos;")
-    perfil = profiles.find_one({"idCliente": str(cid)})
+def _load_perfil(cid):
+    with operation("build_consolidated.perfil"):
+        return find_profile(cid)
 
-    neo_rows = run_query("MATCH (p:Person {id:$id})-[:FRIEND]->(f:Person) RETURN collect(f) AS amigos", {"id": str(cid)})
-    amigos = [dict(f) for f in neo_rows[0]["amigos"]] if neo_rows else []
 
-    compras_cliente = [
-        {**comp, "produto": next((p for p in produtos if p["id"] == comp["id_produto"]), None)}
-        for comp in compras
-    ]
+def _load_amigos(cid):
+    with operation("build_consolidated.amigos"):
+        neo_rows = run_query("MATCH (p:Person {id:$id})-[:FRIEND]->(f:Person) RETURN collect(f) AS amigos", {"id": str(cid)})
+    return [dict(f) for f in neo_rows[0]["amigos"]] if neo_rows else []
+
+
+# optional facets of a consolidated client: loader and the value used when nothing else is available
+FACETS = {
+    "perfil": (_load_perfil, None),
+    "amigos": (_load_amigos, []),
+    "compras": (_load_compras, []),
+}
 
-    consolidado = {
-        "cliente": client_row,
-        "perfil": perfil,
-        "amigos": amigos,
-        "compras": compras_cliente
-    }
 
+def _cached_facets(cid: str):
+    try:
+        data = redis_db.hget(cache_generations.cliente_key(cid), "data")
+        return json.loads(data) if data else {}
+    except Exception:
+        return {}
+
+
+def build_consolidated_for_client(cid: str, partial: bool = True):
+    """Build the consolidated view of one client.
+
+    The client row is required; perfil, amigos and compras are loaded in parallel. With
+    `partial`, facets that fail or miss CONSOLIDATE_DEADLINE_MS fall back to the last cached
+    value (or are left empty) and are listed in `facetas_degradadas` ("cache" / "indisponivel"),
+    so one slow store cannot stretch the whole request.
+    """
+    client_row = find_client_row(cid)
+    if not client_row:
+        return None
+
+    args = {"perfil": cid, "amigos": cid, "compras": client_row.id}
+    # each task gets its own copy of the context (operation label, priority, active profile)
+    futures = {
+        name: _facet_pool.submit(contextvars.copy_context().run, loader, args[name])
+        for name, (loader, _) in FACETS.items()
+    }
+    done, _ = wait(futures.values(), timeout=FACET_DEADLINE if partial else None)
+
+    consolidado = {"cliente": client_row._asdict()}
+    degradadas = {}
+    cached = None
+    for name, future in futures.items():
+        if not partial:
+            consolidado[name] = future.result()
+            continue
+        if future in done and future.exception() is None:
+            consolidado[name] = future.result()
+            continue
+        reason = "timeout" if future not in done else type(future.exception()).__name__
+        log.warning("facet %s of cliente %s degraded: %s", name, cid, reason)
+        FACET_DEGRADED.labels(name).inc()
+        if cached is None:
+            cached = _cached_facets(cid)
+        if name in cached and (cached.get("facetas_degradadas") or {}).get(name) != "indisponivel":
+            consolidado[name] = cached[name]
+            degradadas[name] = "cache"
+        else:
+            consolidado[name] = FACETS[name][1]
+            degradadas[name] = "indisponivel"
+    desde = cache_policy.compras_desde()
+    if desde:
+        consolidado["compras_desde"] = desde.isoformat()
+    if degradadas:
+        consolidado["facetas_degradadas"] = degradadas
     return consolidado
 
 
+def list_client_compras(cid: str, offset: int = 0, limit: int = 50, de=None, ate=None):
+    """Page through a client's purchases, most recent first (the cached view only holds the newest ones).
+
+    `de`/`ate` (inclusive dates) restrict the range, so only the matching monthly partitions are read.
+    """
+    client_row = find_client_row(cid)
+    if not client_row:
+        return None
+    where, params = ["c.id_cliente = %(id)s"], {"id": client_row.id, "offset": offset, "limit": limit}
+    if de is not None:
+        where.append("c.data >= %(de)s")
+        params["de"] = de
+    if ate is not None:
+        where.append("c.data <= %(ate)s")
+        params["ate"] = ate
+    with operation("client_compras.page"):
+        rows = query(
+            f"""
+            SELECT c.*, row_to_json(p.*) AS produto
+            FROM compras c LEFT JOIN produtos p ON p.id = c.id_produto
+            WHERE {" AND ".join(where)}
+            ORDER BY c.data DESC NULLS LAST, c.id DESC
+            OFFSET %(offset)s LIMIT %(limit)s
+            """,
+            params,
+        )
+    return rows
+
+
+def _serialize(cid: str, consolidado: dict):
+    """Return (payload, validated): the cached JSON, in the exact shape /clientes/{id} responds with.
+
+    Validation runs once here, so reads of a validated payload can send its bytes unchanged.
+    """
+    payload = json.dumps(cache_policy.shape(cid, consolidado), default=str)
+    try:
+        return ConsolidatedCliente.model_validate_json(payload).model_dump_json(), True
+    except ValidationError as e:
+        log.warning("cliente %s cached without validation: %s", cid, e.errors()[:3])
+        return payload, False
+
+
+def _cache_client(pipe, cid: str, consolidado: dict, generations):
+    payload, validated = _serialize(cid, consolidado)
+    # validators are computed once at write time so conditional GETs never touch the payload
+    fields = {"data": payload, "etag": etags.make_etag(payload), "mtime": etags.http_date(), "validated": int(validated),
+              "facets": json.dumps(change_feed.facet_hashes(consolidado), separators=(",", ":"))}
+    # a degraded record only lives briefly, so the next read rebuilds it from healthy stores
+    ttl = cache_policy.ttl_for("parcial" if consolidado.get("facetas_degradadas") else "cliente")
+    for generation in generations:
+        key = cache_generations.cliente_key(cid, generation)
+        pipe.hset(key, mapping=fields)
+        if ttl:
+            pipe.expire(key, ttl)
+    return fields
+
+
 def replicate_client_to_redis(cid: str, consolidado: dict):
-    redis_db.hset(f"cliente:{cid}", "data", json.dumps(consolidado, default=str))
+    # also write into a generation being rebuilt, so the swap does not lose this update
+    with operation("replicate_client"):
+        previous = redis_db.hget(cache_generations.cliente_key(cid), "facets")
+        pipe = redis_db.pipeline(transaction=False)
+        fields = _cache_client(pipe, cid, consolidado, cache_generations.write_generations())
+        changed = change_feed.changed_facets(json.loads(previous) if previous else None, json.loads(fields["facets"]))
+        # an identical rebuild (e.g. refresh-ahead) only renews the entry: listing ETag and
+        # subscribers are left alone
+        if changed:
+            etags.bump("clientes", pipe)
+            change_feed.publish(pipe, cid, "upsert", fields["etag"], changed)
+        pipe.execute()
+
+
+def delete_client_from_redis(cid: str):
+    keys = [cache_generations.cliente_key(cid, g) for g in cache_generations.write_generations()]
+    pipe = redis_db.pipeline(transaction=False)
+    pipe.delete(*keys)
+    etags.bump("clientes", pipe)
+    change_feed.publish(pipe, cid, "delete")
+    pipe.execute()
+
+
+def rebuild_client(cid: str):
+    """Rebuild and replicate one client; used by refresh-ahead."""
+    consolidado = build_consolidated_for_client(cid)
+    if consolidado:
+        replicate_client_to_redis(cid, consolidado)
+    return consolidado
 
 
-def compute_recommendations(cid: str, top_n: int = 5):
-    """Compute simple recommendations for client `cid` based on friends' purchases.
-    Stores recommendations as a Redis list `recomendacoes:{cid}` and also injects into client hash `cliente:{cid}`.
-    Returns a list of product dicts with counts sorted by popularity among friends."""
+def compute_recommendations(cid: str, top_n: int = 5, mode: str = "blend"):
+    """Compute recommendations for client `cid`.
+
+    mode "friends" scores products by how many friends bought them, "content" by how many
+    of the client's profile interests match the product tipo (in-memory inverted index),
+    and "blend" adds both, with the content score weighted by RECOMMENDATION_CONTENT_WEIGHT.
+    Stores recommendations as a Redis list `recomendacoes:{cid}` and also injects into the cached client.
+    Returns a list of product dicts with scores, best first."""
     consolidado = build_consolidated_for_client(cid)
     if not consolidado:
         return []
@@ -109,19 +321,25 @@ def compute_recommendations(cid: str, top_n: int = 5):
     # Client's purchased product ids
     client_purchased_ids = {c.get("id_produto") for c in consolidado.get("compras", [])}
 
-    # Gather friends' purchases
-    friends = consolidado.get("amigos", [])
     product_counts = {}
-    for friend in friends:
-        fid = str(friend.get("id")) or friend.get("id")
-        # friend id might be numeric or external; try both
-        friend_consol = build_consolidated_for_client(fid)
-        if not friend_consol:
-            continue
-        for comp in friend_consol.get("compras", []):
-            pid = comp.get("id_produto")
-            if pid and pid not in client_purchased_ids:
-                product_counts[pid] = product_counts.get(pid, 0) + 1
+    if mode in ("friends", "blend"):
+        # Gather friends' purchases
+        friends = consolidado.get("amigos", [])
+        for friend in friends:
+            fid = str(friend.get("id")) or friend.get("id")
+            # friend id might be numeric or external; try both
+            friend_consol = build_consolidated_for_client(fid)
+            if not friend_consol:
+                continue
+            for comp in friend_consol.get("compras", []):
+                pid = comp.get("id_produto")
+                if pid and pid not in client_purchased_ids:
+                    product_counts[pid] = product_counts.get(pid, 0) + 1
+
+    if mode in ("content", "blend"):
+        weight = CONTENT_WEIGHT if mode == "blend" else 1.0
+        for pid, hits in interest_index.index.score(cid, exclude=client_purchased_ids).items():
+            product_counts[pid] = product_counts.get(pid, 0) + weight * hits
 
     if not product_counts:
         recs = []
@@ -129,22 +347,25 @@ def compute_recommendations(cid: str, top_n: int = 5):
         # sort product ids by count desc
         sorted_pids = sorted(product_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
         recs = []
-        produtos = query("SELECT * FROM produtos;")
-        produto_map = {p["id"]: p for p in produtos}
+        with operation("recommendations.produtos"):
+            produto_map = {p.id: p for p in run_prepared("produtos")}
         for pid, cnt in sorted_pids:
             prod = produto_map.get(pid)
             if prod:
-                recs.append({**prod, "score": cnt})
+                recs.append({**prod._asdict(), "score": cnt})
 
     # store recommendations in Redis list and also update client consolidated
     key = f"recomendacoes:{cid}"
-    # replace list (delete existing and push new)
-    try:
-        redis_db.delete(key)
-    except Exception:
-        pass
-    for item in recs:
-        redis_db.rpush(key, json.dumps(item, default=str))
+    with operation("recommendations.write"):
+        # replace list (delete existing and push new)
+        pipe = redis_db.pipeline(transaction=True)
+        pipe.delete(key)
+        if recs:
+            pipe.rpush(key, *[json.dumps(item, default=str) for item in recs])
+            ttl = cache_policy.ttl_for("recomendacoes")
+            if ttl:
+                pipe.expire(key, ttl)
+        pipe.execute()
 
     # update consolidated object with recommendations
     consolidado["recomendacoes"] = recs
@@ -0,0 +1,95 @@
+import heapq
+import time
+
+from ..db.redis_db import redis_client
+from . import metrics
+from .metrics import operation
+
+
+def _percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {f"p{p}": values[min(len(values) - 1, int(len(values) * p / 100))] for p in points}
+    result["max"] = values[-1]
+    result["avg"] = round(sum(values) / len(values), 1)
+    return result
+
+
+def hit_rates(namespace="cliente"):
+    # summed over every worker; one collection, since a multi-process one reads every worker's file
+    counts = {}
+    for family in metrics.registry().collect():
+        if family.name != "cache_requests":
+            continue
+        for sample in family.samples:
+            if sample.name == "cache_requests_total" and sample.labels.get("namespace") == namespace:
+                counts[sample.labels["result"]] = counts.get(sample.labels["result"], 0) + sample.value
+    hits, misses, rebuilds = (counts.get(r, 0) for r in ("hit", "miss", "rebuild"))
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "rebuilds": rebuilds,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def collect(cursor=0, max_keys=100000, sample_every=10, top=10, scan_count=200, max_seconds=2.0):
+    """Walk the key space with SCAN and report per-namespace counts and memory.
+
+    Only one SCAN page (at most `scan_count` keys) plus one pipeline is in flight at a time, so
+    Redis never blocks. MEMORY USAGE is sampled on every `sample_every`-th key per namespace and
+    extrapolated; it keeps Redis' default element sampling, since an exact count (SAMPLES 0) walks
+    every element of large hashes, zsets and streams. When `max_keys` or `max_seconds` is reached
+    the returned `cursor` is non-zero and can be passed back to continue the walk.
+    """
+    namespaces = {}
+    payload_sizes = []
+    largest = []
+    scanned = 0
+    deadline = time.monotonic() + max_seconds
+
+    with operation("cache_stats.scan"):
+        while True:
+            cursor, keys = redis_client.scan(cursor=cursor, count=max(1, min(scan_count, max_keys - scanned)))
+            pipe = redis_client.pipeline(transaction=False)
+            pending = []
+            for key in keys:
+                ns = key.split(":", 1)[0]
+                stats = namespaces.setdefault(ns, {"keys": 0, "sampled": 0, "sampled_bytes": 0})
+                stats["keys"] += 1
+                if (stats["keys"] - 1) % sample_every == 0:
+                    pipe.memory_usage(key)
+                    pending.append(("memory", ns, key))
+                if ns == "cliente":
+                    pipe.hstrlen(key, "data")
+                    pending.append(("payload", ns, key))
+            for (kind, ns, key), value in zip(pending, pipe.execute() if pending else []):
+                if kind == "memory" and value is not None:
+                    namespaces[ns]["sampled"] += 1
+                    namespaces[ns]["sampled_bytes"] += value
+                elif kind == "payload" and value:
+                    payload_sizes.append(value)
+                    if len(largest) < top:
+                        heapq.heappush(largest, (value, key))
+                    else:
+                        heapq.heappushpop(largest, (value, key))
+            scanned += len(keys)
+            if cursor == 0 or scanned >= max_keys or time.monotonic() > deadline:
+                break
+
+    for stats in namespaces.values():
+        avg = stats["sampled_bytes"] / stats["sampled"] if stats["sampled"] else 0
+        stats["avg_bytes"] = round(avg, 1)
+        stats["estimated_bytes"] = int(avg * stats["keys"])
+
+    return {
+        "cursor": cursor,
+        "complete": cursor == 0,
+        "scanned_keys": scanned,
+        "namespaces": namespaces,
+        "cliente_payload_bytes": _percentiles(payload_sizes),
+        "largest_clientes": [{"key": k, "bytes": v} for v, k in sorted(largest, reverse=True)],
+        "cliente_cache": hit_rates("cliente"),
+    }
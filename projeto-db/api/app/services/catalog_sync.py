@@ -0,0 +1,209 @@
+"""Diff-based sync of Postgres `produtos` into Neo4j `:Produto` nodes.
+
+Both sides are streamed in id order and compared by a content hash of the synced fields
+(produto, valor, tipo) in a single merge pass; only the differences are written, in batches
+of UNWIND ... MERGE and UNWIND ... DETACH DELETE. Synced nodes are tagged origem='postgres';
+nodes created directly in the graph are only deleted when CATALOG_SYNC_DELETE_UNMANAGED=1.
+Products created through POST /neo4j/produtos (origem='neo4j') get ids from a range of their
+own (NEO_PRODUTO_ID_BASE); one created before that range existed and holding an id Postgres
+assigns later is moved to a fresh graph-native id, so every Postgres product reaches the graph.
+
+Runs every CATALOG_SYNC_INTERVAL seconds (one worker at a time, Redis lock), on
+POST /catalog/sync, and for the touched ids after each product write.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from ..db import pg
+from ..db.neo4j import run_query, stream_query
+from ..db.redis_db import redis_db
+from .bulkhead import priority, LOW
+from .id_allocator import produto_ids
+from .metrics import operation
+from .read_your_writes import primary_reads
+from .replication import encode, decode
+
+log = logging.getLogger(__name__)
+
+INTERVAL = int(os.getenv("CATALOG_SYNC_INTERVAL", "300"))  # seconds; 0 disables the schedule
+BATCH = int(os.getenv("CATALOG_SYNC_BATCH", "500"))
+DELETE_UNMANAGED = os.getenv("CATALOG_SYNC_DELETE_UNMANAGED", "0") == "1"
+ORIGEM = "postgres"
+
+LOCK_KEY = "catalog_sync:lock"
+LOCK_SECONDS = 600
+LAST_RUN_KEY = "catalog_sync:last"
+
+PG_SQL = "SELECT id, produto, valor, tipo FROM produtos {where} ORDER BY id"
+# nodes without an integer id cannot correspond to a Postgres row and are left alone
+NEO_CYPHER = """
+MATCH (p:Produto) WHERE p.id = toInteger(p.id) {where}
+RETURN p.id AS id, p.produto AS produto, p.valor AS valor, p.tipo AS tipo, p.origem AS origem
+ORDER BY p.id
+"""
+# relationships stay with the node, only its id changes
+RELOCATE_CYPHER = """
+MATCH (p:Produto {id: $id}) WHERE p.origem = 'neo4j'
+SET p.id = $new_id
+RETURN count(*) AS moved
+"""
+UPSERT_CYPHER = """
+UNWIND $rows AS r
+MERGE (p:Produto {id: r.id})
+WITH p, r WHERE p.origem IS NULL OR p.origem = $origem
+SET p.produto = r.produto, p.valor = r.valor, p.tipo = r.tipo, p.origem = $origem
+"""
+DELETE_CYPHER = """
+UNWIND $ids AS id
+MATCH (p:Produto {id: id})
+WHERE $unmanaged OR p.origem = $origem
+DETACH DELETE p
+RETURN count(*) AS deleted
+"""
+
+
+def _valor(value):
+    # Neo4j stores valor as a 2-decimal string (see init.cql); compare in that form
+    if value is None:
+        return None
+    try:
+        return str(Decimal(str(value)).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return str(value)
+
+
+def _normalize(row):
+    return {"id": int(row["id"]), "produto": row.get("produto"), "valor": _valor(row.get("valor")), "tipo": row.get("tipo")}
+
+
+def _hash(row):
+    return hashlib.sha1(encode(row).encode()).hexdigest()
+
+
+def _diff(pg_rows, neo_rows):
+    """Merge two id-ordered streams; yields ("upsert", row), ("delete", node) or ("conflict", row)."""
+    neo_iter = iter(neo_rows)
+    node = next(neo_iter, None)
+    for row in pg_rows:
+        row = _normalize(row)
+        while node is not None and node["id"] < row["id"]:
+            yield "delete", node
+            node = next(neo_iter, None)
+        if node is not None and node["id"] == row["id"]:
+            if node.get("origem") not in (None, ORIGEM):
+                # a graph-native product owns this id
+                yield "conflict", row
+            elif node.get("origem") != ORIGEM or _hash(_normalize(node)) != _hash(row):
+                yield "upsert", row
+            node = next(neo_iter, None)
+        else:
+            yield "upsert", row
+    while node is not None:
+        yield "delete", node
+        node = next(neo_iter, None)
+
+
+def _flush(upserts, deletes, stats):
+    if upserts:
+        run_query(UPSERT_CYPHER, {"rows": upserts, "origem": ORIGEM})
+        stats["upserted"] += len(upserts)
+        upserts.clear()
+    if deletes:
+        res = run_query(DELETE_CYPHER, {"ids": deletes, "origem": ORIGEM, "unmanaged": DELETE_UNMANAGED})
+        stats["deleted"] += res[0]["deleted"] if res else 0
+        deletes.clear()
+
+
+def sync(ids=None):
+    """Bring Neo4j in line with Postgres, for every product or only `ids`; returns counts."""
+    start = time.perf_counter()
+    where_pg, where_neo, params = "", "", {}
+    if ids is not None:
+        ids = sorted({int(i) for i in ids})
+        where_pg, where_neo, params = "WHERE id = ANY(%(ids)s)", "AND p.id IN $ids", {"ids": ids}
+    stats = {"upserted": 0, "deleted": 0, "unchanged": 0, "relocated": 0, "scanned": 0}
+    upserts, deletes = [], []
+
+    def counted(rows):
+        for row in rows:
+            stats["scanned"] += 1
+            yield row
+
+    with operation("catalog_sync"):
+        pg_rows = counted(pg.stream(PG_SQL.format(where=where_pg), params, itersize=BATCH))
+        neo_rows = stream_query(NEO_CYPHER.format(where=where_neo), params)
+        for action, row in _diff(pg_rows, neo_rows):
+            if action == "upsert":
+                upserts.append(row)
+            elif action == "conflict":
+                new_id = produto_ids.next_id()
+                run_query(RELOCATE_CYPHER, {"id": row["id"], "new_id": new_id})
+                stats["relocated"] += 1
+                log.warning("catalog sync: graph-native produto %s moved to id %s for the Postgres product", row["id"], new_id)
+                upserts.append(row)
+            else:
+                deletes.append(row["id"])
+            if len(upserts) + len(deletes) >= BATCH:
+                _flush(upserts, deletes, stats)
+        _flush(upserts, deletes, stats)
+    stats["unchanged"] = max(0, stats["scanned"] - stats["upserted"])
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    if ids is None:
+        stats["at"] = int(time.time())
+        redis_db.set(LAST_RUN_KEY, encode(stats))
+    return stats
+
+
+def last_run():
+    return decode(redis_db.get(LAST_RUN_KEY))
+
+
+def run_exclusive():
+    """Full sync unless another worker is already running one; returns the stats or None."""
+    if not redis_db.set(LOCK_KEY, os.getpid(), nx=True, ex=LOCK_SECONDS):
+        return None
+    try:
+        with priority(LOW):
+            return sync()
+    finally:
+        redis_db.delete(LOCK_KEY)
+
+
+# --- triggers ---
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-sync")
+
+
+def _sync_ids(ids):
+    try:
+        if ids is None:
+            run_exclusive()
+            return
+        # triggered by a product write that a replica may not have replayed yet
+        with priority(LOW), primary_reads():
+            sync(ids)
+    except Exception as e:
+        log.warning("catalog sync of produtos %s failed: %s", ids or "(all)", e)
+
+
+def schedule(ids=None):
+    """Sync the given product ids (or the whole catalog) in the background, e.g. after product writes."""
+    _executor.submit(_sync_ids, list(ids) if ids is not None else None)
+
+
+def _loop():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            run_exclusive()
+        except Exception as e:
+            log.warning("scheduled catalog sync failed: %s", e)
+
+
+def start_scheduler():
+    if INTERVAL > 0:
+        threading.Thread(target=_loop, name="catalog-sync-scheduler", daemon=True).start()
@@ -0,0 +1,191 @@
+"""Change feed of the consolidated client cache, served as Server-Sent Events.
+
+Every cache write appends a compact entry to the Redis Stream `clientes:changes` in the same
+pipeline: `cliente` events carry the client id, its new version (payload ETag) and the facets
+that changed; `reset` events (full refresh, flush, or a gap after the stream was trimmed) tell
+subscribers to reload the listing once. Stream entry ids are the SSE event ids, so a client that
+reconnects with Last-Event-ID gets what it missed from XRANGE before switching to live events.
+
+One reader thread per process tails the stream with a short blocking XREAD and fans entries out
+to the connected subscribers, so open streams do not hold Redis connections or bulkhead permits.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from ..db.redis_db import redis_db
+
+log = logging.getLogger(__name__)
+
+STREAM_KEY = "clientes:changes"
+MAXLEN = int(os.getenv("CHANGE_FEED_MAXLEN", "10000"))  # approximate; older entries are trimmed
+HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))  # seconds between keep-alive comments
+QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE", "1000"))  # per subscriber; overflow forces a resume
+# the blocking read must return before the Redis socket timeout fires
+BLOCK_MS = max(50, int(config.REDIS_SOCKET_TIMEOUT * 1000 / 2))
+
+FACETS = ("cliente", "perfil", "amigos", "compras", "recomendacoes")
+
+
+# --- writers ---
+def facet_hashes(consolidado):
+    """Short content hash per facet, stored with the cached client to tell which facets changed."""
+    return {
+        name: hashlib.sha1(json.dumps(consolidado.get(name), sort_keys=True, default=str).encode()).hexdigest()[:8]
+        for name in FACETS
+    }
+
+
+def changed_facets(previous, current):
+    if not previous:
+        return list(current)
+    return [name for name, h in current.items() if previous.get(name) != h]
+
+
+def publish(pipe, cid, op, version=None, facets=()):
+    """Queue a `cliente` change on `pipe` (op "upsert" or "delete"); sent with the cache write."""
+    fields = {"id": cid, "op": op}
+    if version:
+        fields["version"] = version
+    if facets:
+        fields["facets"] = ",".join(facets)
+    pipe.xadd(STREAM_KEY, fields, maxlen=MAXLEN, approximate=True)
+
+
+def publish_reset(reason, **extra):
+    redis_db.xadd(STREAM_KEY, {"op": "reset", "reason": reason, **{k: str(v) for k, v in extra.items()}},
+                  maxlen=MAXLEN, approximate=True)
+
+
+# --- encoding ---
+def _parse_id(entry_id):
+    ms, _, seq = str(entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _event(entry_id, fields):
+    if fields.get("op") == "reset":
+        data = {k: v for k, v in fields.items() if k != "op"}
+        return entry_id, "reset", data
+    data = {"id": fields.get("id"), "op": fields.get("op")}
+    if "version" in fields:
+        data["version"] = fields["version"]
+    if "facets" in fields:
+        data["facets"] = fields["facets"].split(",")
+    return entry_id, "cliente", data
+
+
+def format_event(event):
+    entry_id, name, data = event
+    return f"id: {entry_id}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# --- live fan-out ---
+class _Subscriber:
+    __slots__ = ("loop", "queue", "overflowed")
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a subscriber this far behind is cut off; its EventSource resumes from Last-Event-ID
+            self.overflowed = True
+
+
+_subscribers = set()
+_lock = threading.Lock()
+_reader_state = {"pid": None, "ready": None}
+
+
+def _latest_id():
+    entries = redis_db.xrevrange(STREAM_KEY, count=1)
+    return entries[0][0] if entries else "0-0"
+
+
+def _reader(ready):
+    last = None
+    while _reader_state["ready"] is ready:
+        try:
+            if last is None:
+                last = _latest_id()
+                ready.set()
+            res = redis_db.xread({STREAM_KEY: last}, count=500, block=BLOCK_MS)
+        except Exception as e:
+            log.warning("change feed read failed: %s", e)
+            time.sleep(1)
+            continue
+        for _, entries in res or []:
+            for entry_id, fields in entries:
+                last = entry_id
+                event = _event(entry_id, fields)
+                with _lock:
+                    targets = list(_subscribers)
+                for sub in targets:
+                    sub.loop.call_soon_threadsafe(sub.offer, event)
+
+
+def _ensure_reader():
+    """Start this process's stream reader on first use; returns an Event set once it is tailing."""
+    if _reader_state["pid"] != os.getpid():
+        with _lock:
+            if _reader_state["pid"] != os.getpid():
+                ready = threading.Event()
+                _reader_state.update(pid=os.getpid(), ready=ready)
+                threading.Thread(target=_reader, args=(ready,), name="change-feed", daemon=True).start()
+    return _reader_state["ready"]
+
+
+def _backlog(since):
+    """Events after `since`; a single `reset` when some were already trimmed (or `since` is not ours)."""
+    try:
+        ms, seq = _parse_id(since)
+    except ValueError:
+        ms = seq = None
+    first = redis_db.xrange(STREAM_KEY, count=1)
+    if ms is None or (first and (ms, seq) < _parse_id(first[0][0])):
+        # the reset carries the newest id, so the client resumes from here after reloading
+        return [(_latest_id(), "reset", {"reason": "gap"})]
+    return [_event(entry_id, fields) for entry_id, fields in redis_db.xrange(STREAM_KEY, min=f"({ms}-{seq}")]
+
+
+async def events(request, since=None):
+    """Async generator of SSE frames: missed events after `since`, then live ones until disconnect."""
+    sub = _Subscriber()
+    with _lock:
+        _subscribers.add(sub)
+    last = None
+    try:
+        yield "retry: 2000\n\n"
+        if since:
+            # the backlog is read after the reader has its start position, so nothing falls in between
+            await run_in_threadpool(_ensure_reader().wait, 5)
+            for event in await run_in_threadpool(_backlog, since):
+                last = _parse_id(event[0])
+                yield format_event(event)
+        else:
+            _ensure_reader()
+        while not await request.is_disconnected() and not sub.overflowed:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            # live entries already sent from the backlog are skipped
+            if last is not None and _parse_id(event[0]) <= last:
+                continue
+            yield format_event(event)
+    finally:
+        with _lock:
+            _subscribers.discard(sub)
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import psycopg2
+import pymongo.errors
+import neo4j.exceptions
+import redis.exceptions
+from prometheus_client import Counter, Gauge
+
+from .bulkhead import BackendOverloaded
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+STATE = Gauge("circuit_breaker_state", "Breaker state per backend (0 closed, 1 half-open, 2 open)", ["backend"],
+              multiprocess_mode="max")
+OPENED = Counter("circuit_breaker_opened_total", "Times a backend breaker tripped open", ["backend"])
+SHORT_CIRCUITED = Counter("circuit_breaker_rejected_total", "Calls failed fast while a breaker was open", ["backend"])
+
+# only timeouts and connection failures count against a backend; a constraint violation means it answered
+TRANSIENT_ERRORS = {
+    "postgres": (psycopg2.OperationalError, psycopg2.InterfaceError),
+    "mongo": (pymongo.errors.ConnectionFailure, pymongo.errors.ExecutionTimeout),
+    "neo4j": (neo4j.exceptions.ServiceUnavailable, neo4j.exceptions.SessionExpired, neo4j.exceptions.TransientError),
+    "redis": (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError),
+}
+
+
+def is_transient(backend, exc):
+    if isinstance(exc, TRANSIENT_ERRORS[backend]):
+        return True
+    # a server-side transaction timeout comes back as a client error
+    return backend == "neo4j" and "TimedOut" in (getattr(exc, "code", None) or "")
+
+
+class CircuitOpen(BackendOverloaded):
+    """Raised without touching the backend while its breaker is open (served as 503 + Retry-After)."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker.
+
+    After `threshold` transient failures in a row the circuit opens and calls fail fast for
+    `reset_timeout` seconds; then a single probe call is let through (half-open), and its
+    outcome closes or re-opens the circuit. A probe that never reports back (e.g. shed by the
+    bulkhead) is replaced after another `reset_timeout`.
+    """
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        STATE.labels(name).set(0)
+
+    def _set_state(self, state):
+        self.state = state
+        STATE.labels(self.name).set(_STATE_VALUE[state])
+
+    def _retry_after(self):
+        return max(1, int(self.opened_at + self.reset_timeout - time.monotonic() + 0.999))
+
+    def before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probe_started = None
+            if self.state == HALF_OPEN and (
+                self._probe_started is None or now - self._probe_started >= self.reset_timeout
+            ):
+                self._probe_started = now
+                return
+            retry_after = self._retry_after()
+        SHORT_CIRCUITED.labels(self.name).inc()
+        raise CircuitOpen(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_started = None
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_started = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+                OPENED.labels(self.name).inc()
+
+
+def _from_env(name, threshold, reset_timeout):
+    prefix = f"BREAKER_{name.upper()}"
+    return CircuitBreaker(
+        name,
+        threshold=int(os.getenv(f"{prefix}_THRESHOLD", threshold)),
+        reset_timeout=float(os.getenv(f"{prefix}_RESET_SECONDS", reset_timeout)),
+    )
+
+
+BREAKERS = {
+    "postgres": _from_env("postgres", 5, 10),
+    "mongo": _from_env("mongo", 5, 10),
+    "neo4j": _from_env("neo4j", 5, 10),
+    "redis": _from_env("redis", 10, 5),
+}
+
+
+def states():
+    return {name: b.state for name, b in BREAKERS.items()}
@@ -0,0 +1,272 @@
+"""Purchase ingestion.
+
+`reserve_and_insert` is the one-purchase path: stock reservation and the compra insert in a
+single statement. With COMPRAS_GROUP_COMMIT=1, `submit` instead hands the purchase to a writer
+thread that gathers everything arriving within COMPRAS_BATCH_WINDOW_MS (up to COMPRAS_BATCH_MAX)
+and commits it in one transaction. Either way the caller only gets a result after COMMIT.
+
+In group-commit mode the cached clients are not rebuilt per purchase: they are marked dirty and
+each one is rebuilt at most once per COMPRAS_REBUILD_INTERVAL_MS.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from prometheus_client import Histogram
+
+from ..db import pg
+from . import analytics, etags, read_your_writes
+from .bulkhead import priority, LOW
+from .cache_refresher import rebuild_client
+
+log = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.getenv("COMPRAS_GROUP_COMMIT", "0") == "1"
+BATCH_WINDOW = float(os.getenv("COMPRAS_BATCH_WINDOW_MS", "5")) / 1000
+BATCH_MAX = int(os.getenv("COMPRAS_BATCH_MAX", "500"))
+REBUILD_INTERVAL = float(os.getenv("COMPRAS_REBUILD_INTERVAL_MS", "250")) / 1000
+REBUILD_WORKERS = int(os.getenv("COMPRAS_REBUILD_WORKERS", "4"))
+
+BATCH_SIZE = Histogram("compras_batch_size", "Purchases committed per group commit",
+                       buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class ProdutoNotFound(LookupError):
+    pass
+
+
+class SemEstoque(Exception):
+    pass
+
+
+# products with NULL quantidade are not stock-controlled; the conditional UPDATE takes the
+# product row lock only for this statement, so concurrent buyers never read-then-write stock
+RESERVE_SQL = """
+WITH reserva AS (
+    UPDATE produtos SET quantidade = quantidade - 1
+    WHERE id = %(id_produto)s AND (quantidade IS NULL OR quantidade > 0)
+    RETURNING id, valor, tipo
+), ins AS (
+    INSERT INTO compras (id_produto, data, id_cliente)
+    SELECT id, %(data)s::date, %(id_cliente)s::int FROM reserva
+    RETURNING id, id_produto, data, id_cliente
+)
+SELECT ins.id, ins.data, r.valor, r.tipo, cl.cidade, cl.external_id
+FROM ins
+JOIN reserva r ON r.id = ins.id_produto
+LEFT JOIN clientes cl ON cl.id = ins.id_cliente;
+"""
+
+# group commit: lock every product of the batch (in id order, so batches cannot deadlock),
+# hand out stock in arrival order, then one UPDATE and one multi-row INSERT
+LOCK_SQL = "SELECT id, quantidade, valor, tipo FROM produtos WHERE id = ANY(%s) ORDER BY id FOR UPDATE"
+DECREMENT_SQL = """
+UPDATE produtos SET quantidade = produtos.quantidade - d.n
+FROM unnest(%s::int[], %s::int[]) AS d(id, n)
+WHERE produtos.id = d.id
+"""
+INSERT_SQL = """
+INSERT INTO compras (id_produto, data, id_cliente)
+SELECT id_produto, data, id_cliente
+FROM unnest(%s::int[], %s::date[], %s::int[]) WITH ORDINALITY AS t(id_produto, data, id_cliente, seq)
+ORDER BY seq
+RETURNING id, data
+"""
+CLIENTES_SQL = "SELECT id, cidade, external_id FROM clientes WHERE id = ANY(%s)"
+
+
+def cache_id(id_cliente, external_id):
+    # cached clients are keyed by external_id (UUID) when present, else by the integer id
+    return str(external_id) if external_id else str(id_cliente)
+
+
+def reserve_and_insert(id_produto, data, id_cliente):
+    """Reserve one unit and insert the compra (one statement, one commit)."""
+    res = pg.execute(RESERVE_SQL, {"id_produto": id_produto, "data": data, "id_cliente": id_cliente}, returning=True)
+    if not res:
+        if not pg.query("SELECT 1 FROM produtos WHERE id = %s", (id_produto,)):
+            raise ProdutoNotFound(id_produto)
+        raise SemEstoque(id_produto)
+    res["cid"] = cache_id(id_cliente, res.pop("external_id"))
+    return res
+
+
+def _commit_batch(batch):
+    """Commit a batch of (id_produto, data, id_cliente, future) in one transaction.
+
+    Returns one result dict or exception per purchase, in batch order.
+    """
+    with pg.transaction() as run:
+        stock = {r["id"]: r for r in run(LOCK_SQL, (sorted({item[0] for item in batch}),))}
+        outcomes, granted, taken = [], [], {}
+        for id_produto, data, id_cliente, _ in batch:
+            produto = stock.get(id_produto)
+            if produto is None:
+                outcomes.append(ProdutoNotFound(id_produto))
+                continue
+            if produto["quantidade"] is not None:
+                if produto["quantidade"] - taken.get(id_produto, 0) <= 0:
+                    outcomes.append(SemEstoque(id_produto))
+                    continue
+                taken[id_produto] = taken.get(id_produto, 0) + 1
+            outcomes.append(None)
+            granted.append((id_produto, data, id_cliente))
+        if taken:
+            run(DECREMENT_SQL, (list(taken), list(taken.values())))
+        inserted, clientes = [], {}
+        if granted:
+            inserted = run(INSERT_SQL, tuple(list(col) for col in zip(*granted)))
+            clientes = {r["id"]: r for r in run(CLIENTES_SQL, (list({g[2] for g in granted}),))}
+
+    # serial ids are drawn in insertion (= arrival) order
+    rows = iter(sorted(inserted, key=lambda r: r["id"]))
+    results = []
+    for outcome, (id_produto, _, id_cliente, _) in zip(outcomes, batch):
+        if outcome is not None:
+            results.append(outcome)
+            continue
+        row, produto, cliente = next(rows), stock[id_produto], clientes.get(id_cliente, {})
+        results.append({
+            "id": row["id"],
+            "data": row["data"],
+            "valor": produto["valor"],
+            "tipo": produto["tipo"],
+            "cidade": cliente.get("cidade"),
+            "cid": cache_id(id_cliente, cliente.get("external_id")),
+        })
+    return results
+
+
+def _flush(batch):
+    try:
+        results = _commit_batch(batch)
+    except Exception as e:
+        # one bad row (e.g. an unknown id_cliente) must not fail its neighbours
+        log.warning("group commit of %d compras failed (%s); retrying one by one", len(batch), e)
+        results = []
+        for id_produto, data, id_cliente, _ in batch:
+            try:
+                results.append(reserve_and_insert(id_produto, data, id_cliente))
+            except Exception as item_error:
+                results.append(item_error)
+    BATCH_SIZE.observe(len(batch))
+
+    committed = []
+    for (id_produto, _, _, future), result in zip(batch, results):
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+            committed.append((id_produto, result))
+    if not committed:
+        return
+    try:
+        etags.bump("produtos")
+        analytics.record_purchases([
+            (id_produto, r["valor"], r["tipo"], r["data"], r["cidade"]) for id_produto, r in committed
+        ])
+    except Exception as e:
+        log.warning("post-commit updates for %d compras failed: %s", len(committed), e)
+    _mark_dirty(r["cid"] for _, r in committed)
+
+
+# --- writer and rebuilder threads (started lazily, once per process) ---
+_state = {"pid": None, "queue": None, "dirty": set(), "stopping": None, "threads": []}
+_start_lock = threading.Lock()
+_dirty_lock = threading.Lock()
+
+
+def _writer(q):
+    stop = False
+    while not stop:
+        first = q.get()
+        if first is None:
+            break
+        batch = [first]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < BATCH_MAX:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = q.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        try:
+            _flush(batch)
+        except Exception as e:
+            log.exception("compra batch flush failed")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+def _mark_dirty(cids):
+    with _dirty_lock:
+        _state["dirty"].update(cids)
+
+
+def _rebuild_one(cid):
+    try:
+        # the purchase was just committed; a replica may not have it yet
+        with priority(LOW), read_your_writes.primary_reads():
+            rebuild_client(cid)
+    except Exception as e:
+        log.warning("rebuild of cliente %s after compras failed: %s", cid, e)
+
+
+def _rebuild_dirty(pool):
+    with _dirty_lock:
+        cids, _state["dirty"] = _state["dirty"], set()
+    if cids:
+        list(pool.map(_rebuild_one, cids))
+
+
+def _rebuilder(stopping):
+    with ThreadPoolExecutor(max_workers=REBUILD_WORKERS, thread_name_prefix="compras-rebuild") as pool:
+        while not stopping.wait(REBUILD_INTERVAL):
+            _rebuild_dirty(pool)
+        _rebuild_dirty(pool)
+
+
+def _ensure_started():
+    if _state["pid"] == os.getpid():
+        return
+    with _start_lock:
+        if _state["pid"] == os.getpid():
+            return
+        q, stopping = queue.Queue(), threading.Event()
+        threads = [
+            threading.Thread(target=_writer, args=(q,), name="compras-writer", daemon=True),
+            threading.Thread(target=_rebuilder, args=(stopping,), name="compras-rebuilder", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        _state.update(pid=os.getpid(), queue=q, dirty=set(), stopping=stopping, threads=threads)
+
+
+def submit(id_produto, data, id_cliente):
+    """Queue one purchase for the next group commit and block until it is committed (or rejected)."""
+    _ensure_started()
+    future = Future()
+    _state["queue"].put((id_produto, data, id_cliente, future))
+    return future.result()
+
+
+def stop(timeout=5):
+    """Flush queued purchases and pending rebuilds (graceful shutdown)."""
+    if _state["pid"] != os.getpid():
+        return
+    writer, rebuilder = _state["threads"]
+    _state["queue"].put(None)
+    writer.join(timeout)
+    _state["stopping"].set()
+    rebuilder.join(timeout)
+    _state["pid"] = None
@@ -0,0 +1,195 @@
+"""Monthly range partitions of `compras` on `data`.
+
+`compras` is PARTITION BY RANGE (data): one partition per month (compras_pYYYYMM) plus a DEFAULT
+partition for purchases without a date. maintain() creates the partitions of the current month and
+the next COMPRAS_PARTITIONS_AHEAD months (and of any month whose rows landed in the default
+partition), and detaches months older than COMPRAS_RETENTION_MONTHS; a detached partition stays
+behind as a plain table for archiving. A plain `compras` table from before partitioning is only
+converted on request, since the copy holds an exclusive lock on it: set
+COMPRAS_PARTITION_MIGRATE=1 for one start, or run `python -m app.services.compras_partitions migrate`.
+
+Runs at bootstrap, every COMPRAS_PARTITION_INTERVAL seconds and on POST /compras/partitions/maintain.
+Partition DDL is serialized across workers with a transaction-level advisory lock.
+"""
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+
+from ..db import pg
+from .bulkhead import priority, LOW
+
+log = logging.getLogger(__name__)
+
+AHEAD = int(os.getenv("COMPRAS_PARTITIONS_AHEAD", "3"))  # future months kept ready
+RETENTION_MONTHS = int(os.getenv("COMPRAS_RETENTION_MONTHS", "0"))  # 0 keeps every month attached
+INTERVAL = int(os.getenv("COMPRAS_PARTITION_INTERVAL", "86400"))  # seconds; 0 disables the schedule
+MIGRATE = os.getenv("COMPRAS_PARTITION_MIGRATE", "0") == "1"  # convert a plain compras at bootstrap
+
+DEFAULT_PARTITION = "compras_default"
+_NAME = re.compile(r"^compras_p(\d{4})(\d{2})$")
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('compras_partitions'))"
+RELKIND_SQL = "SELECT relkind FROM pg_class WHERE oid = to_regclass('compras')"
+PARTITIONS_SQL = """
+SELECT c.relname AS name, c.reltuples::bigint AS linhas_estimadas
+FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'compras'::regclass
+ORDER BY c.relname
+"""
+# same layout as postgres/01_schema.sql; the id sequence is carried over from the old table
+PARENT_DDL = """
+CREATE TABLE compras (
+    id INT NOT NULL DEFAULT nextval('compras_id_seq'),
+    id_produto INT REFERENCES produtos(id),
+    data DATE,
+    id_cliente INT REFERENCES clientes(id)
+) PARTITION BY RANGE (data)
+"""
+
+
+def _add_months(month, n):
+    m = month.year * 12 + month.month - 1 + n
+    return datetime.date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"compras_p{month:%Y%m}"
+
+
+def _bounds(month):
+    # dates only, so the literals are safe to inline (partition bounds cannot be bind parameters)
+    return f"FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+
+
+def _monthly(rows):
+    out = []
+    for r in rows:
+        m = _NAME.match(r["name"])
+        if m:
+            out.append((datetime.date(int(m[1]), int(m[2]), 1), r["name"]))
+    return sorted(out)
+
+
+def is_partitioned():
+    rows = pg.query(RELKIND_SQL, primary=True)
+    return bool(rows) and rows[0]["relkind"] == "p"
+
+
+def partitions():
+    """Attached partitions with their estimated row counts (from the last ANALYZE)."""
+    return pg.query(PARTITIONS_SQL, primary=True)
+
+
+def _create(run, month):
+    """Create and attach one month; its rows already sitting in the default partition move into it."""
+    name = partition_name(month)
+    if run("SELECT to_regclass(%s) AS t", (name,))[0]["t"]:
+        # attached already, or detached by retention: such old months stay in the default partition
+        return False
+    run(f"CREATE TABLE {name} (LIKE compras INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    bounds = (month, _add_months(month, 1))
+    if run(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE data >= %s AND data < %s) AS e", bounds)[0]["e"]:
+        # no inserts may land in the default partition between moving its rows and attaching;
+        # without rows to move, ATTACH itself checks the default partition
+        run(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE")
+        run(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE data >= %s AND data < %s
+                RETURNING id, id_produto, data, id_cliente
+            )
+            INSERT INTO {name} (id, id_produto, data, id_cliente) SELECT * FROM moved
+            """,
+            bounds,
+        )
+    # attaching clones the parent's indexes and foreign keys onto the partition
+    run(f"ALTER TABLE compras ATTACH PARTITION {name} FOR VALUES {_bounds(month)}")
+    return True
+
+
+def maintain(today=None):
+    """Create upcoming (and stray) month partitions and detach expired ones; returns what changed."""
+    month = (today or datetime.date.today()).replace(day=1)
+    created, detached = [], []
+    with priority(LOW), pg.transaction() as run:
+        run(LOCK_SQL)
+        run(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF compras DEFAULT")
+        months = {_add_months(month, n) for n in range(AHEAD + 1)}
+        months.update(
+            r["m"] for r in run(
+                f"SELECT DISTINCT date_trunc('month', data)::date AS m FROM {DEFAULT_PARTITION} WHERE data IS NOT NULL"
+            )
+        )
+        for m in sorted(months):
+            if _create(run, m):
+                created.append(partition_name(m))
+        if RETENTION_MONTHS > 0:
+            cutoff = _add_months(month, -RETENTION_MONTHS)
+            for m, name in _monthly(run(PARTITIONS_SQL)):
+                if m < cutoff:
+                    run(f"ALTER TABLE compras DETACH PARTITION {name}")
+                    detached.append(name)
+    if created or detached:
+        log.info("compras partitions: created %s, detached %s", created, detached)
+    return {"created": created, "detached": detached}
+
+
+def migrate():
+    """Convert a plain `compras` table into the partitioned layout; False if there is nothing to do.
+
+    Copies every row in one transaction with the old table locked, so writes wait for it.
+    """
+    with priority(LOW), pg.transaction() as run:
+        run(LOCK_SQL)
+        rows = run(RELKIND_SQL)
+        if not rows or rows[0]["relkind"] == "p":
+            return False
+        run("LOCK TABLE compras IN ACCESS EXCLUSIVE MODE")
+        run("ALTER TABLE compras RENAME TO compras_heap")
+        run(PARENT_DDL)
+        # the sequence would be dropped with the old table otherwise
+        run("ALTER SEQUENCE compras_id_seq OWNED BY compras.id")
+        run(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF compras DEFAULT")
+        for r in run("SELECT DISTINCT date_trunc('month', data)::date AS m FROM compras_heap WHERE data IS NOT NULL"):
+            run(f"CREATE TABLE {partition_name(r['m'])} PARTITION OF compras FOR VALUES {_bounds(r['m'])}")
+        run("INSERT INTO compras (id, id_produto, data, id_cliente) SELECT id, id_produto, data, id_cliente FROM compras_heap")
+        run("DROP TABLE compras_heap")
+    log.info("compras converted to monthly partitions")
+    return True
+
+
+def ensure():
+    """Bootstrap step: partition `compras` if asked to (COMPRAS_PARTITION_MIGRATE=1) and maintain it."""
+    if MIGRATE and not is_partitioned():
+        migrate()
+    if is_partitioned():
+        return maintain()
+    return None
+
+
+def _loop():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            if is_partitioned():
+                maintain()
+        except Exception as e:
+            log.warning("scheduled compras partition maintenance failed: %s", e)
+
+
+def start_scheduler():
+    if INTERVAL > 0:
+        threading.Thread(target=_loop, name="compras-partitions", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # one-off conversion of a plain compras table, outside the API workers
+    import sys
+
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python -m app.services.compras_partitions migrate")
+    logging.basicConfig(level=logging.INFO)
+    migrate()
+    log.info("compras partitions: %s", maintain())
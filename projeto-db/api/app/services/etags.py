@@ -0,0 +1,68 @@
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from ..db.redis_db import redis_db
+
+
+def make_etag(payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return '"' + hashlib.sha1(payload).hexdigest()[:20] + '"'
+
+
+def http_date(ts=None):
+    return formatdate(time.time() if ts is None else float(ts), usegmt=True)
+
+
+def _strip_weak(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_conditional(request):
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def not_modified(request, etag, last_modified=None):
+    """True when the client's If-None-Match / If-Modified-Since validators still match."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if inm.strip() == "*":
+            return etag is not None
+        return etag is not None and _strip_weak(etag) in {_strip_weak(t) for t in inm.split(",")}
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def headers(etag, last_modified=None):
+    h = {"ETag": etag}
+    if last_modified:
+        h["Last-Modified"] = last_modified
+    return h
+
+
+# --- collection versions: bumped on every write, read with one MGET ---
+def _keys(name):
+    return f"cache:{name}:version", f"cache:{name}:mtime"
+
+
+def bump(name, pipe=None):
+    version_key, mtime_key = _keys(name)
+    target = pipe if pipe is not None else redis_db.pipeline(transaction=False)
+    target.incr(version_key)
+    target.set(mtime_key, http_date())
+    if pipe is None:
+        target.execute()
+
+
+def version(name):
+    """Return (version, last_modified) for a collection; version 0 means never written."""
+    v, mtime = redis_db.mget(*_keys(name))
+    return int(v or 0), mtime
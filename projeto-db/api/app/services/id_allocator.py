@@ -0,0 +1,93 @@
+import os
+import threading
+
+from ..db.neo4j import run_query
+
+# graph-native produto ids start above anything the Postgres produtos sequence hands out, so
+# nodes created in the graph never take an id the catalog sync needs later
+PRODUTO_ID_BASE = int(os.getenv("NEO_PRODUTO_ID_BASE", "1000000000"))
+
+# the counter lives next to the ids it hands out, in Neo4j: cache flushes (clear_cache,
+# /seed/run?purge) must not reset it while workers still hold unused blocks.
+# SET _lock write-locks the node before c.hi is read, so concurrent updates never overlap
+_RESERVE = """
+MATCH (c:IdCounter {name: $name})
+SET c._lock = true
+SET c.hi = CASE WHEN c.hi < $floor THEN $floor ELSE c.hi END + $n
+REMOVE c._lock
+RETURN c.hi AS hi
+"""
+_CREATE = """
+MERGE (c:IdCounter {name: $name})
+ON CREATE SET c.hi = $seed
+"""
+# raise the counter to at least $id (used when ids are assigned explicitly, e.g. by the seed)
+_RAISE_TO = """
+MERGE (c:IdCounter {name: $name})
+ON CREATE SET c.hi = $id
+SET c._lock = true
+SET c.hi = CASE WHEN c.hi < $id THEN $id ELSE c.hi END
+REMOVE c._lock
+"""
+
+
+class HiLoAllocator:
+    """Hands out ids from blocks reserved with a single counter update in Neo4j.
+
+    Each worker reserves `block_size` ids at a time and serves them from memory, so
+    allocating an id is O(1) and collision-free across workers and processes.
+    The counter node is created once, seeded from `seed()`; ids are never below `floor` + 1.
+    """
+
+    def __init__(self, name, block_size=100, seed=None, floor=0):
+        self.name = name
+        self.block_size = block_size
+        self._seed = seed
+        self.floor = floor
+        self._next = 0
+        self._hi = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, n):
+        params = {"name": self.name, "n": n, "floor": self.floor}
+        rows = run_query(_RESERVE, params)
+        if not rows:
+            # MERGE is safe across workers thanks to the id_counter_name constraint
+            run_query(_CREATE, {"name": self.name, "seed": int(self._seed() or 0) if self._seed else 0})
+            rows = run_query(_RESERVE, params)
+        hi = rows[0]["hi"]
+        return hi - n + 1, hi
+
+    def next_id(self):
+        with self._lock:
+            if self._next == 0 or self._next > self._hi:
+                self._next, self._hi = self._reserve(self.block_size)
+            new_id = self._next
+            self._next += 1
+            return new_id
+
+    def observe(self, used_id):
+        """Make sure future blocks start after an id that was assigned explicitly.
+
+        This worker's block is dropped if it holds the id; blocks held by other processes
+        cannot be reached, so callers inserting allocated ids still retry on a constraint error.
+        """
+        used_id = int(used_id)
+        with self._lock:
+            if self._next <= used_id <= self._hi:
+                self._next = self._hi = 0
+        run_query(_RAISE_TO, {"name": self.name, "id": used_id})
+
+
+def max_neo_produto_id():
+    # one label scan when the counter is first created, never on the insert path
+    rows = run_query("MATCH (p:Produto) WHERE p.id >= $base RETURN max(p.id) AS max_id", {"base": PRODUTO_ID_BASE})
+    return rows[0].get("max_id") if rows and rows[0].get("max_id") is not None else 0
+
+
+produto_ids = HiLoAllocator(
+    "produto",
+    block_size=int(os.getenv("ID_BLOCK_SIZE", "100")),
+    seed=max_neo_produto_id,
+    floor=PRODUTO_ID_BASE,
+)
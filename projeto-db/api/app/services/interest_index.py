@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+
+from ..db.pg import query
+from ..db.mongo import iter_profiles
+from .bulkhead import priority, LOW
+from .metrics import operation
+
+log = logging.getLogger(__name__)
+
+# interests are free text in Mongo; product types come from produtos.tipo in Postgres.
+# An interest not listed here matches a tipo with the same (accent-insensitive) name.
+DEFAULT_INTEREST_TIPOS = {
+    "tecnologia": ["eletronico", "informatica"],
+    "jogos": ["eletronico", "games"],
+    "esportes": ["vestuario", "esporte"],
+    "viagens": ["mala", "viagem"],
+    "moda": ["vestuario", "calcado"],
+}
+INTEREST_TIPOS = json.loads(os.getenv("INTEREST_TIPOS", "null")) or DEFAULT_INTEREST_TIPOS
+# full rebuild interval; writes made through other workers become visible after at most this long
+# (plus the rebuild itself, which runs in the background while the stale index keeps serving)
+REBUILD_SECONDS = int(os.getenv("INTEREST_INDEX_TTL", "300"))
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode()
+    return text.strip().lower()
+
+
+_TIPOS = {normalize(k): [normalize(t) for t in v] for k, v in INTEREST_TIPOS.items()}
+
+
+def tipos_for(interest):
+    return _TIPOS.get(interest, [interest])
+
+
+def _apply(by_tipo, tipo_of, interests_of, kind, key, value):
+    """Apply one incremental change; value None removes the product or profile."""
+    if kind == "product":
+        old = tipo_of.pop(key, None)
+        if old is not None:
+            by_tipo.get(old, set()).discard(key)
+        if value is not None:
+            tipo_of[key] = value
+            by_tipo.setdefault(value, set()).add(key)
+    elif value is None:
+        interests_of.pop(key, None)
+    else:
+        interests_of[key] = value
+
+
+class InterestIndex:
+    """Per-worker, in-memory index: interest -> tipos -> product ids, plus client -> interests."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # single flight: only one rebuild per worker at a time
+        self._rebuilding = threading.Lock()
+        self.by_tipo = {}
+        self.tipo_of = {}
+        self.interests_of = {}
+        self.built_at = 0.0
+        # incremental changes seen during a rebuild, or None when no rebuild is running
+        self._pending = None
+
+    def rebuild(self):
+        # writes applied while the snapshot is loading are replayed onto it before the swap
+        with self._lock:
+            self._pending = []
+        try:
+            with operation("interest_index.rebuild"):
+                produtos = query("SELECT id, tipo FROM produtos;")
+                perfis = list(iter_profiles())
+            by_tipo, tipo_of = {}, {}
+            for p in produtos:
+                tipo = normalize(p.get("tipo"))
+                tipo_of[p["id"]] = tipo
+                by_tipo.setdefault(tipo, set()).add(p["id"])
+            interests_of = {str(p["idCliente"]): {normalize(i) for i in p.get("interesses") or []} for p in perfis}
+            with self._lock:
+                for change in self._pending:
+                    _apply(by_tipo, tipo_of, interests_of, *change)
+                self.by_tipo, self.tipo_of, self.interests_of = by_tipo, tipo_of, interests_of
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _first_build(self):
+        with self._rebuilding:
+            # callers that waited find the index built by the one ahead of them
+            if not self.built_at:
+                self.rebuild()
+
+    def _rebuild_in_background(self):
+        if not self._rebuilding.acquire(blocking=False):
+            return  # already rebuilding; keep serving the current index
+
+        def _run():
+            try:
+                with priority(LOW):
+                    self.rebuild()
+            except Exception as e:
+                log.warning("interest index rebuild failed: %s", e)
+            finally:
+                self._rebuilding.release()
+
+        threading.Thread(target=_run, name="interest-index", daemon=True).start()
+
+    def ensure_fresh(self):
+        if not self.built_at:
+            # nothing to serve yet: the first caller builds, concurrent ones wait for it
+            self._first_build()
+        elif time.monotonic() - self.built_at > REBUILD_SECONDS:
+            self._rebuild_in_background()
+
+    # --- incremental maintenance (called from the write routes) ---
+    def upsert_product(self, pid, tipo):
+        self._change("product", pid, normalize(tipo))
+
+    def remove_product(self, pid):
+        self._change("product", pid, None)
+
+    def upsert_profile(self, cid, interesses):
+        self._change("profile", str(cid), {normalize(i) for i in interesses or []})
+
+    def remove_profile(self, cid):
+        self._change("profile", str(cid), None)
+
+    def _change(self, kind, key, value):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, key, value))
+            _apply(self.by_tipo, self.tipo_of, self.interests_of, kind, key, value)
+
+    # --- scoring ---
+    def products_for_interest(self, interest):
+        ids = set()
+        for tipo in tipos_for(interest):
+            ids |= self.by_tipo.get(tipo, set())
+        return ids
+
+    def score(self, cid, exclude=()):
+        """Number of the client's interests that point at each product (purchased products excluded)."""
+        self.ensure_fresh()
+        scores = {}
+        with self._lock:
+            for interest in self.interests_of.get(str(cid), ()):
+                for pid in self.products_for_interest(interest) - set(exclude):
+                    scores[pid] = scores.get(pid, 0) + 1
+        return scores
+
+
+index = InterestIndex()
@@ -0,0 +1,120 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from . import profiling
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, REGISTRY,
+                               generate_latest, multiprocess)
+
+# --- HTTP ---
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ["method", "route"]
+)
+REQUESTS = Counter("http_requests_total", "Requests by route template and status", ["method", "route", "status"])
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served", multiprocess_mode="livesum")
+
+# --- backends ---
+BACKEND_CALLS = Counter("backend_calls_total", "Calls per backend and logical operation", ["backend", "operation"])
+BACKEND_LATENCY = Histogram(
+    "backend_call_duration_seconds", "Backend call latency per logical operation", ["backend", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+BACKEND_ERRORS = Counter("backend_errors_total", "Failed backend calls", ["backend", "operation"])
+
+# --- cache ---
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by namespace and result (hit/miss/rebuild)", ["namespace", "result"])
+
+_operation = contextvars.ContextVar("operation", default="other")
+
+
+@contextmanager
+def operation(name):
+    """Label every backend call made inside the block with a logical operation name."""
+    token = _operation.set(name)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+
+def current_operation():
+    return _operation.get()
+
+
+def observe_call(backend, seconds, failed=False, op=None, statement=None, params=None, rows=None):
+    op = op or _operation.get()
+    BACKEND_CALLS.labels(backend, op).inc()
+    BACKEND_LATENCY.labels(backend, op).observe(seconds)
+    if failed:
+        BACKEND_ERRORS.labels(backend, op).inc()
+    # per-request timeline and slow-query log
+    profiling.record(backend, op, statement, params, rows, seconds, failed)
+
+
+@contextmanager
+def track(backend, statement=None, params=None):
+    """Time a backend call; the caller may set call["rows"] on the yielded dict."""
+    call = {"rows": None}
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield call
+    except Exception:
+        failed = True
+        raise
+    finally:
+        observe_call(backend, time.perf_counter() - start, failed,
+                     statement=statement, params=params, rows=call["rows"])
+
+
+def cache_result(namespace, hit):
+    CACHE_REQUESTS.labels(namespace, "hit" if hit else "miss").inc()
+
+
+def cache_rebuild(namespace):
+    # a miss that was served by rebuilding the entry from the source databases
+    CACHE_REQUESTS.labels(namespace, "rebuild").inc()
+
+
+def registry():
+    """Registry covering every worker: in multi-worker mode, the per-process files aggregated."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        aggregated = CollectorRegistry()
+        multiprocess.MultiProcessCollector(aggregated)
+        return aggregated
+    return REGISTRY
+
+
+def render():
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no BaseHTTPMiddleware task overhead) recording per-route latency."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            # the router stores the matched route on the scope; use its template to bound cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - start)
+            REQUESTS.labels(scope["method"], route, str(status["code"])).inc()
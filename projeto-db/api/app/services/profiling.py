@@ -0,0 +1,267 @@
+import collections
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+slow_log = logging.getLogger("app.slowquery")
+
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", "3600"))
+CPU_INTERVAL = float(os.getenv("PROFILE_CPU_INTERVAL_MS", "5")) / 1000
+# same statement repeated this many times in one profile is reported as a likely N+1
+REPEAT_WARN = int(os.getenv("PROFILE_REPEAT_WARN", "5"))
+SLOW_QUERY_MS = {
+    backend: float(os.getenv(f"SLOW_QUERY_MS_{backend.upper()}", os.getenv("SLOW_QUERY_MS", "200")))
+    for backend in ("postgres", "mongo", "neo4j", "redis")
+}
+
+_active = contextvars.ContextVar("profile", default=None)
+
+
+def _normalize(statement):
+    return " ".join(str(statement).split())[:500] if statement is not None else None
+
+
+def fingerprint(params):
+    # parameters are never stored, only a short hash so repeated calls can be grouped
+    if params is None:
+        return None
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+
+
+class CpuSampler(threading.Thread):
+    """Samples the stacks of the threads serving a profiled request and folds them (flamegraph format)."""
+
+    def __init__(self, profile):
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self.profile = profile
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(CPU_INTERVAL):
+            frames = sys._current_frames()
+            for ident in list(self.profile.threads):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, name, cpu=False):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.events = []
+        self.threads = set()
+        self._lock = threading.Lock()
+        self.sampler = CpuSampler(self) if cpu else None
+        self.duration = None
+
+    def add(self, event):
+        with self._lock:
+            self.threads.add(threading.get_ident())
+            self.events.append(event)
+
+    def enter_thread(self):
+        """Sample the calling thread from now on, before it makes any backend call."""
+        with self._lock:
+            self.threads.add(threading.get_ident())
+
+    def leave_thread(self):
+        with self._lock:
+            self.threads.discard(threading.get_ident())
+
+    def at(self):
+        return round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def summary(self):
+        by_backend = {}
+        repeats = collections.Counter()
+        for e in self.events:
+            b = by_backend.setdefault(e["backend"], {"calls": 0, "ms": 0.0, "rows": 0})
+            b["calls"] += 1
+            b["ms"] = round(b["ms"] + e["ms"], 3)
+            b["rows"] += e["rows"] or 0
+            repeats[(e["backend"], e["statement"])] += 1
+        suspects = [
+            {"backend": b, "statement": st, "count": n}
+            for (b, st), n in repeats.most_common() if n >= REPEAT_WARN
+        ]
+        return {"backends": by_backend, "repeated_statements": suspects}
+
+    def to_dict(self):
+        result = {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started,
+            "duration_ms": self.duration,
+            "summary": self.summary(),
+            "timeline": self.events,
+        }
+        if self.sampler:
+            result["cpu_samples"] = dict(self.sampler.stacks.most_common())
+        return result
+
+
+def record(backend, op, statement, params, rows, seconds, failed):
+    """Called for every backend call by the metrics module."""
+    ms = seconds * 1000
+    profile = _active.get()
+    if profile is None and ms < SLOW_QUERY_MS[backend]:
+        return
+    event = {
+        "at_ms": profile.at() - ms if profile else None,
+        "backend": backend,
+        "operation": op,
+        "statement": _normalize(statement),
+        "params": fingerprint(params),
+        "rows": rows,
+        "ms": round(ms, 3),
+        "failed": failed,
+    }
+    if profile is not None:
+        profile.add(event)
+    if ms >= SLOW_QUERY_MS[backend]:
+        slow_log.warning("slow %s call (%.1f ms, op=%s, rows=%s): %s [params %s]",
+                         backend, ms, op, rows, event["statement"], event["params"])
+
+
+def _store(profile):
+    from ..db.redis_db import redis_client
+
+    try:
+        _write(redis_client, profile)
+    except Exception as e:
+        # profiling must never fail the profiled request
+        slow_log.warning("could not store profile %s: %s", profile.id, e)
+
+
+def _write(redis_client, profile):
+    data = profile.to_dict()
+    if data["summary"]["repeated_statements"]:
+        slow_log.warning("profile %s (%s) repeats statements: %s",
+                         profile.id, profile.name, data["summary"]["repeated_statements"])
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(f"profile:{profile.id}", json.dumps(data, default=str), ex=PROFILE_TTL)
+    pipe.lpush("profile:recent", profile.id)
+    pipe.ltrim("profile:recent", 0, 99)
+    pipe.execute()
+
+
+@contextmanager
+def profiled(name, cpu=False):
+    """Profile every backend call made inside the block (also usable outside HTTP requests)."""
+    profile = Profile(name, cpu=cpu)
+    token = _active.set(profile)
+    if profile.sampler:
+        profile.sampler.start()
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+        if profile.sampler:
+            profile.sampler.stop()
+        profile.duration = profile.at()
+        _store(profile)
+
+
+def get_profile(profile_id):
+    from ..db.redis_db import redis_client
+
+    raw = redis_client.get(f"profile:{profile_id}")
+    return json.loads(raw) if raw else None
+
+
+def recent_profiles(limit=20):
+    from ..db.redis_db import redis_client
+
+    return redis_client.lrange("profile:recent", 0, limit - 1)
+
+
+def _sampled(endpoint):
+    # sync endpoints run on a pooled thread that is only known once the call starts
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = _active.get()
+        if profile is None or profile.sampler is None:
+            return endpoint(*args, **kwargs)
+        profile.enter_thread()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            # the pool thread goes on to serve other requests
+            profile.leave_thread()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route class whose sync endpoints are CPU-sampled from their first line, not their first query."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _sampled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+class ProfilingMiddleware:
+    """Enables profiling for a request via `X-Profile: 1` (`X-Profile: cpu` adds CPU sampling) or PROFILE_SAMPLE_RATE."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope.get("headers") or []).get(b"x-profile", b"").decode().lower()
+        if header in ("0", "false", "off"):
+            header = ""
+        if not header and not (SAMPLE_RATE and random.random() < SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(f"{scope['method']} {scope['path']}", cpu=header == "cpu")
+        token = _active.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        if profile.sampler:
+            # the event loop thread runs routing, async endpoints and response serialization
+            profile.enter_thread()
+            profile.sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.reset(token)
+            if profile.sampler:
+                await run_in_threadpool(profile.sampler.stop)
+            profile.duration = profile.at()
+            await run_in_threadpool(_store, profile)
@@ -0,0 +1,75 @@
+"""Read-your-writes guarantee for Postgres replica routing.
+
+Reads go to the primary for the rest of a request once it has written, and for
+READ_YOUR_WRITES_SECONDS afterwards for the same client: the middleware hands out a
+short-lived cookie carrying the time of the write, so the guarantee holds whichever
+worker serves the next request.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+
+WINDOW = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+COOKIE = "pg_rw"
+
+# one mutable dict per request, so writes made in threadpool copies of the context are seen here
+_state = contextvars.ContextVar("read_your_writes", default=None)
+
+
+def note_write():
+    state = _state.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def primary_required():
+    state = _state.get()
+    return state is not None and (state["wrote"] or state["until"] > time.time())
+
+
+@contextmanager
+def primary_reads():
+    """Send every read in this block to the primary (e.g. rebuilding a cache entry right after a write)."""
+    token = _state.set({"wrote": True, "until": 0})
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def _last_write(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(COOKIE)
+            if morsel is not None:
+                try:
+                    return float(morsel.value)
+                except ValueError:
+                    return 0.0
+    return 0.0
+
+
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or WINDOW <= 0:
+            await self.app(scope, receive, send)
+            return
+        state = {"wrote": False, "until": _last_write(scope) + WINDOW}
+        token = _state.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state["wrote"]:
+                cookie = f"{COOKIE}={time.time():.3f}; Max-Age={int(WINDOW) or 1}; Path=/; HttpOnly; SameSite=Lax"
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _state.reset(token)
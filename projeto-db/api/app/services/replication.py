@@ -0,0 +1,130 @@
+import contextvars
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..db import pg
+from ..db.mongo import get_mongo_conn
+from ..db.neo4j import stream_query
+from ..db.redis_db import redis_client
+
+MANIFEST_KEY = "replica:manifest"
+BATCH_SIZE = int(os.getenv("REPLICATION_BATCH_SIZE", "500"))
+
+
+# --- codec ---
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    # ObjectId, UUID, neo4j values...
+    try:
+        return dict(value)
+    except Exception:
+        return str(value)
+
+
+def encode(row):
+    """Canonical JSON: sorted keys and no whitespace, so equal rows give equal bytes (and hashes)."""
+    return json.dumps(row, default=_default, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(raw):
+    return json.loads(raw) if raw is not None else None
+
+
+# --- sources: name, key prefix, primary key and a row generator ---
+def _postgres_rows():
+    return pg.stream("SELECT * FROM public.produtos ORDER BY id;", itersize=BATCH_SIZE)
+
+
+def _mongo_rows():
+    return get_mongo_conn()["clientes"].find({}).sort("_id", 1).batch_size(BATCH_SIZE)
+
+
+def _neo4j_rows():
+    return (r["p"] for r in stream_query("MATCH (p:Produto) RETURN properties(p) AS p ORDER BY p.id"))
+
+
+SOURCES = {
+    "postgres": {"prefix": "postgres:produto", "pk": "id", "rows": _postgres_rows},
+    "mongo": {"prefix": "mongo:cliente", "pk": "_id", "rows": _mongo_rows},
+    "neo4j": {"prefix": "neo4j:produto", "pk": "id", "rows": _neo4j_rows},
+}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_source(name):
+    """Stream one source into Redis, rewriting only rows whose content hash changed."""
+    spec = SOURCES[name]
+    hashes_key = f"replica:hashes:{name}"
+    checksum = hashlib.sha256()
+    seen = set()
+    count = written = 0
+
+    for batch in _batches(spec["rows"](), BATCH_SIZE):
+        encoded = []
+        for row in batch:
+            pk = str(row.get(spec["pk"]))
+            payload = encode(row)
+            digest = hashlib.sha1(payload.encode()).hexdigest()
+            checksum.update(f"{pk}:{digest};".encode())
+            encoded.append((pk, payload, digest))
+            seen.add(pk)
+        count += len(encoded)
+
+        previous = redis_client.hmget(hashes_key, [pk for pk, _, _ in encoded])
+        changed = [e for e, old in zip(encoded, previous) if old != e[2]]
+        if changed:
+            pipe = redis_client.pipeline(transaction=False)
+            for pk, payload, digest in changed:
+                pipe.set(f"{spec['prefix']}:{pk}", payload)
+            pipe.hset(hashes_key, mapping={pk: digest for pk, _, digest in changed})
+            pipe.execute()
+            written += len(changed)
+
+    # rows that disappeared from the source since the last snapshot
+    stale = [pk for pk in redis_client.hkeys(hashes_key) if pk not in seen]
+    for batch in _batches(stale, BATCH_SIZE):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.delete(*[f"{spec['prefix']}:{pk}" for pk in batch])
+        pipe.hdel(hashes_key, *batch)
+        pipe.execute()
+
+    return {"count": count, "written": written, "deleted": len(stale), "checksum": checksum.hexdigest()}
+
+
+def run_snapshot():
+    """Export all sources concurrently and publish a manifest with per-source counts and checksums."""
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as pool:
+        # each export keeps the caller's context (LOW priority for /replicar, operation label)
+        futures = {name: pool.submit(contextvars.copy_context().run, export_source, name) for name in SOURCES}
+        results = {name: f.result() for name, f in futures.items()}
+
+    manifest = {
+        "started_at": started,
+        "finished_at": time.time(),
+        "sources": results,
+    }
+    redis_client.set(MANIFEST_KEY, encode(manifest))
+    return manifest
+
+
+def get_manifest():
+    return decode(redis_client.get(MANIFEST_KEY))
@@ -0,0 +1,102 @@
+"""Sharded Redis check against several local Redis processes.
+
+Writes --keys cache-like keys through ShardedRedis (pipelined), then reports how they spread over
+the nodes, MGET throughput and correctness, and what adding --add would move: the fraction of
+keys that change node (about 1/N) and that all of them move to the new node only.
+
+    python bench/bench_redis_sharding.py --spawn --nodes localhost:7001,localhost:7002,localhost:7003 --add localhost:7004
+
+--spawn starts (and stops) a throwaway redis-server per node, so only redis-server needs to be on
+PATH. Run from the api directory so `app` is importable.
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.redis_db import HashRing, InstrumentedRedis, ShardedRedis  # noqa: E402
+
+
+def parse_nodes(value):
+    nodes = []
+    for item in filter(None, value.split(",")):
+        host, _, port = item.strip().partition(":")
+        nodes.append((host, int(port or 6379)))
+    return nodes
+
+
+def spawn(nodes):
+    if not shutil.which("redis-server"):
+        sys.exit("redis-server not found on PATH")
+    procs = [
+        subprocess.Popen(["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+                         stdout=subprocess.DEVNULL)
+        for _, port in nodes
+    ]
+    time.sleep(0.5)
+    return procs
+
+
+def connect(nodes, vnodes):
+    clients = {f"{host}:{port}": InstrumentedRedis(host=host, port=port, decode_responses=True) for host, port in nodes}
+    return ShardedRedis(clients, vnodes=vnodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", default="localhost:7001,localhost:7002,localhost:7003")
+    parser.add_argument("--add", default="localhost:7004", help="node whose addition is simulated")
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--vnodes", type=int, default=160)
+    parser.add_argument("--spawn", action="store_true", help="start a redis-server per node")
+    args = parser.parse_args()
+
+    nodes = parse_nodes(args.nodes)
+    procs = spawn(nodes) if args.spawn else []
+    try:
+        client = connect(nodes, args.vnodes)
+        client.flushdb()
+        keys = [f"bench:cliente:{i}" for i in range(args.keys)]
+
+        start = time.perf_counter()
+        for i in range(0, len(keys), args.batch):
+            pipe = client.pipeline(transaction=False)
+            for key in keys[i:i + args.batch]:
+                pipe.set(key, key)
+            pipe.execute()
+        write_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        wrong = 0
+        for i in range(0, len(keys), args.batch):
+            chunk = keys[i:i + args.batch]
+            wrong += sum(1 for k, v in zip(chunk, client.mget(*chunk)) if v != k)
+        read_s = time.perf_counter() - start
+
+        print(f"wrote {len(keys)} keys in {write_s:.2f}s ({len(keys) / write_s:.0f}/s, pipelined)")
+        print(f"read  {len(keys)} keys in {read_s:.2f}s ({len(keys) / read_s:.0f}/s, MGET x{args.batch}); wrong values: {wrong}")
+        for name, node in client.clients.items():
+            count = node.dbsize()
+            print(f"  {name}: {count} keys ({100 * count / len(keys):.1f}%)")
+
+        if args.add:
+            before = client.ring
+            after = HashRing([*before.nodes, args.add], args.vnodes)
+            moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+            only_new = all(after.node_for(k) == args.add for k in moved)
+            print(f"adding {args.add}: {100 * len(moved) / len(keys):.1f}% of keys move "
+                  f"(ideal {100 / (len(nodes) + 1):.1f}%), all to the new node: {only_new}")
+        client.flushdb()
+        client.close()
+    finally:
+        for proc in procs:
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Contention benchmark: many concurrent buyers hammering one hot product.
+
+Creates a product with --stock units, fires --requests POST /compras from --buyers threads
+and reports throughput, latency percentiles and status counts. It also checks that the API
+never oversold: the 201 responses must equal the stock consumed, and never exceed it.
+
+    python bench/bench_stock_contention.py --url http://localhost:8000 --stock 500 --buyers 200 --requests 2000
+
+Only the standard library is used, so it runs from any machine that can reach the API.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def call(method, url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            raw = resp.read()
+            return resp.status, json.loads(raw) if raw else None
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--cliente", default="1", help="id_cliente used by every buyer")
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--buyers", type=int, default=200, help="concurrent threads")
+    parser.add_argument("--requests", type=int, default=2000, help="total purchase attempts")
+    args = parser.parse_args()
+
+    status, produto = call("POST", f"{args.url}/produtos",
+                           {"produto": "bench-hot-sku", "valor": 1, "quantidade": args.stock, "tipo": "bench"})
+    if status != 201:
+        raise SystemExit(f"could not create the benchmark product (HTTP {status})")
+    pid = produto["id"]
+
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def buy(_):
+        start = time.perf_counter()
+        code, _ = call("POST", f"{args.url}/compras", {"id_produto": pid, "id_cliente": args.cliente})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[code] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool:
+        list(pool.map(buy, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    _, after = call("GET", f"{args.url}/produtos/{pid}")
+    remaining = after["quantidade"] if after else None
+    sold = statuses[201]
+
+    print(f"produto {pid}: stock {args.stock}, {args.requests} attempts from {args.buyers} buyers")
+    print(f"wall {wall:.2f}s  throughput {args.requests / wall:.1f} req/s  ({sold / wall:.1f} sales/s)")
+    print(f"latency ms  p50 {percentile(latencies, 0.50) * 1000:.1f}  p95 {percentile(latencies, 0.95) * 1000:.1f}  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f}  mean {statistics.mean(latencies) * 1000:.1f}")
+    print("status", dict(sorted(statuses.items())))
+    print(f"remaining stock {remaining}")
+    consistent = remaining is not None and sold == args.stock - remaining and sold <= args.stock
+    print("stock consistent" if consistent else "STOCK MISMATCH: sales do not match the stock consumed")
+    # the product is kept: its compras reference it
+    raise SystemExit(0 if consistent else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Multi-worker serving: gunicorn supervises N uvicorn workers, each with its own DB clients.
+# Clients in app/db/ are created lazily per process, so nothing is shared across fork().
+import multiprocessing
+import os
+import shutil
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+
+def on_starting(server):
+    # prometheus_client multiprocess mode needs a clean directory shared by all workers
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # with preload_app the parent may have opened clients; drop them so the worker builds its own
+    for name in ("app.db.pg", "app.db.mongo", "app.db.neo4j", "app.db.redis_db"):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.reset_after_fork()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
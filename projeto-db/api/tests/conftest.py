@@ -0,0 +1,20 @@
+import os
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+# run from anywhere: `app` lives next to this directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db import redis_db  # noqa: E402
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """A fakeredis client in place of this process's Redis client."""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_db, "_client", client)
+    monkeypatch.setattr(redis_db, "_client_pid", os.getpid())
+    return client
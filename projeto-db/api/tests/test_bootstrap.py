@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+from app.services import bootstrap
+
+
+class DuplicateTable(psycopg2.Error):
+    pgcode = "42P07"
+
+
+class InsufficientPrivilege(psycopg2.Error):
+    pgcode = "42501"
+
+
+@pytest.fixture
+def ddl(monkeypatch):
+    executed, failures = [], {}
+
+    @contextmanager
+    def transaction():
+        def run(sql, params=None):
+            executed.append(sql)
+            if sql in failures:
+                raise failures[sql]("boom")
+            return []
+        yield run
+
+    monkeypatch.setattr(bootstrap.pg, "transaction", transaction)
+    monkeypatch.setattr(bootstrap, "PG_INDEXES", ["CREATE INDEX a", "CREATE EXTENSION b", "CREATE INDEX c"])
+    return executed, failures
+
+
+def test_ddl_runs_under_the_schema_lock(ddl):
+    executed, _ = ddl
+
+    assert bootstrap._postgres_ddl() == []
+    assert executed.index(bootstrap.SCHEMA_LOCK) < executed.index("CREATE INDEX a")
+
+
+def test_only_already_exists_errors_are_ignored(ddl):
+    executed, failures = ddl
+    failures.update({"CREATE INDEX a": DuplicateTable, "CREATE EXTENSION b": InsufficientPrivilege})
+
+    failed = bootstrap._postgres_ddl()
+
+    assert len(failed) == 1 and failed[0].startswith("CREATE EXTENSION b 42501")
+    # a failed statement is rolled back to its savepoint and the rest still run
+    assert executed.count("ROLLBACK TO SAVEPOINT ddl") == 2
+    assert "CREATE INDEX c" in executed
+
+
+def test_missing_trigram_indexes_are_reported(monkeypatch):
+    monkeypatch.setattr(bootstrap.pg, "query", lambda sql, params, primary: [{"indexname": "idx_clientes_nome_trgm"}])
+
+    [error] = bootstrap._missing_search_indexes()
+
+    assert "idx_clientes_cpf_trgm, idx_clientes_email_trgm" in error
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from app.services.bulkhead import HIGH, LOW, BackendOverloaded, Bulkhead, priority_for_path
+
+
+def _wait_until(check):
+    deadline = time.monotonic() + 5
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_reserved_permits_are_only_for_high_priority():
+    bulkhead = Bulkhead("test", limit=2, queue=0, timeout=0.01, reserved=1)
+
+    with bulkhead.acquire(LOW):
+        with pytest.raises(BackendOverloaded):
+            with bulkhead.acquire(LOW):
+                pass
+        with bulkhead.acquire(HIGH):
+            assert bulkhead.in_use == 2
+    assert bulkhead.in_use == 0
+
+
+def test_full_queue_and_wait_timeout_are_shed():
+    bulkhead = Bulkhead("test", limit=1, queue=1, timeout=0.05, retry_after=3)
+    timed_out = []
+
+    def wait_for_permit():
+        try:
+            with bulkhead.acquire():
+                pass
+        except BackendOverloaded:
+            timed_out.append(True)
+
+    with bulkhead.acquire():
+        waiter = threading.Thread(target=wait_for_permit)
+        waiter.start()
+        _wait_until(lambda: bulkhead.waiting == 1)
+        # the only queue slot is taken: fail fast instead of waiting
+        with pytest.raises(BackendOverloaded) as exc:
+            with bulkhead.acquire():
+                pass
+        waiter.join(1)
+
+    assert exc.value.retry_after == 3
+    assert timed_out == [True]
+    assert (bulkhead.in_use, bulkhead.waiting) == (0, 0)
+
+
+def test_queued_caller_gets_the_released_permit():
+    bulkhead = Bulkhead("test", limit=1, queue=1, timeout=5)
+    release, admitted = threading.Event(), []
+
+    def hold():
+        with bulkhead.acquire():
+            release.wait(5)
+
+    def queue_up():
+        with bulkhead.acquire():
+            admitted.append(bulkhead.in_use)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    _wait_until(lambda: bulkhead.in_use == 1)
+    waiter = threading.Thread(target=queue_up)
+    waiter.start()
+    _wait_until(lambda: bulkhead.waiting == 1)
+
+    release.set()
+    holder.join(1)
+    waiter.join(1)
+
+    assert admitted == [1]
+    assert (bulkhead.in_use, bulkhead.waiting) == (0, 0)
+
+
+def test_priority_for_path():
+    assert priority_for_path("/cache/refresh") == LOW
+    assert priority_for_path("/clientes/7/recomendacoes") == LOW
+    assert priority_for_path("/clientes/7") == HIGH
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from app.services import cache_generations as gens
+
+
+@pytest.fixture(autouse=True)
+def fresh_pointers(fake_redis, monkeypatch):
+    monkeypatch.setattr(gens, "_cached", {"at": 0.0, "active": None, "building": None})
+    monkeypatch.setattr(gens, "DROP_GRACE_SECONDS", 0)
+    return fake_redis
+
+
+def _wait_until(check):
+    deadline = time.monotonic() + 5
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+def test_build_commit_flips_the_pointer_and_drops_the_old_generation(fake_redis):
+    assert gens.active_generation() == 1
+    fake_redis.set(gens.cliente_key("7"), "old")
+
+    generation = gens.begin_build()
+    assert generation == 2
+    # single-client writes go to both generations while the rebuild runs
+    assert gens.write_generations() == [1, 2]
+    assert gens.begin_build() is None
+
+    fake_redis.set(gens.cliente_key("7", generation), "new")
+    gens.commit_build(generation)
+
+    assert gens.active_generation() == 2
+    assert gens.write_generations() == [2]
+    assert fake_redis.get(gens.cliente_key("7")) == "new"
+    assert _wait_until(lambda: not fake_redis.exists("cliente:g1:7"))
+
+
+def test_abort_keeps_the_active_generation(fake_redis):
+    generation = gens.begin_build()
+    fake_redis.set(gens.cliente_key("7", generation), "partial")
+    gens.abort_build(generation)
+
+    assert gens.write_generations() == [1]
+    assert _wait_until(lambda: not fake_redis.exists(gens.cliente_key("7", generation)))
+    # the next rebuild gets a fresh generation number
+    assert gens.begin_build() == generation + 1
+
+
+def test_sequence_stays_ahead_of_the_active_generation(fake_redis):
+    # e.g. the sequence key was lost while generation 5 is live
+    fake_redis.set(gens.ACTIVE_KEY, 5)
+
+    assert gens.begin_build() == 6
@@ -0,0 +1,72 @@
+import datetime
+import threading
+import time
+
+from app.services import cache_policy
+
+
+def test_shape_keeps_the_most_recent_compras(monkeypatch):
+    monkeypatch.setattr(cache_policy, "MAX_COMPRAS", 2)
+    compras = [
+        {"id": 1, "data": "2026-01-01"},
+        {"id": 3, "data": "2026-03-01"},
+        {"id": 2, "data": "2026-03-01"},
+        {"id": 4, "data": None},
+    ]
+
+    shaped = cache_policy.shape("7", {"cliente": {"id": 7}, "compras": compras})
+
+    assert [c["id"] for c in shaped["compras"]] == [3, 2]
+    assert shaped["compras_total"] == 4
+    assert shaped["compras_next"] == "/clientes/7/compras?offset=2&limit=2"
+
+
+def test_shape_leaves_small_clients_alone(monkeypatch):
+    monkeypatch.setattr(cache_policy, "MAX_COMPRAS", 2)
+    consolidado = {"cliente": {"id": 7}, "compras": [{"id": 1}, {"id": 2}]}
+
+    assert cache_policy.shape("7", consolidado) is consolidado
+    monkeypatch.setattr(cache_policy, "MAX_COMPRAS", 0)
+    assert cache_policy.shape("7", {"compras": [{"id": i} for i in range(10)]})["compras"][9] == {"id": 9}
+
+
+def test_needs_refresh_only_near_expiry(monkeypatch):
+    monkeypatch.setitem(cache_policy.TTLS, "cliente", 100)
+    monkeypatch.setitem(cache_policy.TTLS, "recomendacoes", 0)
+    monkeypatch.setattr(cache_policy, "REFRESH_AHEAD", 0.2)
+
+    assert cache_policy.needs_refresh("cliente", 19)
+    assert not cache_policy.needs_refresh("cliente", 20)
+    # -1: no expiry, -2: missing key, None: not read
+    assert not any(cache_policy.needs_refresh("cliente", t) for t in (-1, -2, None))
+    assert not cache_policy.needs_refresh("recomendacoes", 1)
+
+
+def test_compras_desde(monkeypatch):
+    today = datetime.date(2026, 3, 31)
+    monkeypatch.setattr(cache_policy, "COMPRAS_DIAS", 90)
+    assert cache_policy.compras_desde(today) == datetime.date(2025, 12, 31)
+    monkeypatch.setattr(cache_policy, "COMPRAS_DIAS", 0)
+    assert cache_policy.compras_desde(today) is None
+
+
+def test_schedule_refresh_runs_once_per_key(fake_redis):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def rebuild(cid):
+        calls.append(cid)
+        started.set()
+        release.wait(5)
+
+    assert cache_policy.schedule_refresh("cliente", "7", rebuild)
+    assert started.wait(5)
+    assert not cache_policy.schedule_refresh("cliente", "7", rebuild)
+
+    release.set()
+    # the lock is released once the rebuild has finished
+    deadline = time.monotonic() + 5
+    while fake_redis.exists("refresh:cliente:7") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not fake_redis.exists("refresh:cliente:7")
+    assert calls == ["7"]
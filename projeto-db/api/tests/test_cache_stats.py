@@ -0,0 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parents[1]
+
+
+def _run(code, multiproc_dir):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir), "PYTHONPATH": str(API_DIR)}
+    return subprocess.run([sys.executable, "-c", code], env=env, cwd=API_DIR, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def test_hit_rates_sum_every_worker(tmp_path):
+    # each process stands in for a gunicorn worker writing its own metrics file
+    _run("from app.services import metrics; metrics.cache_result('cliente', True)", tmp_path)
+    _run("from app.services import metrics; metrics.cache_result('cliente', True); "
+         "metrics.cache_result('cliente', False)", tmp_path)
+
+    out = _run("import json; from app.services import cache_stats; print(json.dumps(cache_stats.hit_rates()))", tmp_path)
+
+    assert json.loads(out) == {"hits": 2.0, "misses": 1.0, "rebuilds": 0, "hit_rate": 0.6667}
@@ -0,0 +1,90 @@
+from app.services import catalog_sync
+from app.services.catalog_sync import _diff
+
+
+def _pg(id, produto="p", valor="1.00", tipo=None):
+    return {"id": id, "produto": produto, "valor": valor, "tipo": tipo}
+
+
+def _node(id, origem="postgres", **fields):
+    return {**_pg(id, **fields), "origem": origem}
+
+
+def test_diff_merges_both_streams_by_id():
+    pg_rows = [_pg(1), _pg(2, valor="2.50"), _pg(4)]
+    neo_rows = [_node(1), _node(2, valor="2.00"), _node(3), _node(4, origem=None)]
+
+    assert [(action, row["id"]) for action, row in _diff(pg_rows, neo_rows)] == [
+        ("upsert", 2),  # price changed
+        ("delete", 3),  # gone from Postgres
+        ("upsert", 4),  # seed node adopted
+    ]
+
+
+def test_diff_handles_either_stream_running_out_first():
+    # streams are consumed once, in order, as the sync reads them page by page
+    pg_rows = iter([_pg(3), _pg(5)])
+    neo_rows = iter([_node(1), _node(2), _node(3), _node(8), _node(9)])
+
+    assert [(a, r["id"]) for a, r in _diff(pg_rows, neo_rows)] == [
+        ("delete", 1), ("delete", 2), ("upsert", 5), ("delete", 8), ("delete", 9),
+    ]
+    assert [a for a, _ in _diff([_pg(1), _pg(2)], [])] == ["upsert", "upsert"]
+    assert [a for a, _ in _diff([], [_node(1)])] == ["delete"]
+
+
+def test_diff_compares_valor_as_two_decimal_strings():
+    assert list(_diff([_pg(1, valor=3500)], [_node(1, valor="3500.00")])) == []
+
+
+def test_diff_reports_a_graph_native_node_holding_a_postgres_id():
+    assert [a for a, _ in _diff([_pg(7)], [_node(7, origem="neo4j")])] == ["conflict"]
+
+
+class FakeGraph:
+    """Produto nodes by id, answering the sync's Cypher statements."""
+
+    def __init__(self, nodes):
+        self.nodes = {n["id"]: dict(n) for n in nodes}
+
+    def stream(self, cypher, params=None):
+        ids = params.get("ids") if params else None
+        return [dict(n) for i, n in sorted(self.nodes.items()) if ids is None or i in ids]
+
+    def run(self, cypher, params=None):
+        if cypher == catalog_sync.RELOCATE_CYPHER:
+            node = self.nodes.pop(params["id"])
+            node["id"] = params["new_id"]
+            self.nodes[node["id"]] = node
+            return [{"moved": 1}]
+        if cypher == catalog_sync.UPSERT_CYPHER:
+            for r in params["rows"]:
+                node = self.nodes.setdefault(r["id"], {"id": r["id"], "origem": None})
+                if node["origem"] in (None, params["origem"]):
+                    node.update(r, origem=params["origem"])
+            return []
+        raise AssertionError(cypher)
+
+
+class FakeIds:
+    def __init__(self, start):
+        self.last = start
+
+    def next_id(self):
+        self.last += 1
+        return self.last
+
+
+def test_sync_moves_a_colliding_graph_native_product(monkeypatch):
+    graph = FakeGraph([_node(7, origem="neo4j", produto="feito no grafo")])
+    monkeypatch.setattr(catalog_sync.pg, "stream", lambda sql, params, itersize: iter([_pg(7, produto="do postgres", valor="9.90")]))
+    monkeypatch.setattr(catalog_sync, "stream_query", graph.stream)
+    monkeypatch.setattr(catalog_sync, "run_query", graph.run)
+    monkeypatch.setattr(catalog_sync, "produto_ids", FakeIds(1000))
+
+    stats = catalog_sync.sync(ids=[7])
+
+    assert stats["relocated"] == 1 and stats["upserted"] == 1
+    assert graph.nodes[7]["produto"] == "do postgres" and graph.nodes[7]["valor"] == "9.90"
+    assert graph.nodes[7]["origem"] == "postgres"
+    assert graph.nodes[1001]["produto"] == "feito no grafo" and graph.nodes[1001]["origem"] == "neo4j"
@@ -0,0 +1,48 @@
+import json
+
+from app.services import change_feed
+
+
+def _publish(client, n):
+    pipe = client.pipeline()
+    for i in range(n):
+        change_feed.publish(pipe, str(i), "upsert", version=f'"v{i}"', facets=["compras"])
+    pipe.execute()
+    return [entry_id for entry_id, _ in client.xrange(change_feed.STREAM_KEY)]
+
+
+def test_backlog_resumes_after_the_last_seen_entry(fake_redis):
+    ids = _publish(fake_redis, 5)
+
+    backlog = change_feed._backlog(ids[2])
+
+    assert [e[0] for e in backlog] == ids[3:]
+    assert backlog[0] == (ids[3], "cliente", {"id": "3", "op": "upsert", "version": '"v3"', "facets": ["compras"]})
+    assert change_feed._backlog(ids[-1]) == []
+
+
+def test_trimmed_backlog_becomes_one_reset_at_the_newest_entry(fake_redis):
+    ids = _publish(fake_redis, 5)
+    fake_redis.xtrim(change_feed.STREAM_KEY, maxlen=2, approximate=False)
+
+    assert change_feed._backlog(ids[1]) == [(ids[-1], "reset", {"reason": "gap"})]
+    # conservative: an id older than the oldest entry cannot prove nothing after it was trimmed
+    assert change_feed._backlog(ids[2])[0][1] == "reset"
+
+
+def test_foreign_event_ids_reset(fake_redis):
+    ids = _publish(fake_redis, 1)
+
+    assert change_feed._backlog("not-an-id") == [(ids[0], "reset", {"reason": "gap"})]
+
+
+def test_changed_facets_and_frames():
+    before = change_feed.facet_hashes({"cliente": {"id": 1}, "compras": []})
+    after = change_feed.facet_hashes({"cliente": {"id": 1}, "compras": [{"id": 9}]})
+
+    assert change_feed.changed_facets(before, after) == ["compras"]
+    assert change_feed.changed_facets(None, after) == list(change_feed.FACETS)
+
+    frame = change_feed.format_event(("1-0", "reset", {"reason": "refresh"}))
+    assert frame.startswith("id: 1-0\nevent: reset\ndata: ") and frame.endswith("\n\n")
+    assert json.loads(frame.split("data: ")[1]) == {"reason": "refresh"}
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+from app.services import bulkhead, circuit_breaker
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_opens_after_consecutive_failures_only(clock):
+    breaker = CircuitBreaker("test", threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    clock[0] += 2.5
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.before_call()
+
+    assert breaker.state == OPEN
+    assert exc.value.retry_after == 8
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    # a failed probe re-opens for another full timeout
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock[0] += 9
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    clock[0] += 1
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_lost_probe_is_replaced_after_the_timeout(clock):
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.before_call()
+
+    clock[0] += 10
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_guard_only_counts_transient_errors(monkeypatch):
+    breaker = CircuitBreaker("postgres", threshold=1, reset_timeout=10)
+    monkeypatch.setitem(circuit_breaker.BREAKERS, "postgres", breaker)
+
+    with pytest.raises(psycopg2.IntegrityError):
+        with bulkhead.guard("postgres"):
+            raise psycopg2.IntegrityError("duplicate key")
+    assert breaker.state == CLOSED
+
+    with pytest.raises(psycopg2.OperationalError):
+        with bulkhead.guard("postgres"):
+            raise psycopg2.OperationalError("server closed the connection")
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        with bulkhead.guard("postgres"):
+            pass
@@ -0,0 +1,34 @@
+import decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import api_routes
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    calls = []
+
+    def query(sql, params=None, **kwargs):
+        calls.append(params)
+        return [{"id": 1, "nome": "Ana_Maria", "score": decimal.Decimal("0.41666")}]
+
+    monkeypatch.setattr(api_routes.db_pg, "query", query)
+    return calls
+
+
+def test_search_escapes_like_wildcards_and_rounds_scores(queries):
+    response = TestClient(app).get("/clientes/search", params={"q": " 50%_a\\b ", "limit": 1000})
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "nome": "Ana_Maria", "score": 0.417}]
+    assert queries == [{"q": "50%_a\\b", "prefix": "50\\%\\_a\\\\b%", "limit": 100}]
+
+
+def test_blank_search_is_rejected(queries):
+    response = TestClient(app).get("/clientes/search", params={"q": "   "})
+
+    assert response.status_code == 400
+    assert queries == []
@@ -0,0 +1,83 @@
+import datetime
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import compras_partitions as parts
+
+D = datetime.date
+
+
+class FakeCatalog:
+    """Answers the catalog queries maintain() runs and records its DDL."""
+
+    def __init__(self, tables=(), stray_months=(), attached=()):
+        self.tables = set(tables)
+        self.stray_months = list(stray_months)
+        self.attached = list(attached)
+        self.ddl = []
+
+    def run(self, sql, params=None):
+        if sql.startswith("SELECT to_regclass"):
+            return [{"t": params[0] if params[0] in self.tables else None}]
+        if sql.startswith("SELECT DISTINCT date_trunc"):
+            return [{"m": m} for m in self.stray_months]
+        if sql.startswith("SELECT EXISTS"):
+            return [{"e": params[0] in self.stray_months}]
+        if sql == parts.PARTITIONS_SQL:
+            return [{"name": n, "linhas_estimadas": 0} for n in self.attached]
+        self.ddl.append(" ".join(sql.split()))
+        return []
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = FakeCatalog()
+
+    @contextmanager
+    def transaction():
+        yield catalog.run
+
+    monkeypatch.setattr(parts.pg, "transaction", transaction)
+    monkeypatch.setattr(parts, "AHEAD", 2)
+    monkeypatch.setattr(parts, "RETENTION_MONTHS", 0)
+    return catalog
+
+
+def test_month_arithmetic_and_bounds():
+    assert parts._add_months(D(2026, 11, 1), 2) == D(2027, 1, 1)
+    assert parts._add_months(D(2026, 1, 1), -1) == D(2025, 12, 1)
+    assert parts.partition_name(D(2026, 3, 1)) == "compras_p202603"
+    assert parts._bounds(D(2026, 12, 1)) == "FROM ('2026-12-01') TO ('2027-01-01')"
+    assert parts._monthly([{"name": "compras_p202602"}, {"name": "compras_default"}, {"name": "compras_p202511"}]) == [
+        (D(2025, 11, 1), "compras_p202511"), (D(2026, 2, 1), "compras_p202602"),
+    ]
+
+
+def test_maintain_creates_the_months_ahead_that_are_missing(catalog):
+    catalog.tables.add("compras_p202611")
+
+    result = parts.maintain(D(2026, 10, 19))
+
+    assert result == {"created": ["compras_p202610", "compras_p202612"], "detached": []}
+    assert catalog.ddl[0] == parts.LOCK_SQL
+    assert "ALTER TABLE compras ATTACH PARTITION compras_p202612 FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')" in catalog.ddl
+    assert not any("LOCK TABLE compras_default" in s for s in catalog.ddl)
+
+
+def test_maintain_moves_stray_rows_out_of_the_default_partition(catalog):
+    catalog.tables.update({"compras_p202610", "compras_p202611", "compras_p202612"})
+    catalog.stray_months.append(D(2025, 1, 1))
+
+    assert parts.maintain(D(2026, 10, 19))["created"] == ["compras_p202501"]
+    lock = catalog.ddl.index("LOCK TABLE compras_default IN ACCESS EXCLUSIVE MODE")
+    assert catalog.ddl[lock + 1].startswith("WITH moved AS ( DELETE FROM compras_default")
+    assert catalog.ddl[lock + 2].startswith("ALTER TABLE compras ATTACH PARTITION compras_p202501")
+
+
+def test_maintain_detaches_months_past_retention(catalog, monkeypatch):
+    monkeypatch.setattr(parts, "RETENTION_MONTHS", 6)
+    catalog.tables.update({"compras_p202610", "compras_p202611", "compras_p202612"})
+    catalog.attached += ["compras_p202603", "compras_p202604", "compras_p202610", "compras_default"]
+
+    assert parts.maintain(D(2026, 10, 19)) == {"created": [], "detached": ["compras_p202603"]}
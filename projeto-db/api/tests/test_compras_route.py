@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import api_routes
+from app.services import compras, read_your_writes
+
+
+@pytest.fixture
+def client():
+    # no lifespan: nothing connects to the stores
+    return TestClient(app)
+
+
+def test_group_commit_returns_the_compra_and_the_read_your_writes_cookie(client, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(compras, "GROUP_COMMIT", True)
+    monkeypatch.setattr(compras, "submit", lambda *args: submitted.append(args) or {"id": 42})
+
+    response = client.post("/compras", json={"id_produto": 1, "id_cliente": "7", "data": "2026-01-05"})
+
+    assert response.status_code == 201
+    assert response.json() == {"id": 42, "cliente": None}
+    assert submitted == [(1, "2026-01-05", 7)]
+    assert read_your_writes.COOKIE in response.cookies
+
+
+def test_direct_commit_returns_the_same_shape_with_the_client(client, monkeypatch):
+    monkeypatch.setattr(compras, "GROUP_COMMIT", False)
+    monkeypatch.setattr(compras, "reserve_and_insert", lambda *args: {"id": 43, "cid": "7", "valor": 10, "tipo": None,
+                                                                      "data": datetime.date(2026, 1, 5), "cidade": None})
+    monkeypatch.setattr(api_routes.etags, "bump", lambda *args: None)
+    monkeypatch.setattr(api_routes.analytics, "record_purchase", lambda *args: None)
+    monkeypatch.setattr(api_routes, "replicate_client_to_redis", lambda *args: None)
+    monkeypatch.setattr(api_routes, "build_consolidated_for_client", lambda cid: {
+        "cliente": {"id": 7, "nome": "Ana"}, "perfil": None, "amigos": [],
+        "compras": [{"id": 43, "id_produto": 1, "data": datetime.date(2026, 1, 5), "id_cliente": 7}],
+    })
+
+    response = client.post("/compras", json={"id_produto": 1, "id_cliente": "7"})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["id"] == 43 and body["cliente"]["compras"][0]["data"] == "2026-01-05"
+
+
+@pytest.mark.parametrize("error, status", [(compras.SemEstoque, 409), (compras.ProdutoNotFound, 404)])
+def test_stock_errors_map_to_http_statuses(client, monkeypatch, error, status):
+    def reserve(*args):
+        raise error(1)
+
+    monkeypatch.setattr(compras, "GROUP_COMMIT", False)
+    monkeypatch.setattr(compras, "reserve_and_insert", reserve)
+
+    assert client.post("/compras", json={"id_produto": 1, "id_cliente": "7"}).status_code == status
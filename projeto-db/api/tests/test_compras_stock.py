@@ -0,0 +1,62 @@
+import datetime
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import compras
+
+DIA = datetime.date(2026, 1, 5)
+
+
+def test_reserve_tells_missing_products_from_sold_out_ones(monkeypatch):
+    monkeypatch.setattr(compras.pg, "execute", lambda sql, params, returning: None)
+    monkeypatch.setattr(compras.pg, "query", lambda sql, params: [])
+    with pytest.raises(compras.ProdutoNotFound):
+        compras.reserve_and_insert(1, None, 7)
+
+    monkeypatch.setattr(compras.pg, "query", lambda sql, params: [{"?column?": 1}])
+    with pytest.raises(compras.SemEstoque):
+        compras.reserve_and_insert(1, None, 7)
+
+
+def test_reserve_returns_the_cache_key_of_the_client(monkeypatch):
+    row = {"id": 43, "data": DIA, "valor": 10, "tipo": "livro", "cidade": "SP", "external_id": "a-b"}
+    monkeypatch.setattr(compras.pg, "execute", lambda sql, params, returning: dict(row))
+
+    assert compras.reserve_and_insert(1, None, 7)["cid"] == "a-b"
+    row["external_id"] = None
+    assert compras.reserve_and_insert(1, None, 7)["cid"] == "7"
+
+
+def test_batch_hands_out_stock_in_arrival_order(monkeypatch):
+    statements = []
+
+    def run(sql, params):
+        statements.append((sql, params))
+        if sql == compras.LOCK_SQL:
+            return [
+                {"id": 1, "quantidade": 2, "valor": 10, "tipo": "livro"},
+                {"id": 2, "quantidade": None, "valor": 5, "tipo": "jogo"},
+            ]
+        if sql == compras.INSERT_SQL:
+            return [{"id": 101 + i, "data": DIA} for i in range(len(params[0]))]
+        if sql == compras.CLIENTES_SQL:
+            return [{"id": 7, "cidade": "SP", "external_id": None}]
+        return []
+
+    @contextmanager
+    def transaction():
+        yield run
+
+    monkeypatch.setattr(compras.pg, "transaction", transaction)
+    batch = [(1, DIA, 7, None), (3, DIA, 7, None), (1, DIA, 7, None), (2, DIA, 7, None), (1, DIA, 7, None)]
+
+    results = compras._commit_batch(batch)
+
+    assert [r["id"] if isinstance(r, dict) else type(r) for r in results] == [
+        101, compras.ProdutoNotFound, 102, 103, compras.SemEstoque,
+    ]
+    assert results[3]["valor"] == 5 and results[0]["cid"] == "7"
+    # products without quantidade are not stock-controlled: only product 1 is decremented, once for two units
+    assert (compras.DECREMENT_SQL, ([1], [2])) in statements
+    assert [sql for sql, _ in statements].count(compras.DECREMENT_SQL) == 1
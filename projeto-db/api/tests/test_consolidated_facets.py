@@ -0,0 +1,44 @@
+import json
+import time
+
+from app.db.pg import Cliente
+from app.models import ConsolidatedCliente
+from app.services import cache_refresher, change_feed, etags
+
+
+def _slow_perfil(cid):
+    time.sleep(0.5)
+    return {"idCliente": "1", "idade": 31}
+
+
+def test_facet_timeout_falls_back_to_warm_cache(monkeypatch):
+    row = Cliente(1, None, "111.111.111-11", "Ana", "Rua A", "SP", "SP", "ana@email.com")
+    # a record as _serialize stores it: every optional field present, facetas_degradadas null
+    cached = json.loads(ConsolidatedCliente(
+        cliente=row._asdict(), perfil={"idCliente": "1", "idade": 30}, amigos=[], compras=[],
+    ).model_dump_json())
+    assert cached["facetas_degradadas"] is None
+
+    monkeypatch.setattr(cache_refresher, "find_client_row", lambda cid: row)
+    monkeypatch.setattr(cache_refresher, "_cached_facets", lambda cid: cached)
+    monkeypatch.setattr(cache_refresher, "FACET_DEADLINE", 0.05)
+    monkeypatch.setitem(cache_refresher.FACETS, "perfil", (_slow_perfil, None))
+    monkeypatch.setitem(cache_refresher.FACETS, "amigos", (lambda cid: [], []))
+    monkeypatch.setitem(cache_refresher.FACETS, "compras", (lambda pid: [], []))
+
+    consolidado = cache_refresher.build_consolidated_for_client("1")
+
+    assert consolidado["perfil"] == {"idCliente": "1", "idade": 30, "interesses": None}
+    assert consolidado["facetas_degradadas"] == {"perfil": "cache"}
+
+
+def test_identical_rebuild_publishes_nothing(fake_redis):
+    row = Cliente(1, None, "111.111.111-11", "Ana", "Rua A", "SP", "SP", "ana@email.com")
+    consolidado = {"cliente": row._asdict(), "perfil": None, "amigos": [], "compras": []}
+
+    cache_refresher.replicate_client_to_redis("1", consolidado)
+    version = etags.version("clientes")[0]
+    cache_refresher.replicate_client_to_redis("1", dict(consolidado))
+
+    assert fake_redis.xlen(change_feed.STREAM_KEY) == 1
+    assert etags.version("clientes")[0] == version
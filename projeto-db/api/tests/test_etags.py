@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import api_routes
+from app.services import cache_generations, etags
+
+LAST_MODIFIED = "Mon, 05 Jan 2026 10:00:00 GMT"
+
+
+def _request(**headers):
+    return SimpleNamespace(headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+def test_if_none_match_compares_weakly_and_accepts_lists():
+    assert etags.not_modified(_request(if_none_match='"a", W/"b"'), '"b"')
+    assert etags.not_modified(_request(if_none_match='W/"b"'), 'W/"b"')
+    assert etags.not_modified(_request(if_none_match="*"), '"b"')
+    assert not etags.not_modified(_request(if_none_match='"a"'), '"b"')
+    assert not etags.not_modified(_request(if_none_match="*"), None)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = _request(if_none_match='"a"', if_modified_since=LAST_MODIFIED)
+
+    assert not etags.not_modified(request, '"b"', LAST_MODIFIED)
+
+
+def test_if_modified_since():
+    assert etags.not_modified(_request(if_modified_since=LAST_MODIFIED), '"b"', LAST_MODIFIED)
+    assert etags.not_modified(_request(if_modified_since="Tue, 06 Jan 2026 10:00:00 GMT"), '"b"', LAST_MODIFIED)
+    assert not etags.not_modified(_request(if_modified_since="Sun, 04 Jan 2026 10:00:00 GMT"), '"b"', LAST_MODIFIED)
+    assert not etags.not_modified(_request(if_modified_since="yesterday"), '"b"', LAST_MODIFIED)
+    assert not etags.not_modified(_request(), '"b"', LAST_MODIFIED)
+
+
+@pytest.fixture
+def client(fake_redis, monkeypatch):
+    monkeypatch.setattr(cache_generations, "_cached", {"at": 0.0, "active": None, "building": None})
+    return TestClient(app)
+
+
+def test_produtos_revalidate_until_a_write_bumps_the_version(client, monkeypatch):
+    reads = []
+    monkeypatch.setattr(api_routes.db_pg, "run_prepared", lambda name, *args: reads.append(name) or [])
+    etags.bump("produtos")
+
+    first = client.get("/produtos")
+    etag = first.headers["ETag"]
+    cached = client.get("/produtos", headers={"If-None-Match": etag})
+    etags.bump("produtos")
+    changed = client.get("/produtos", headers={"If-None-Match": etag})
+
+    assert (first.status_code, cached.status_code, changed.status_code) == (200, 304, 200)
+    assert cached.headers["ETag"] == etag and changed.headers["ETag"] != etag
+    assert reads == ["produtos", "produtos"]
+
+
+def test_conditional_cliente_read_skips_the_payload(client, fake_redis, monkeypatch):
+    key = cache_generations.cliente_key("7")
+    fake_redis.hset(key, mapping={"etag": '"v1"', "mtime": LAST_MODIFIED, "validated": "1", "data": '{"cliente": {}}'})
+    commands = []
+    execute_command = fake_redis.execute_command
+    monkeypatch.setattr(fake_redis, "execute_command", lambda *args, **kw: commands.append(args) or execute_command(*args, **kw))
+
+    cached = client.get("/redis/cliente/7", headers={"If-None-Match": 'W/"v1"'})
+    changed = client.get("/redis/cliente/7", headers={"If-None-Match": '"v0"'})
+
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == '"v1"' and cached.headers["Last-Modified"] == LAST_MODIFIED
+    assert changed.status_code == 200 and changed.json() == {"cliente": {}}
+    assert [c[0] for c in commands] == ["HGET"]
@@ -0,0 +1,65 @@
+from app.services import id_allocator
+from app.services.id_allocator import HiLoAllocator
+
+
+class FakeCounters:
+    """Stands in for the :IdCounter nodes behind run_query."""
+
+    def __init__(self):
+        self.hi = {}
+
+    def __call__(self, cypher, params=None):
+        name = params["name"]
+        if cypher == id_allocator._RESERVE:
+            if name not in self.hi:
+                return []
+            self.hi[name] = max(self.hi[name], params.get("floor", 0)) + params["n"]
+            return [{"hi": self.hi[name]}]
+        if cypher == id_allocator._CREATE:
+            self.hi.setdefault(name, params["seed"])
+        elif cypher == id_allocator._RAISE_TO:
+            self.hi[name] = max(self.hi.get(name, params["id"]), params["id"])
+        return []
+
+
+def _allocator(monkeypatch, **kwargs):
+    counters = FakeCounters()
+    monkeypatch.setattr(id_allocator, "run_query", counters)
+    return HiLoAllocator("produto", **kwargs), counters
+
+
+def test_blocks_do_not_overlap_between_workers(monkeypatch):
+    a, counters = _allocator(monkeypatch, block_size=10, seed=lambda: 5)
+    b = HiLoAllocator("produto", block_size=10)
+
+    ids = [a.next_id() for _ in range(3)] + [b.next_id() for _ in range(3)] + [a.next_id()]
+
+    assert ids == [6, 7, 8, 16, 17, 18, 9]
+    assert counters.hi["produto"] == 25
+
+
+def test_observe_drops_a_local_block_holding_the_id(monkeypatch):
+    a, counters = _allocator(monkeypatch, block_size=10)
+    assert a.next_id() == 1
+
+    a.observe(5)
+    a.observe(40)
+
+    assert counters.hi["produto"] == 40
+    assert a.next_id() == 41
+
+
+def test_observe_keeps_a_block_without_the_id(monkeypatch):
+    a, _ = _allocator(monkeypatch, block_size=10)
+    assert a.next_id() == 1
+
+    a.observe(500)
+
+    assert a.next_id() == 2
+
+
+def test_ids_start_above_the_floor(monkeypatch):
+    a, counters = _allocator(monkeypatch, block_size=10, seed=lambda: 3, floor=1000)
+
+    assert a.next_id() == 1001
+    assert counters.hi["produto"] == 1010
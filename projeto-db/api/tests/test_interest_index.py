@@ -0,0 +1,31 @@
+from app.services import interest_index
+from app.services.interest_index import InterestIndex
+
+
+def test_writes_during_a_rebuild_survive_the_swap(monkeypatch):
+    ix = InterestIndex()
+
+    def load_produtos(sql):
+        # a product write lands while the rebuild is reading its snapshot
+        ix.upsert_product(3, "Games")
+        ix.upsert_profile("7", ["jogos"])
+        return [{"id": 1, "tipo": "Eletrônico"}, {"id": 2, "tipo": "Vestuário"}]
+
+    monkeypatch.setattr(interest_index, "query", load_produtos)
+    monkeypatch.setattr(interest_index, "iter_profiles", lambda: iter([{"idCliente": 7, "interesses": ["moda"]}]))
+
+    ix.rebuild()
+
+    assert ix.tipo_of == {1: "eletronico", 2: "vestuario", 3: "games"}
+    assert ix.interests_of == {"7": {"jogos"}}
+    assert ix.score("7") == {1: 1, 3: 1}
+    assert ix._pending is None
+
+
+def test_remove_product_drops_it_from_its_tipo():
+    ix = InterestIndex()
+    ix.upsert_product(1, "Games")
+    ix.upsert_product(1, "Eletrônico")
+    ix.remove_product(1)
+
+    assert ix.tipo_of == {} and ix.by_tipo == {"games": set(), "eletronico": set()}
@@ -0,0 +1,72 @@
+from app.db import mongo
+
+
+class FakeProfiles:
+    """The slice of a collection search_profiles and ensure_indexes use."""
+
+    def __init__(self, docs=(), indexes=None):
+        self.docs = list(docs)
+        self.indexes = dict(indexes or {})
+        self.finds = []
+
+    def _matches(self, doc, flt):
+        for field, cond in flt.items():
+            value = doc.get(field)
+            if isinstance(cond, dict):
+                if "$gte" in cond and not (value is not None and value >= cond["$gte"]):
+                    return False
+                if "$gt" in cond and not (value is not None and value > cond["$gt"]):
+                    return False
+            elif not (cond in value if isinstance(value, list) else value == cond):
+                return False
+        return True
+
+    def find(self, flt, projection, sort, limit):
+        self.finds.append(flt)
+        (field, _), = sort
+        found = sorted((d for d in self.docs if self._matches(d, flt)), key=lambda d: d[field])
+        return [{k: d[k] for k, keep in projection.items() if keep and k in d} for d in found[:limit]]
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def drop_index(self, name):
+        del self.indexes[name]
+
+    def create_index(self, keys, name, unique=False):
+        self.indexes.setdefault(name, {"unique": unique})
+
+
+def test_search_pages_by_id_cliente_cursor(monkeypatch):
+    docs = [
+        {"_id": i, "idCliente": f"{i:02d}", "idade": 20 + i, "interesses": ["livros"] if i % 2 else ["games"]}
+        for i in range(1, 11)
+    ]
+    monkeypatch.setattr(mongo, "profiles", FakeProfiles(docs))
+
+    pages, cursor = [], None
+    while True:
+        items, cursor = mongo.search_profiles("livros", idade_min=23, after=cursor, limit=2)
+        pages.append([p["idCliente"] for p in items])
+        if cursor is None:
+            break
+
+    assert pages == [["03", "05"], ["07", "09"]]
+    assert "_id" not in items[0]
+    assert mongo.profiles.finds[-1] == {"interesses": "livros", "idade": {"$gte": 23}, "idCliente": {"$gt": "05"}}
+
+
+def test_search_without_filters_has_no_next_page_when_it_fits(monkeypatch):
+    monkeypatch.setattr(mongo, "profiles", FakeProfiles([{"idCliente": "1", "idade": 30}]))
+
+    assert mongo.search_profiles(limit=1) == ([{"idCliente": "1", "idade": 30}], None)
+    assert mongo.profiles.finds == [{}]
+
+
+def test_ensure_indexes_replaces_the_old_non_unique_index(monkeypatch):
+    monkeypatch.setattr(mongo, "profiles", FakeProfiles(indexes={"idCliente_1": {"unique": False}}))
+    monkeypatch.setattr(mongo, "clientes", FakeProfiles())
+
+    mongo.ensure_indexes()
+
+    assert mongo.profiles.indexes == {"idCliente_1": {"unique": True}, "interesses_1_idCliente_1": {"unique": False}}
@@ -0,0 +1,37 @@
+import time
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.services import profiling
+
+
+def busy_validation(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_cpu_profile_samples_sync_endpoints_before_any_backend_call(monkeypatch):
+    stored = []
+    monkeypatch.setattr(profiling, "_store", stored.append)
+    monkeypatch.setattr(profiling, "CPU_INTERVAL", 0.001)
+    router = APIRouter(route_class=profiling.ProfiledRoute)
+
+    @router.get("/work/{n}")
+    def work(n: int):
+        busy_validation(0.1)
+        return {"n": n}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+    response = TestClient(app).get("/work/3", headers={"X-Profile": "cpu"})
+
+    assert response.json() == {"n": 3}
+    [profile] = stored
+    assert profile.events == []
+    assert any("busy_validation" in stack for stack in profile.sampler.stacks)
+    # the pool thread is released for other requests once the endpoint returns
+    assert len(profile.threads) == 1
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import config
+from app.db import pg
+from app.services import read_your_writes
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(read_your_writes.ReadYourWritesMiddleware)
+
+    @app.post("/write")
+    def write():
+        # sync endpoints run in a threadpool copy of the request context
+        read_your_writes.note_write()
+        return {"primary": read_your_writes.primary_required()}
+
+    @app.get("/read")
+    def read():
+        return {"primary": read_your_writes.primary_required()}
+
+    return TestClient(app)
+
+
+def test_a_write_pins_the_client_to_the_primary_for_the_window(client, monkeypatch):
+    monkeypatch.setattr(read_your_writes, "WINDOW", 5)
+
+    assert client.get("/read").json() == {"primary": False}
+    response = client.post("/write")
+    assert response.json() == {"primary": True}
+    assert read_your_writes.COOKIE in response.cookies
+
+    assert client.get("/read").json() == {"primary": True}
+    client.cookies.set(read_your_writes.COOKIE, f"{time.time() - 6:.3f}")
+    assert client.get("/read").json() == {"primary": False}
+    client.cookies.set(read_your_writes.COOKIE, "garbage")
+    assert client.get("/read").json() == {"primary": False}
+
+
+def test_reads_do_not_set_the_cookie(client):
+    assert read_your_writes.COOKIE not in client.get("/read").cookies
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    replicas = {"r1": {"name": "r1", "weight": 1}, "r2": {"name": "r2", "weight": 1}}
+    state = {"r1": {"healthy": True, "lag": 0.5}, "r2": {"healthy": True, "lag": 0.5}}
+    monkeypatch.setattr(pg, "_replicas", replicas)
+    monkeypatch.setattr(pg, "_replica_state", state)
+    monkeypatch.setattr(pg, "_ensure_health_checks", lambda: None)
+    monkeypatch.setattr(config, "POSTGRES_REPLICA_MAX_LAG", 1.0)
+    return state
+
+
+def test_reads_skip_unhealthy_and_lagging_replicas(replicas):
+    replicas["r1"]["lag"] = 3.0
+    assert {pg._read_target() for _ in range(20)} == {"r2"}
+
+    replicas["r2"]["healthy"] = False
+    assert pg._read_target() == pg.PRIMARY
+
+
+def test_primary_reads_bypass_the_replicas(replicas):
+    assert pg._read_target(primary=True) == pg.PRIMARY
+    with read_your_writes.primary_reads():
+        assert pg._read_target() == pg.PRIMARY
+    assert pg._read_target() in ("r1", "r2")
@@ -0,0 +1,101 @@
+import fakeredis
+import pytest
+import redis
+
+from app.db.redis_db import HashRing, ShardedRedis, hash_tag
+
+NODES = ["node0", "node1", "node2"]
+KEYS = [f"cliente:{i}" for i in range(3000)]
+
+
+@pytest.fixture
+def sharded():
+    clients = {name: fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True) for name in NODES}
+    client = ShardedRedis(clients, vnodes=64)
+    yield client
+    client.close()
+
+
+def test_hash_tag_picks_the_braced_part():
+    assert hash_tag("{analytics:x}:tmp") == b"analytics:x"
+    assert hash_tag("analytics:x") == b"analytics:x"
+    # empty or unclosed braces hash the whole key, as in Redis Cluster
+    assert hash_tag("a{}b") == b"a{}b"
+    assert hash_tag("a{b") == b"a{b"
+
+
+def test_ring_spreads_keys_and_ignores_node_order():
+    ring = HashRing(NODES, vnodes=160)
+    counts = {n: 0 for n in NODES}
+    for key in KEYS:
+        counts[ring.node_for(key)] += 1
+
+    assert all(abs(c / len(KEYS) - 1 / 3) < 0.1 for c in counts.values())
+    assert all(HashRing(list(reversed(NODES)), 160).node_for(k) == ring.node_for(k) for k in KEYS)
+    assert ring.node_for("{analytics:x}:tmp") == ring.node_for("analytics:x")
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    before, after = HashRing(NODES, 160), HashRing([*NODES, "node3"], 160)
+    moved = [k for k in KEYS if before.node_for(k) != after.node_for(k)]
+
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+    assert {after.node_for(k) for k in moved} == {"node3"}
+
+
+def test_scan_cursor_walks_every_node_once(sharded):
+    for key in KEYS[:500]:
+        sharded.set(key, 1)
+    seen, cursor, calls = [], 0, 0
+    while True:
+        cursor, keys = sharded.scan(cursor, count=50)
+        seen += keys
+        calls += 1
+        if cursor == 0:
+            break
+
+    assert sorted(seen) == sorted(KEYS[:500])
+    assert calls > len(NODES)
+
+
+def test_multi_key_commands_are_split_and_merged_in_order(sharded):
+    keys = KEYS[:20]
+    for i, key in enumerate(keys):
+        sharded.set(key, i)
+
+    assert len({sharded.ring.node_for(k) for k in keys}) == len(NODES)
+    assert sharded.mget(keys + ["missing"]) == [str(i) for i in range(20)] + [None]
+    assert sharded.exists(*keys) == 20
+    assert sharded.delete(*keys[:5], "missing") == 5
+
+
+def test_rename_across_nodes_is_refused(sharded):
+    src = KEYS[0]
+    dst = next(k for k in KEYS if sharded.ring.node_for(k) != sharded.ring.node_for(src))
+    sharded.set(src, 1)
+
+    with pytest.raises(redis.exceptions.ResponseError):
+        sharded.rename(src, dst)
+    sharded.rename(src, f"{{{src}}}:copy")
+    assert sharded.get(f"{{{src}}}:copy") == "1"
+
+
+def test_transactional_pipeline_keeps_command_order(sharded):
+    pipe = sharded.pipeline(transaction=True)
+    for key in KEYS[:10]:
+        pipe.incr(key)
+    pipe.mget(KEYS[:10])
+
+    assert pipe.execute() == [1] * 10 + [["1"] * 10]
+
+
+def test_xadd_and_xread_route_to_the_stream_node(sharded):
+    stream = "clientes:changes"
+    owner = sharded.ring.node_for(stream)
+    entry_id = sharded.xadd(stream, {"id": "1", "op": "upsert"})
+
+    assert sharded.clients[owner].xlen(stream) == 1
+    # redis-py sends the STREAMS/BLOCK keywords as bytes
+    assert [n for n, _ in sharded.route(("XREAD", b"COUNT", 10, b"STREAMS", stream, "0-0"))[0]] == [owner]
+    assert sharded.xread({stream: "0-0"}, count=10) == [[stream, [(entry_id, {"id": "1", "op": "upsert"})]]]
+    assert sharded.xread({stream: "0-0"}, count=10, block=10)[0][1][0][0] == entry_id
@@ -5,9 +5,13 @@ CREATE TABLE clientes (
     endereco TEXT,
     cidade VARCHAR(50),
     uf CHAR(2),
-    email VARCHAR(100)
+    email VARCHAR(100),
+    -- id shared with Mongo/Neo4j for clients created from there (UUID); NULL for seeded ones
+    external_id VARCHAR(64)
 );
 
+CREATE INDEX IF NOT EXISTS idx_clientes_external_id ON clientes (external_id);
+
 CREATE TABLE produtos (
     id SERIAL PRIMARY KEY,
     produto VARCHAR(100),
@@ -16,12 +20,28 @@ CREATE TABLE produtos (
     tipo VARCHAR(50)
 );
 
+-- partitioned by month on data; the API creates upcoming months (compras_pYYYYMM) at startup
+-- and moves rows out of the default partition. No primary key, since it would have to include
+-- data, which may be NULL: (id, data) is unique instead (idx_compras_id_data).
 CREATE TABLE compras (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     id_produto INT REFERENCES produtos(id),
     data DATE,
     id_cliente INT REFERENCES clientes(id)
-);
+) PARTITION BY RANGE (data);
+
+CREATE TABLE compras_default PARTITION OF compras DEFAULT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_compras_id_data ON compras (id, data) NULLS NOT DISTINCT;
+CREATE INDEX IF NOT EXISTS idx_compras_id_cliente ON compras (id_cliente);
+CREATE INDEX IF NOT EXISTS idx_compras_id_produto ON compras (id_produto);
+CREATE INDEX IF NOT EXISTS idx_compras_cliente_data ON compras (id_cliente, data);
+CREATE INDEX IF NOT EXISTS idx_compras_data_brin ON compras USING brin (data);
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_clientes_nome_trgm ON clientes USING gin (nome gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_email_trgm ON clientes USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_cpf_trgm ON clientes USING gin (cpf gin_trgm_ops);
 
 INSERT INTO clientes (cpf, nome, endereco, cidade, uf, email) VALUES
 ('111.111.111-11','Ana','Rua A','SP','SP','ana@email.com'),